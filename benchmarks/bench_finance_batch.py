@@ -0,0 +1,96 @@
+"""
+Compares one finance cron tick in single and batch quote mode against
+fake quote and Firestore backends that sleep for every round trip.
+
+Usage: PYTHONPATH=src python benchmarks/bench_finance_batch.py [symbols] [latency_ms]
+"""
+import contextlib
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from bodega_finance import finance_cron
+from db import fs_db
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import StockItem
+from libdisc.finance_manager import FinanceManager
+
+
+class _SlowQuoteSource:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.round_trips = 0
+
+    def fetch(self, symbol: str) -> StockItem:
+        self.round_trips += 1
+        time.sleep(self.latency)
+        return StockItem(price=100, price_day_low=99, price_day_high=101, symbol=symbol)
+
+    def fetch_many(self, symbols: List[str]) -> Dict[str, StockItem]:
+        self.round_trips += 1
+        time.sleep(self.latency)
+        return {symbol: StockItem(price=100, price_day_low=99, price_day_high=101, symbol=symbol)
+                for symbol in symbols}
+
+
+class _SlowFirestore:
+    def __init__(self, symbols: List[str], latency: float) -> None:
+        self.symbols = symbols
+        self.latency = latency
+        self.round_trips = 0
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        time.sleep(self.latency)
+
+    def collection(self, name: str) -> '_SlowFirestore':
+        return self
+
+    def document(self) -> None:
+        return None
+
+    def add(self, data: Dict[str, Any]) -> None:
+        self._round_trip()
+
+    def stream(self) -> List[Any]:
+        self._round_trip()
+        return [type('Snapshot', (), {'to_dict': lambda self, s=s: {'symbol': s}})() for s in self.symbols]
+
+    def batch(self) -> '_SlowFirestore':
+        return self
+
+    def set(self, document: None, data: Dict[str, Any]) -> None:
+        pass
+
+    def commit(self) -> None:
+        self._round_trip()
+
+
+def _tick(symbols: List[str], latency: float, batch: bool) -> None:
+    store = _SlowFirestore(symbols, latency)
+    fs_db.get_fs_db = lambda: store
+    source = _SlowQuoteSource(latency)
+    finance_manager = FinanceManager(quote_source=source)
+    start = time.perf_counter()
+    # fetch_and_store prints every quote
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        written = finance_cron.fetch_and_store(finance_manager, DatabaseManager(), timestamp=0, batch=batch)
+    elapsed = time.perf_counter() - start
+    finance_manager.shutdown()
+    print(f'{"batch" if batch else "single":>6}: {elapsed * 1000:8.0f}ms '
+          f'entries={written} quote round trips={source.round_trips} '
+          f'store round trips={store.round_trips}')
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    symbols = [f'SYM{i}' for i in range(count)]
+    print(f'{count} symbols, {latency * 1000:.0f}ms per round trip')
+    for batch in (False, True):
+        _tick(symbols, latency, batch)
+
+
+if __name__ == '__main__':
+    main()
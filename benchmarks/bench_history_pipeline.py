@@ -0,0 +1,120 @@
+"""
+Compares crawling a channel's history by fetching and writing one page
+after the other with the prefetching history pipeline, against a fake
+history source that waits like the Discord API for every page, writing
+to a SQLite database.
+
+Usage: PYTHONPATH=src python benchmarks/bench_history_pipeline.py [messages]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+from db.db import DB
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.constants import MESSAGE_BATCH_SIZE
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import MessageItem
+from libdisc.discord_manager import DiscordManager
+from libdisc.finance_manager import FinanceManager
+from libdisc.media_manager import MediaManager
+from libdisc.plot_manager import PlotManager
+
+# channel.history fetches 100 messages per API request
+API_PAGE_SIZE = 100
+API_LATENCY = 0.01
+START_TIMESTAMP = 1600000000
+
+
+class _FakeAuthor:
+    def __init__(self, i: int) -> None:
+        self.id = i + 1
+        self.name = f'user{i}'
+        self.display_name = f'nick{i}'
+        self.discriminator = f'{i:04}'
+
+
+class _FakeMessage:
+    def __init__(self, author: _FakeAuthor, i: int) -> None:
+        self.id = i + 1
+        self.author = author
+        self.created_at = datetime.utcfromtimestamp(START_TIMESTAMP + i)
+        self.content = 'the quick brown fox jumps over the lazy dog'
+
+
+class _FakeChannel:
+    def __init__(self, channel_id: int, count: int) -> None:
+        self.id = channel_id
+        authors = [_FakeAuthor(i) for i in range(20)]
+        self.messages = [_FakeMessage(authors[i % len(authors)], i) for i in range(count)]
+
+    def __str__(self) -> str:
+        return f'channel-{self.id}'
+
+    async def history(self, limit=None, after=None, oldest_first=None):
+        for i, message in enumerate(self.messages):
+            if i % API_PAGE_SIZE == 0:
+                await asyncio.sleep(API_LATENCY)
+            yield message
+
+
+async def _fetch_only(channel: _FakeChannel) -> None:
+    async for _ in channel.history():
+        pass
+
+
+async def _sequential(discord_manager: DiscordManager, channel: _FakeChannel) -> None:
+    """
+    The crawl before the pipeline: every page is written before the next
+    one is fetched.
+    """
+    buffer: List[MessageItem] = []
+    newest_id = 0
+    async for msg in channel.history():
+        buffer.append(discord_manager.to_message_item(msg, channel.id))
+        newest_id = msg.id
+        if len(buffer) >= MESSAGE_BATCH_SIZE:
+            await discord_manager._flush_messages(channel, buffer, newest_id)
+            buffer = []
+    await discord_manager._flush_messages(channel, buffer, newest_id)
+
+
+async def _write_only(discord_manager: DiscordManager, channel: _FakeChannel) -> None:
+    items = [discord_manager.to_message_item(msg, channel.id) for msg in channel.messages]
+    for i in range(0, len(items), MESSAGE_BATCH_SIZE):
+        await discord_manager.async_db.add_new_messages(items[i:i + MESSAGE_BATCH_SIZE])
+
+
+def _time(coroutine) -> float:
+    start = time.perf_counter()
+    asyncio.run(coroutine)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as folder:
+        DB.get_instance().setup_db(f'sqlite:///{os.path.join(folder, "bench.db")}')
+        discord_manager = DiscordManager(db_manager=DatabaseManager(),
+                                         analytics_engine=AnalyticsEngine(),
+                                         media_manager=MediaManager(""),
+                                         plot_manager=PlotManager(),
+                                         finance_manager=FinanceManager())
+        # Every run writes to its own channel, so no message is deduplicated
+        fetch = _time(_fetch_only(_FakeChannel(1, count)))
+        write = _time(_write_only(discord_manager, _FakeChannel(2, count)))
+        sequential = _time(_sequential(discord_manager, _FakeChannel(3, count)))
+        pipelined = _time(discord_manager.store_latest_chat_messages(_FakeChannel(4, count)))
+        print(f'{count} messages, {API_LATENCY * 1000:.0f} ms per {API_PAGE_SIZE} message API page, '
+              f'{MESSAGE_BATCH_SIZE} messages per write')
+        print(f'fetch only {fetch:6.2f} s, write only {write:6.2f} s')
+        print(f'sequential {sequential:6.2f} s, pipelined  {pipelined:6.2f} s '
+              f'(max(fetch, write) {max(fetch, write):.2f} s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares memory use and lookup speed of MessageCache against the plain
+set of (user_id, channel_id, timestamp) tuples it replaces.
+
+Usage: PYTHONPATH=src python benchmarks/bench_message_cache.py [messages]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from libdisc.message_cache import MessageCache
+
+CHANNELS = 20
+USERS = 200
+LOOKUPS = 200000
+
+
+def _make_rows(count: int) -> List[Tuple[int, int, int]]:
+    start = 1500000000
+    return [(random.randrange(USERS), random.randrange(CHANNELS), start + i * 7) for i in range(count)]
+
+
+def _fresh(rows: List[Tuple[int, int, int]]) -> Iterator[Tuple[int, int, int]]:
+    # Database drivers hand out new int objects for every row
+    for user_id, channel_id, timestamp in rows:
+        yield int(str(user_id)), int(str(channel_id)), int(str(timestamp))
+
+
+def _measure(build: Callable[[], Any]) -> Tuple[Any, float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    cache = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cache, current / 2 ** 20, elapsed
+
+
+def _lookup(cache: Any, keys: List[Tuple[int, int, int]]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        _ = key in cache
+    return (time.perf_counter() - start) / len(keys) * 1e9
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rows = _make_rows(count)
+    hits = random.sample(rows, min(LOOKUPS, count))
+    misses = [(user_id + USERS, channel_id, timestamp) for user_id, channel_id, timestamp in hits]
+
+    by_channel: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+    for row in rows:
+        by_channel[row[1]].append(row)
+
+    def build_compact() -> MessageCache:
+        cache = MessageCache(max_channels=CHANNELS)
+        for channel_id, channel_rows in by_channel.items():
+            cache.load_channel(channel_id, ((user_id, timestamp) for user_id, _, timestamp in _fresh(channel_rows)))
+        return cache
+
+    for name, build in [('set of tuples', lambda: set(_fresh(rows))), ('MessageCache', build_compact)]:
+        cache, mib, elapsed = _measure(build)
+        print(f'{name:>14}: {count} keys, {mib:8.1f} MiB, load {elapsed:.2f}s, '
+              f'hit {_lookup(cache, hits):6.0f} ns, miss {_lookup(cache, misses):6.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
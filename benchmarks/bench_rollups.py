@@ -0,0 +1,66 @@
+"""
+Compares /stats and /trend query latency with and without the message
+rollup tables on a synthetic SQLite database.
+
+Usage: PYTHONPATH=src python benchmarks/bench_rollups.py [messages]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from db.db import DB
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.constants import SECONDS_IN_HOUR, SECONDS_IN_WEEK
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem
+
+CHANNEL_ID = 1
+USERS = [DiscordUser(f'user{i}', f'nick{i}', f'{i:04}') for i in range(20)]
+REPEAT = 5
+
+
+def _seed(count: int) -> int:
+    database_manager = DatabaseManager()
+    now = 1700000000
+    span = SECONDS_IN_WEEK * 104
+    batch = []
+    for i in range(count):
+        batch.append(MessageItem(discord_user=random.choice(USERS),
+                                 timestamp=now - span + i * span // count,
+                                 channel_id=CHANNEL_ID,
+                                 word_count=5,
+                                 char_count=random.randrange(1, 200)))
+        if len(batch) == 5000:
+            database_manager.add_new_messages(batch)
+            batch = []
+    database_manager.add_new_messages(batch)
+    return now
+
+
+def _time(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as folder:
+        DB.get_instance().setup_db(f'sqlite:///{os.path.join(folder, "bench.db")}')
+        now = _seed(count)
+        trend_from = (now // SECONDS_IN_WEEK - 30) * SECONDS_IN_WEEK
+        for use_rollups in (False, True):
+            engine = AnalyticsEngine(use_rollups=use_rollups)
+            stats_all = _time(lambda: engine.get_user_by_char_count(CHANNEL_ID))
+            stats_day = _time(lambda: engine.get_user_by_char_count(CHANNEL_ID, now - 24 * SECONDS_IN_HOUR + 17))
+            trend = _time(lambda: engine.get_stats_grouped_by_time(CHANNEL_ID, trend_from))
+            print(f'rollups={use_rollups!s:>5}: {count} messages, /stats {stats_all:7.1f} ms, '
+                  f'/stats 24h {stats_day:7.1f} ms, /trend {trend:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
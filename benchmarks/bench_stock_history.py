@@ -0,0 +1,44 @@
+"""
+Times /stocktrend history reads from the SQL stock store for growing
+day limits, with and without downsampling to the plot resolution.
+
+Usage: PYTHONPATH=src python benchmarks/bench_stock_history.py [days]
+"""
+import sys
+import time
+
+from db.db import DB
+from libdisc.constants import PLOT_MAX_POINTS, SECONDS_IN_DAY
+from libdisc.dataclasses.discord_objects import StockItem
+from libdisc.stock_store import SqlStockStore
+
+SYMBOLS = ['MSFT', 'AAPL', 'GOOG', 'AMZN']
+SAMPLES_PER_HOUR = 12
+REPEAT = 5
+
+
+def main() -> None:
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    DB.get_instance().setup_db('sqlite://')
+    store = SqlStockStore()
+    step = 3600 // SAMPLES_PER_HOUR
+    now = days * SECONDS_IN_DAY
+    for timestamp in range(0, now, step):
+        store.add_entries(timestamp, [StockItem(price=timestamp % 97, price_day_low=0, price_day_high=0, symbol=sym)
+                                      for sym in SYMBOLS])
+    print(f'{len(SYMBOLS)} symbols, {SAMPLES_PER_HOUR} samples per hour over {days} days')
+
+    for day_limit in (1, 5, days):
+        for max_points in (PLOT_MAX_POINTS, 10 ** 9):
+            start = time.perf_counter()
+            for _ in range(REPEAT):
+                history = store.get_stock_history(SYMBOLS, from_ts=now - day_limit * SECONDS_IN_DAY,
+                                                  to_ts=now, max_points=max_points)
+            elapsed = (time.perf_counter() - start) / REPEAT
+            points = sum(len(item.timestamps) for item in history.values())
+            label = 'downsampled' if max_points == PLOT_MAX_POINTS else 'raw'
+            print(f'{day_limit:3} days {label:>11}: {elapsed * 1000:7.1f}ms {points:7} points')
+
+
+if __name__ == '__main__':
+    main()
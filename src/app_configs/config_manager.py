@@ -6,6 +6,10 @@ import pathlib
 import argparse
 from typing import List
 
+from libdisc.constants import (BACKFILL_CONCURRENCY, HISTORY_QUEUE_DEPTH, MESSAGE_BATCH_SIZE, QUOTE_TTL, STOCK_BACKEND,
+                               USER_CACHE_SIZE)
+from libdisc.message_cache import MAX_CACHED_CHANNELS
+
 
 class ConfigManager:
 
@@ -73,6 +77,56 @@ class ConfigManager:
         """
         return self.config_dict['guild_ids'] or []
 
+    def get_quote_ttl(self) -> float:
+        """
+        @return: Seconds a stock quote is served from memory.
+        """
+        quote_ttl = self.config_dict.get('quote_ttl')
+        return float(QUOTE_TTL if quote_ttl is None else quote_ttl)
+
+    def get_batch_quotes(self) -> bool:
+        """
+        @return: Whether the finance cron downloads all quotes in one request.
+        """
+        return bool(self.config_dict.get('batch_quotes'))
+
+    def get_stock_backend(self) -> str:
+        """
+        @return: Where stock tracking, history and alerts are stored,
+        'firestore' or 'sql'.
+        """
+        return self.config_dict.get('stock_backend') or STOCK_BACKEND
+
+    def get_backfill_concurrency(self) -> int:
+        """
+        @return: Most channels backfilled at once.
+        """
+        return self.config_dict.get('backfill_concurrency') or BACKFILL_CONCURRENCY
+
+    def get_user_cache_size(self) -> int:
+        """
+        @return: Number of users kept in the user cache.
+        """
+        return self.config_dict.get('user_cache_size') or USER_CACHE_SIZE
+
+    def get_message_cache_channels(self) -> int:
+        """
+        @return: Number of channels kept in the message dedupe cache.
+        """
+        return self.config_dict.get('message_cache_channels') or MAX_CACHED_CHANNELS
+
+    def get_history_page_size(self) -> int:
+        """
+        @return: Number of history messages written per transaction.
+        """
+        return self.config_dict.get('history_page_size') or MESSAGE_BATCH_SIZE
+
+    def get_history_queue_depth(self) -> int:
+        """
+        @return: Most history pages fetched ahead of the database writes.
+        """
+        return self.config_dict.get('history_queue_depth') or HISTORY_QUEUE_DEPTH
+
     def inject_parsed_arguments(self, arguments: dict) -> None:
         """
         Populates private argument dictionary.
@@ -122,6 +176,45 @@ def user_input() -> None:
                         type=str,
                         default="",
                         help="Giphy API Key.")
+    parser.add_argument('--quote-ttl',
+                        '--quote_ttl',
+                        type=float,
+                        default=QUOTE_TTL,
+                        help="Seconds a stock quote is served from memory.")
+    parser.add_argument('--batch-quotes',
+                        '--batch_quotes',
+                        action='store_true',
+                        help="Download all tracked quotes in one request in the finance cron.")
+    parser.add_argument('--stock-backend',
+                        '--stock_backend',
+                        choices=['firestore', 'sql'],
+                        default=STOCK_BACKEND,
+                        help="Where stock tracking, history and alerts are stored.")
+    parser.add_argument('--backfill-concurrency',
+                        '--backfill_concurrency',
+                        type=int,
+                        default=BACKFILL_CONCURRENCY,
+                        help="Most channels backfilled at once by .backfill.")
+    parser.add_argument('--user-cache-size',
+                        '--user_cache_size',
+                        type=int,
+                        default=USER_CACHE_SIZE,
+                        help="Number of users kept in the user cache.")
+    parser.add_argument('--message-cache-channels',
+                        '--message_cache_channels',
+                        type=int,
+                        default=MAX_CACHED_CHANNELS,
+                        help="Number of channels kept in the message dedupe cache.")
+    parser.add_argument('--history-page-size',
+                        '--history_page_size',
+                        type=int,
+                        default=MESSAGE_BATCH_SIZE,
+                        help="Number of history messages written per transaction when crawling a channel.")
+    parser.add_argument('--history-queue-depth',
+                        '--history_queue_depth',
+                        type=int,
+                        default=HISTORY_QUEUE_DEPTH,
+                        help="Most history pages fetched ahead of the database writes.")
     args = parser.parse_args()
     ConfigManager.get_instance().inject_parsed_arguments(args.__dict__)
 
@@ -1,5 +1,5 @@
+import io
 import random
-import threading
 from datetime import datetime, timezone
 from typing import Callable, Any, List
 
@@ -10,12 +10,15 @@ from discord_slash.utils.manage_commands import create_option  # type: ignore
 
 from app_configs.config_manager import ConfigManager
 from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.alert_evaluator import AlertEvaluator, AlertNotification
+from libdisc.backfill_manager import BackfillManager
+from libdisc.command_executor import CommandExecutor
 from libdisc.database_manager import DatabaseManager
 from libdisc.discord_manager import DiscordManager
 from libdisc.finance_manager import FinanceManager
 from libdisc.media_manager import MediaManager
 from libdisc.plot_manager import PlotManager
-from libdisc.dataclasses.discord_objects import StockItem, AlertItem
+from libdisc.sync_scheduler import SyncScheduler
 
 
 def bodega_bot() -> None:
@@ -29,34 +32,61 @@ def bodega_bot() -> None:
     plot_manager = PlotManager()
     database_manager = DatabaseManager()
     media_manager = MediaManager(ConfigManager.get_instance().get_giphy_api_key())
-    finance_manager = FinanceManager()
+    finance_manager = FinanceManager(quote_ttl=ConfigManager.get_instance().get_quote_ttl())
     discord_manager = DiscordManager(
         db_manager=database_manager,
         analytics_engine=analytics_engine,
         media_manager=media_manager,
         plot_manager=plot_manager,
         finance_manager=finance_manager)
+    command_executor = CommandExecutor(loop=client.loop)
+
+    alert_evaluator = AlertEvaluator(stock_store=database_manager.stock_store, loop=client.loop)
+    alert_task = None
+
+    def _guild_channels() -> List[discord.TextChannel]:
+        channels: List[discord.TextChannel] = []
+        for guild_id in ConfigManager.get_instance().get_guild_ids():
+            guild = client.get_guild(int(guild_id))
+            if guild is None:
+                continue
+            channels.extend(channel for channel in guild.text_channels
+                            if channel.permissions_for(guild.me).read_message_history)
+        return channels
+
+    backfill_manager = BackfillManager(discord_manager=discord_manager)
+    sync_scheduler = SyncScheduler(discord_manager=discord_manager,
+                                   channels=_guild_channels,
+                                   write_buffer=discord_manager.write_buffer)
+
+    async def _start_stock_store() -> None:
+        print('Starting stock store . . . .')
+        # Both wait for the store's first snapshots, which would stall the
+        # gateway's heartbeats on the event loop
+        try:
+            await client.loop.run_in_executor(None, database_manager.start_fs)
+            await client.loop.run_in_executor(None, database_manager.init_history_watch, alert_evaluator.evaluate)
+        except Exception as e:
+            print(f'Failed to start the stock store: {e!r}')
 
     @client.event
     async def on_ready():
-        print('Loading caches . . . .')
-        database_manager.load_cache()
-        print('Starting Firestore . . . .')
-        database_manager.start_fs()
-        database_manager.init_history_watch(_alerting)
+        nonlocal alert_task
+        if alert_task is None:
+            alert_task = client.loop.create_task(alert_evaluator.run(_alerting))
+            client.loop.create_task(_start_stock_store())
+            client.loop.create_task(discord_manager.write_buffer.run())
+            client.loop.create_task(discord_manager.run_gif_writer())
+            client.loop.create_task(backfill_manager.resume(client.get_channel))
+        # Fires again whenever the gateway session could not be resumed
+        client.loop.create_task(sync_scheduler.catch_up())
         print('Ready set go!')
 
-    def _alerting(stock_item: StockItem, alert_item: AlertItem) -> bool:
-        msg = 'invalid alert'
-        if alert_item.low > stock_item.price:
-            msg = (f'Alert! Symbol: {alert_item.symbol}: {stock_item.price} '
-                   f'became lower than: {alert_item.low}, {alert_item.note}')
-        elif alert_item.high < stock_item.price:
-            msg = (f'Alert! Symbol: {alert_item.symbol}: {stock_item.price} '
-                   f'became higher than: {alert_item.high}, {alert_item.note}')
-        client.loop.create_task(
-            client.get_channel(alert_item.channel_id).send(msg))
-        return True
+    async def _alerting(notification: AlertNotification) -> None:
+        channel = client.get_channel(notification.alert_item.channel_id)
+        if channel is None:
+            raise ValueError(f'Unknown channel {notification.alert_item.channel_id}')
+        await channel.send(str(notification))
 
     @slash.slash(
         name="stats",
@@ -72,9 +102,7 @@ def bodega_bot() -> None:
         ]
     )
     async def _stats(ctx: SlashContext, hours_ago: int = 0):
-        await ctx.send("Backfilling stats...")
-        await discord_manager.store_latest_chat_messages(channel=ctx.channel)
-        await ctx.send(discord_manager.send_character_analytics(channel=ctx.channel, hours_ago=hours_ago))
+        await ctx.send(await discord_manager.send_character_analytics(channel=ctx.channel, hours_ago=hours_ago))
 
     @slash.slash(
         name="trend",
@@ -91,13 +119,12 @@ def bodega_bot() -> None:
     )
     async def _trend(ctx: SlashContext, week_limit: int = 30):
         utc_time = int(ctx.created_at.replace(tzinfo=timezone.utc).timestamp())
-        await ctx.send("Backfilling stats...")
-        await discord_manager.store_latest_chat_messages(channel=ctx.channel)
-        filename = discord_manager.handle_trend_command(
+        await ctx.defer()
+        image = await discord_manager.handle_trend_command(
             channel=ctx.channel,
             message_ts=utc_time,
             week_limit=week_limit)
-        await ctx.send(file=discord.File(filename))
+        await ctx.send(file=discord.File(io.BytesIO(image), filename='trend.png'))
 
     @slash.slash(
         name="stocktrend",
@@ -131,11 +158,11 @@ def bodega_bot() -> None:
             return
 
         await ctx.defer()
-        filename = discord_manager.handle_stock_trend_command(
+        image = await discord_manager.handle_stock_trend_command(
             symbols=symbols,
             day_limit=day_limit)
-        if filename:
-            await ctx.send(file=discord.File(filename))
+        if image:
+            await ctx.send(file=discord.File(io.BytesIO(image), filename='stocktrend.png'))
         else:
             await ctx.send('No valid tracking symbols found')
 
@@ -153,10 +180,10 @@ def bodega_bot() -> None:
         ]
     )
     async def _stock(ctx: SlashContext, symbol: str):
-        await ctx.send(f'scheduling {symbol} look up!')
-        _unblocking_call(ctx=ctx,
-                         handler=discord_manager.handle_stock_command,
-                         symbol=symbol)
+        await _unblocking_call(ctx=ctx,
+                               ack=f'scheduling {symbol} look up!',
+                               handler=discord_manager.handle_stock_command,
+                               symbol=symbol)
 
     @slash.slash(
         name="track",
@@ -172,10 +199,10 @@ def bodega_bot() -> None:
         ]
     )
     async def _track(ctx: SlashContext, symbol: str):
-        await ctx.send(f'Tracking {symbol}!')
-        _unblocking_call(ctx=ctx,
-                         handler=discord_manager.handle_track_command,
-                         symbol=symbol)
+        await _unblocking_call(ctx=ctx,
+                               ack=f'Tracking {symbol}!',
+                               handler=discord_manager.handle_track_command,
+                               symbol=symbol)
 
     @slash.slash(
         name="showtracked",
@@ -183,7 +210,7 @@ def bodega_bot() -> None:
         guild_ids=ConfigManager.get_instance().get_guild_ids(),
     )
     async def _show_tracked(ctx: SlashContext):
-        await ctx.send(discord_manager.handle_show_tracked_command())
+        await ctx.send(await discord_manager.handle_show_tracked_command())
 
     @slash.slash(
         name="addalert",
@@ -212,27 +239,31 @@ def bodega_bot() -> None:
             await ctx.send('Third parameter must be a number')
             return
 
-        await ctx.send(f'Adding alert for {symbol_low_high_note}!')
-        _unblocking_call(ctx=ctx,
-                         handler=discord_manager.handle_add_alert_command,
-                         author=ctx.author,
-                         channel=ctx.channel,
-                         symbol=params[0].strip(),
-                         low=int(params[1].strip()),
-                         high=int(params[2].strip()),
-                         note=params[3].strip())
-
-    def _unblocking_call(ctx: SlashContext,
-                         handler: Callable[..., str],
-                         **kwargs: Any):
-        def send():
-            client.loop.create_task(ctx.channel.send(handler(**kwargs)))
-
-        _thread = threading.Thread(name='non-blocking', target=send)
-        _thread.start()
+        await _unblocking_call(ctx=ctx,
+                               ack=f'Adding alert for {symbol_low_high_note}!',
+                               handler=discord_manager.handle_add_alert_command,
+                               author=ctx.author,
+                               channel=ctx.channel,
+                               symbol=params[0].strip(),
+                               low=int(params[1].strip()),
+                               high=int(params[2].strip()),
+                               note=params[3].strip())
+
+    async def _unblocking_call(ctx: SlashContext,
+                               ack: str,
+                               handler: Callable[..., str],
+                               **kwargs: Any) -> bool:
+        # Acknowledged before submitting, so a fast reply never precedes it
+        ack_message = await ctx.send(ack)
+        if not command_executor.submit(handler=handler, reply=ctx.channel.send, **kwargs):
+            await ack_message.edit(content='Busy, try again in a bit!')
+            return False
+        return True
 
     @client.event
     async def on_message(message):
+        if isinstance(message.channel, discord.TextChannel):
+            discord_manager.ingest_message(message)
         if message.author == client.user:
             return
         author = message.author
@@ -241,13 +272,26 @@ def bodega_bot() -> None:
         if str(message.content).startswith('.keyword'):
             latest_message = message.content.split(" ")
             keyword = " ".join(latest_message[1: len(latest_message)])
-            discord_manager.upsert_gif_keyword(author, keyword)
+            await discord_manager.upsert_gif_keyword(author, keyword)
             await message.channel.send(f"Upserted keyword: {keyword}")
 
         if str(message.content).startswith('.backfill'):
-            await message.channel.send("Forcing message backfill insertion this might take a while")
-            await discord_manager.store_latest_chat_messages(channel=message.channel, is_backfill=True)
-            await message.channel.send("Backfill complete!")
+            channels = _guild_channels() if message.content.split()[1:] == ['all'] else [message.channel]
+            await backfill_manager.backfill(channels=channels, status_channel=message.channel)
+
+        if str(message.content).startswith('.rebuildrollups'):
+            await message.channel.send("Rebuilding message rollups this might take a while")
+            await discord_manager.async_db.rebuild_rollups()
+            await message.channel.send("Rollups rebuilt!")
+
+        if str(message.content).startswith('.metrics'):
+            await message.channel.send(command_executor.metrics())
+            await message.channel.send(alert_evaluator.metrics())
+            await message.channel.send(sync_scheduler.metrics())
+            await message.channel.send(discord_manager.write_buffer.metrics())
+
+        if str(message.content).startswith('.cachestats'):
+            await message.channel.send(discord_manager.handle_cache_stats_command())
 
         if str(message.content).startswith('.gif'):
             latest_message = message.content.split(" ")
@@ -260,7 +304,7 @@ def bodega_bot() -> None:
             print(datetime.utcfromtimestamp(utc_time))
 
         if not str(message.content).startswith('.'):
-            gif_url = discord_manager.handle_gif_cooldown(author=author, message_ts=utc_time)
+            gif_url = await discord_manager.handle_gif_cooldown(author=author, message_ts=utc_time)
             if gif_url:
                 await message.channel.send(gif_url)
 
@@ -1,23 +1,34 @@
-
+import atexit
 import schedule  # type: ignore
 import time
 import app_configs.config_manager as app_conf
 import threading
 
+from typing import Optional
 from datetime import datetime, timezone
+from db.db import DB
 from libdisc.finance_manager import FinanceManager
 from libdisc.database_manager import DatabaseManager
 
 
-app_conf.user_input()
-finance_manager = FinanceManager()
-database_manager = DatabaseManager()
+finance_manager: Optional[FinanceManager] = None
+database_manager: Optional[DatabaseManager] = None
+batch_quotes = False
 REFRESH = 3600
 tick = 0
 # ------------- Main Program ------------- #
 
 
 def main():
+    global finance_manager, database_manager, batch_quotes
+    app_conf.user_input()
+    config = app_conf.ConfigManager.get_instance()
+    if config.get_stock_backend() == 'sql':
+        DB.get_instance().setup_db(config.get_db_url())
+    finance_manager = FinanceManager(quote_ttl=config.get_quote_ttl())
+    database_manager = DatabaseManager()
+    batch_quotes = config.get_batch_quotes()
+    atexit.register(finance_manager.shutdown)
     database_manager.start_fs()
     schedule.every(REFRESH).seconds.do(fetch)
     fetch()
@@ -26,23 +37,50 @@ def main():
         time.sleep(1)
 
 
+def fetch_and_store(finance_manager: FinanceManager,
+                    database_manager: DatabaseManager,
+                    timestamp: float,
+                    batch: bool = True) -> int:
+    """
+    Fetches a quote of every tracked symbol and stores it in the history.
+    @param finance_manager: where quotes come from
+    @param database_manager: where tracked symbols and history live
+    @param timestamp: timestamp of the history entries
+    @param batch: download all quotes and write all entries in one go
+    @return: number of history entries written
+    """
+    symbols = database_manager.get_all_tracking_symbols()
+    print(f'Symbols: {symbols}')
+    if batch:
+        stock_items, errors = finance_manager.get_stock_items_batch(symbols)
+    else:
+        stock_items, errors = finance_manager.get_stock_items(symbols)
+    for error in errors:
+        print(f'Failed to fetch {error}')
+
+    valid_items = []
+    for item in stock_items.values():
+        if not finance_manager.check_valid_stock(item):
+            print(f'Invalid stock symbol: {item.symbol}')
+            continue
+        print(item)
+        valid_items.append(item)
+
+    if batch:
+        return database_manager.add_stock_entries(timestamp=timestamp, items=valid_items)
+    for item in valid_items:
+        database_manager.add_stock_entry(timestamp=timestamp, item=item)
+    return len(valid_items)
+
+
 def fetch():
     global tick
     tick += 1
     print(f'thread count: {threading.active_count()}')
     try:
         print('-----FETCH START-----')
-        symbols = database_manager.get_all_tracking_symbols()
-        print(f'Symbols: {symbols}')
-        stock_items = finance_manager.get_stock_item_concurrent(symbols)
-
-        for item in stock_items.values():
-            if not finance_manager.check_valid_stock(item):
-                print(f'Invalid stock symbol: {item.symbol}')
-                continue
-            print(item)
-            timestamp_now = datetime.now(timezone.utc).timestamp()
-            database_manager.add_stock_entry(timestamp=timestamp_now, item=item)
+        timestamp_now = datetime.now(timezone.utc).timestamp()
+        fetch_and_store(finance_manager, database_manager, timestamp_now, batch=batch_quotes)
         print('-----FETCH END-----\n')
         print(f'tick: {tick}')
     except Exception as e:
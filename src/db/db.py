@@ -3,11 +3,13 @@ from __future__ import annotations
 from contextlib import contextmanager
 from typing import Optional, Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, Session, scoped_session
+from sqlalchemy.pool import StaticPool
 from libdisc.models.base_mixin import BaseModel
+from db.migrations import run_migrations
 
 
 class DB:
@@ -40,10 +42,19 @@ class DB:
         """
         Creates the database with all it's table if needed
         """
+        options = {}
+        if db_url in ('sqlite://', 'sqlite:///:memory:'):
+            # A single shared connection keeps the in-memory database
+            # visible from the database worker threads
+            options = {'poolclass': StaticPool,
+                       'connect_args': {'check_same_thread': False}}
         self.engine = create_engine(db_url,
                                     pool_recycle=299,
-                                    pool_pre_ping=True)
+                                    pool_pre_ping=True,
+                                    **options)
+        existing_tables = set(inspect(self.engine).get_table_names())
         BaseModel.metadata.create_all(self.engine)
+        run_migrations(self.engine, existing_tables)
         self.session_factory = sessionmaker(bind=self.engine)
 
     @contextmanager
@@ -0,0 +1,160 @@
+from typing import Set
+
+from sqlalchemy import Float, inspect, text
+from sqlalchemy.dialects.mysql import DOUBLE
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from libdisc.models.message import Message
+from libdisc.models.rollup import HourlyRollup, WeeklyRollup, rebuild_rollups
+from libdisc.models.stock import StockAlert, StockHistory, StockTracking
+from libdisc.models.user import User
+
+MESSAGE_UNIQUE_INDEX = 'uq_message_timestamp_user_channel'
+TRACKING_UNIQUE_INDEX = 'uq_stock_tracking_symbol'
+USER_DISCORD_ID_INDEX = 'uq_user_discord_id'
+
+
+def run_migrations(engine: Engine, existing_tables: Set[str]) -> None:
+    """
+    Brings tables created by older versions up to date with the
+    current models. Every step is idempotent.
+
+    @param engine: The database engine
+    @param existing_tables: Tables that existed before create_all ran
+    """
+    add_message_unique_key(engine)
+    add_missing_indexes(engine)
+    build_message_rollups(engine, existing_tables)
+    add_tracking_unique_key(engine)
+    add_user_discord_id(engine)
+    widen_stock_floats(engine, existing_tables)
+
+
+def add_message_unique_key(engine: Engine) -> None:
+    """
+    Removes duplicated messages, keeping the oldest row of each
+    (timestamp, user_id, channel_id) group, then adds the unique key.
+
+    @param engine: The database engine
+    """
+    indexes = inspect(engine).get_indexes(Message.__tablename__)
+    if any(index['name'] == MESSAGE_UNIQUE_INDEX for index in indexes):
+        return
+
+    print(f'Migrating: adding {MESSAGE_UNIQUE_INDEX}')
+    with engine.begin() as connection:
+        # The derived table lets MySQL delete from the table it selects from
+        result = connection.execute(text(
+            'DELETE FROM message WHERE id NOT IN ('
+            'SELECT id FROM (SELECT MIN(id) AS id FROM message '
+            'GROUP BY timestamp, user_id, channel_id) AS keep_ids)'))
+        print(f'Removed {result.rowcount} duplicated messages')
+
+    for index in Message.__table__.indexes:
+        if index.name == MESSAGE_UNIQUE_INDEX:
+            index.create(bind=engine)
+
+
+def add_missing_indexes(engine: Engine) -> None:
+    """
+    Creates the non unique message indexes missing from older tables.
+
+    @param engine: The database engine
+    """
+    existing = {index['name'] for index in inspect(engine).get_indexes(Message.__tablename__)}
+    for index in Message.__table__.indexes:
+        if not index.unique and index.name not in existing:
+            print(f'Migrating: adding {index.name}')
+            index.create(bind=engine)
+
+
+def add_tracking_unique_key(engine: Engine) -> None:
+    """
+    Removes duplicated tracked symbols, keeping the oldest row of each,
+    then replaces the plain symbol index with a unique key.
+
+    @param engine: The database engine
+    """
+    indexes = {index['name'] for index in inspect(engine).get_indexes(StockTracking.__tablename__)}
+    if TRACKING_UNIQUE_INDEX in indexes:
+        return
+
+    print(f'Migrating: adding {TRACKING_UNIQUE_INDEX}')
+    with engine.begin() as connection:
+        result = connection.execute(text(
+            'DELETE FROM stock_tracking WHERE id NOT IN ('
+            'SELECT id FROM (SELECT MIN(id) AS id FROM stock_tracking '
+            'GROUP BY symbol) AS keep_ids)'))
+        print(f'Removed {result.rowcount} duplicated tracked symbols')
+        if 'ix_stock_tracking_symbol' in indexes:
+            connection.execute(text('DROP INDEX ix_stock_tracking_symbol'
+                                    + (' ON stock_tracking' if engine.dialect.name == 'mysql' else '')))
+
+    for index in StockTracking.__table__.indexes:
+        if index.name == TRACKING_UNIQUE_INDEX:
+            index.create(bind=engine)
+
+
+def add_user_discord_id(engine: Engine) -> None:
+    """
+    Adds the Discord id column and its unique key to the user table.
+    Existing users get their id recorded the next time they are seen.
+
+    @param engine: The database engine
+    """
+    inspector = inspect(engine)
+    if 'discord_id' not in {column['name'] for column in inspector.get_columns(User.__tablename__)}:
+        print('Migrating: adding user.discord_id')
+        table = engine.dialect.identifier_preparer.quote(User.__tablename__)
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN discord_id BIGINT'))
+
+    if USER_DISCORD_ID_INDEX not in {index['name'] for index in inspector.get_indexes(User.__tablename__)}:
+        print(f'Migrating: adding {USER_DISCORD_ID_INDEX}')
+        for index in User.__table__.indexes:
+            if index.name == USER_DISCORD_ID_INDEX:
+                index.create(bind=engine)
+
+
+def widen_stock_floats(engine: Engine, existing_tables: Set[str]) -> None:
+    """
+    Turns the single precision FLOAT stock columns created by older
+    versions on MySQL into DOUBLE. SQLite always stores doubles.
+
+    @param engine: The database engine
+    @param existing_tables: Tables that existed before create_all ran
+    """
+    if engine.dialect.name != 'mysql':
+        return
+    for model in (StockHistory, StockAlert):
+        if model.__tablename__ not in existing_tables:
+            continue
+        existing = {column['name']: column['type'] for column in inspect(engine).get_columns(model.__tablename__)}
+        narrow = [column.name for column in model.__table__.columns
+                  if isinstance(column.type, Float) and not isinstance(existing.get(column.name), DOUBLE)]
+        if not narrow:
+            continue
+        print(f'Migrating: widening {model.__tablename__} {", ".join(narrow)} to DOUBLE')
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE {model.__tablename__} '
+                                    + ', '.join(f'MODIFY {name} DOUBLE NOT NULL' for name in narrow)))
+
+
+def build_message_rollups(engine: Engine, existing_tables: Set[str]) -> None:
+    """
+    Fills freshly created rollup tables from an existing message table.
+
+    @param engine: The database engine
+    @param existing_tables: Tables that existed before create_all ran
+    """
+    rollup_tables = {HourlyRollup.__tablename__, WeeklyRollup.__tablename__}
+    if Message.__tablename__ not in existing_tables or rollup_tables <= existing_tables:
+        return
+
+    print('Migrating: building message rollups')
+    db_session = Session(bind=engine)
+    try:
+        rebuild_rollups(db_session)
+    finally:
+        db_session.close()
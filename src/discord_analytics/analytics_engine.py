@@ -1,21 +1,62 @@
-import numpy as np  # type: ignore
-from typing import Dict
+from typing import Callable, Dict, List, Tuple, TypeVar
 from collections import defaultdict
 from sqlalchemy import func, asc
+from sqlalchemy.orm import Session
 
 from db.db import DB
+from libdisc.constants import SECONDS_IN_DAY, SECONDS_IN_HOUR, SECONDS_IN_WEEK, RESULT_CACHE_SIZE
+from libdisc.lru_cache import LRUCache
 from libdisc.models.message import Message
+from libdisc.models.rollup import HourlyRollup, WeeklyRollup
 from libdisc.models.user import User
 from libdisc.dataclasses.discord_objects import StatItem
 
+T = TypeVar('T')
+
 
 class AnalyticsEngine:
     """
     Supplies analytical data for our discord app
     """
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, use_rollups: bool = True, result_cache_size: int = RESULT_CACHE_SIZE) -> None:
+        """
+        @param use_rollups: Whether to read the pre-aggregated rollup tables
+        instead of scanning every raw message.
+        @param result_cache_size: Number of query results kept in memory.
+        """
+        self.use_rollups = use_rollups
+        self.result_cache: LRUCache = LRUCache(result_cache_size)
+
+    def get_channel_watermark(self, channel_id: int) -> int:
+        """
+        Returns the id of the last message ingested for a channel. Ids grow
+        with every insert, so backfilled older messages move it as well.
+        Messages are committed with their rollup refresh, so a new id is
+        never visible before the rollups counting it.
+
+        @param channel_id: The Discord channel id number.
+        @return: The highest message id of the channel or 0.
+        """
+        with DB.get_instance().make_session() as db_session:
+            return (db_session.query(func.max(Message.id))
+                    .filter(Message.channel_id == channel_id)
+                    .scalar()) or 0
+
+    def _cached(self, channel_id: int, kind: str, window: int, compute: Callable[[], T]) -> T:
+        """
+        Returns the cached result of a query unless new messages arrived
+        in the channel since it was computed.
+        """
+        key = (channel_id, kind, window)
+        # Read before computing, so a result is never tagged newer than
+        # the data it was computed from
+        watermark = self.get_channel_watermark(channel_id)
+        result = self.result_cache.get(key, tag=watermark)
+        if result is None:
+            result = compute()
+            self.result_cache.put(key, result, tag=watermark)
+        return result
 
     def get_user_by_char_count(self, channel_id: int, from_timestamp: int = 0) -> Dict[str, int]:
         """
@@ -26,14 +67,48 @@ class AnalyticsEngine:
         @param from_timestamp: count messages starting from from_timestamp, entire history will be counted.
         @return: Dictionary of {user_name: character_count}
         """
+        return self._cached(channel_id, 'char_count', from_timestamp,
+                            lambda: self._get_user_by_char_count(channel_id, from_timestamp))
+
+    def _get_user_by_char_count(self, channel_id: int, from_timestamp: int) -> Dict[str, int]:
         with DB.get_instance().make_session() as db_session:
-            return {user_name: character_count for user_name, character_count in
-                    (db_session.query(
-                        User.name, func.sum(Message.char_count))
-                     .join(Message, Message.user_id == User.id)
-                     .filter(Message.channel_id == channel_id)
-                     .filter(Message.timestamp >= from_timestamp)
-                     .group_by(User.name))}
+            if not self.use_rollups:
+                return {user_name: character_count for user_name, character_count in
+                        (db_session.query(
+                            User.name, func.sum(Message.char_count))
+                         .join(Message, Message.user_id == User.id)
+                         .filter(Message.channel_id == channel_id)
+                         .filter(Message.timestamp >= from_timestamp)
+                         .group_by(User.name))}
+
+            # Raw messages up to the first full hour, hourly buckets up to
+            # the first full week and weekly buckets from there on.
+            first_hour = -(-from_timestamp // SECONDS_IN_HOUR) * SECONDS_IN_HOUR
+            first_week = -(-first_hour // SECONDS_IN_WEEK) * SECONDS_IN_WEEK
+            out: Dict[str, int] = defaultdict(int)
+            queries = [self._rollup_totals(db_session, WeeklyRollup, channel_id, first_week)]
+            if first_hour < first_week:
+                queries.append(self._rollup_totals(db_session, HourlyRollup, channel_id, first_hour, first_week))
+            if from_timestamp < first_hour:
+                queries.append(db_session.query(User.name, func.sum(Message.char_count))
+                               .join(Message, Message.user_id == User.id)
+                               .filter(Message.channel_id == channel_id)
+                               .filter(Message.timestamp >= from_timestamp, Message.timestamp < first_hour)
+                               .group_by(User.name))
+            for query in queries:
+                for user_name, character_count in query:
+                    out[user_name] += int(character_count)
+            return dict(out)
+
+    @staticmethod
+    def _rollup_totals(db_session: Session, rollup, channel_id: int, from_bucket: int, to_bucket: int = None):
+        query = (db_session.query(User.name, func.sum(rollup.char_count))
+                 .join(rollup, rollup.user_id == User.id)
+                 .filter(rollup.channel_id == channel_id)
+                 .filter(rollup.bucket >= from_bucket))
+        if to_bucket is not None:
+            query = query.filter(rollup.bucket < to_bucket)
+        return query.group_by(User.name)
 
     def get_stats_grouped_by_time(self, channel_id: int, filter_ts=0) -> Dict[
             str, StatItem]:
@@ -44,7 +119,13 @@ class AnalyticsEngine:
         @param filter_ts: Timestamp to use for filtering.
         @return: Dictionary of {str: StatItem}
         """
-        out_dict: Dict[str, StatItem] = defaultdict(lambda: StatItem())
+        return self._cached(channel_id, 'weekly_stats', filter_ts,
+                            lambda: self._get_stats_grouped_by_time(channel_id, filter_ts))
+
+    def _get_stats_grouped_by_time(self, channel_id: int, filter_ts: int) -> Dict[str, StatItem]:
+        if self.use_rollups:
+            return self._get_weekly_stats_from_rollups(channel_id, filter_ts)
+
         sec_in_week = 60 * 60 * 24 * 7
         with DB.get_instance().make_session() as db_session:
             query = (
@@ -59,11 +140,39 @@ class AnalyticsEngine:
                 .filter(Message.timestamp > filter_ts)
                 .group_by(User.name, "day_time")
                 .order_by(asc("day_time")))
+            rows = [row for row in query if "bot" not in row[0]]
+
+        stats = StatItem.group_rows(rows)
+        for item in stats.values():
+            # Weeks since the epoch to days
+            item.timestamps *= 7
+        return stats
+
+    def _get_weekly_stats_from_rollups(self, channel_id: int, filter_ts: int) -> Dict[str, StatItem]:
+        """
+        Same as get_stats_grouped_by_time, reading full weeks from the
+        weekly rollup and only the partial week at filter_ts from raw messages.
+        """
+        rows: List[Tuple[str, int, int]] = []
+        edge_week = filter_ts - filter_ts % SECONDS_IN_WEEK
+        with DB.get_instance().make_session() as db_session:
+            edge = (db_session.query(User.name, func.sum(Message.char_count))
+                    .join(Message, Message.user_id == User.id)
+                    .filter(Message.channel_id == channel_id)
+                    .filter(Message.timestamp > filter_ts,
+                            Message.timestamp < edge_week + SECONDS_IN_WEEK)
+                    .group_by(User.name))
+            rows.extend((name, edge_week, character_count) for name, character_count in edge)
 
-        for name, timestamps, character_count in query:
-            if "bot" in name:
-                continue
-            out_dict[name].timestamps.append(np.multiply(timestamps, 7))
-            out_dict[name].values.append(character_count)
+            rollup = (db_session.query(User.name, WeeklyRollup.bucket, func.sum(WeeklyRollup.char_count))
+                      .join(WeeklyRollup, WeeklyRollup.user_id == User.id)
+                      .filter(WeeklyRollup.channel_id == channel_id)
+                      .filter(WeeklyRollup.bucket >= edge_week + SECONDS_IN_WEEK)
+                      .group_by(User.name, WeeklyRollup.bucket))
+            rows.extend(rollup)
 
-        return out_dict
+        stats = StatItem.group_rows(row for row in rows if "bot" not in row[0])
+        for item in stats.values():
+            # Trend plots expect days since the epoch
+            item.timestamps //= SECONDS_IN_DAY
+        return stats
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Set
+
+from libdisc.command_executor import LatencyStats
+from libdisc.constants import ALERT_QUEUE_DEPTH
+from libdisc.dataclasses.discord_objects import AlertItem, StockItem
+from libdisc.stock_store import StockStore
+
+
+@dataclass
+class AlertNotification:
+    """Class for an alert triggered by a quote"""
+    stock_item: StockItem
+    alert_item: AlertItem
+
+    def __str__(self):
+        alert_item, price = self.alert_item, self.stock_item.price
+        if alert_item.low > price:
+            return (f'Alert! Symbol: {alert_item.symbol}: {price} '
+                    f'became lower than: {alert_item.low}, {alert_item.note}')
+        return (f'Alert! Symbol: {alert_item.symbol}: {price} '
+                f'became higher than: {alert_item.high}, {alert_item.note}')
+
+
+class AlertEvaluator:
+    """
+    Checks every new quote against the active alerts and hands the
+    triggered alerts to the bot through a bounded queue on its event loop.
+
+    Quotes are evaluated on the caller's thread, e.g. the stock store's
+    history watch. An alert is deleted once its notification was sent.
+    If sending fails, or the queue is full, the alert stays active and
+    fires again on the next quote outside its range.
+    """
+
+    def __init__(self,
+                 stock_store: StockStore,
+                 loop: asyncio.AbstractEventLoop,
+                 max_queue: int = ALERT_QUEUE_DEPTH) -> None:
+        self.stock_store = stock_store
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # Alerts waiting in the queue, so repeated quotes don't resend them
+        self.pending: Set[str] = set()
+        self.lock = threading.Lock()
+        self.quotes = 0
+        self.triggered = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.evaluation = LatencyStats()
+
+    def evaluate(self, stock_item: StockItem) -> int:
+        """
+        @param stock_item: a freshly fetched quote
+        @return: number of alerts queued for notification
+        """
+        start = time.monotonic()
+        queued: List[AlertNotification] = []
+        matches = self.stock_store.find_matching_alerts(stock_item)
+        with self.lock:
+            self.quotes += 1
+            for alert_item in matches:
+                if alert_item.alert_id in self.pending:
+                    continue
+                self.pending.add(alert_item.alert_id)
+                queued.append(AlertNotification(stock_item, alert_item))
+            self.triggered += len(queued)
+        for notification in queued:
+            self.loop.call_soon_threadsafe(self._enqueue, notification)
+        self.evaluation.record(time.monotonic() - start)
+        return len(queued)
+
+    def _enqueue(self, notification: AlertNotification) -> None:
+        try:
+            self.queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            print(f'Alert queue full, dropping {notification.alert_item}')
+            with self.lock:
+                self.dropped += 1
+                self.pending.discard(notification.alert_item.alert_id)
+
+    async def run(self, send: Callable[[AlertNotification], Awaitable[None]]) -> None:
+        """
+        Sends queued notifications until cancelled. Notifications waiting
+        together are sent one by one and their alerts deleted in one batch.
+
+        @param send: Coroutine function delivering a notification.
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self._send_batch(batch, send)
+
+    async def _send_batch(self,
+                          batch: List[AlertNotification],
+                          send: Callable[[AlertNotification], Awaitable[None]]) -> None:
+        delivered: List[str] = []
+        for notification in batch:
+            try:
+                await send(notification)
+                delivered.append(notification.alert_item.alert_id)
+            except Exception as e:
+                print(f'Sending alert {notification.alert_item} failed: {e!r}')
+                with self.lock:
+                    self.failed += 1
+                    self.pending.discard(notification.alert_item.alert_id)
+        if not delivered:
+            return
+        with self.lock:
+            self.sent += len(delivered)
+        try:
+            await self.loop.run_in_executor(None, self.stock_store.delete_alerts, delivered)
+        except Exception as e:
+            # Still pending, so the alerts are not sent twice
+            print(f'Deleting alerts {delivered} failed: {e!r}')
+            return
+        with self.lock:
+            self.pending.difference_update(delivered)
+
+    def metrics(self) -> str:
+        """
+        @return: A Discord friendly summary of the evaluator's counters.
+        """
+        return ('```'
+                f'quotes evaluated: {self.quotes} alerts triggered: {self.triggered} '
+                f'sent: {self.sent} failed: {self.failed} dropped: {self.dropped} '
+                f'queued: {self.queue.qsize()}\n'
+                f'alert evaluation: {self.evaluation}'
+                '```')
@@ -0,0 +1,70 @@
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from sortedcontainers import SortedKeyList  # type: ignore
+
+from libdisc.dataclasses.discord_objects import AlertItem, StockItem
+
+
+class AlertIndex:
+    """
+    In-memory index of active stock alerts. Per symbol, alerts are kept
+    sorted by low and by high so the alerts a price triggers are found
+    with two bisections. All operations are thread safe.
+    """
+
+    def __init__(self, alerts: Iterable[AlertItem] = ()) -> None:
+        self.by_id: Dict[str, AlertItem] = {}
+        # symbol -> (alerts sorted by low, alerts sorted by high)
+        self.by_symbol: Dict[str, Tuple[SortedKeyList, SortedKeyList]] = {}
+        self.lock = threading.Lock()
+        for alert in alerts:
+            self.add(alert)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def __contains__(self, alert_id: str) -> bool:
+        return alert_id in self.by_id
+
+    def add(self, alert: AlertItem) -> None:
+        """
+        Adds an alert, replacing a previous version with the same alert_id.
+        """
+        with self.lock:
+            self._remove(alert.alert_id)
+            self.by_id[alert.alert_id] = alert
+            if alert.symbol not in self.by_symbol:
+                self.by_symbol[alert.symbol] = (SortedKeyList(key=lambda a: a.low),
+                                                SortedKeyList(key=lambda a: a.high))
+            by_low, by_high = self.by_symbol[alert.symbol]
+            by_low.add(alert)
+            by_high.add(alert)
+
+    def remove(self, alert_id: str) -> None:
+        with self.lock:
+            self._remove(alert_id)
+
+    def _remove(self, alert_id: str) -> None:
+        alert = self.by_id.pop(alert_id, None)
+        if alert is None:
+            return
+        by_low, by_high = self.by_symbol[alert.symbol]
+        by_low.remove(alert)
+        by_high.remove(alert)
+        if not by_low:
+            del self.by_symbol[alert.symbol]
+
+    def match(self, item: StockItem) -> List[AlertItem]:
+        """
+        @param item: latest quote of a symbol
+        @return: alerts whose low is above or whose high is below the price
+        """
+        with self.lock:
+            if item.symbol not in self.by_symbol:
+                return []
+            by_low, by_high = self.by_symbol[item.symbol]
+            out = list(by_low.irange_key(min_key=item.price, inclusive=(False, False)))
+            out.extend(alert for alert in by_high.irange_key(max_key=item.price, inclusive=(False, False))
+                       if alert.low <= item.price)
+            return out
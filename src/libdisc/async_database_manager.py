@@ -0,0 +1,127 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.constants import DB_READER_THREADS
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem, StatItem
+from libdisc.models.backfill_job import BackfillJob
+
+T = TypeVar('T')
+
+
+class AsyncDatabaseManager:
+    """
+    Awaitable mirror of DatabaseManager and AnalyticsEngine. Calls run on
+    bounded thread pools so coroutines never block the event loop on
+    database I/O.
+
+    Writes, and reads that fill the DatabaseManager caches, share a
+    single thread. That keeps the caches single threaded and avoids
+    writer lock contention. Analytics queries run on a pool of readers.
+    """
+
+    def __init__(self,
+                 db_manager: DatabaseManager,
+                 analytics_engine: AnalyticsEngine,
+                 reader_threads: int = DB_READER_THREADS) -> None:
+        self.db_manager = db_manager
+        self.analytics_engine = analytics_engine
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self.readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix='db-reader')
+
+    async def _run(self, executor: ThreadPoolExecutor, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    async def add_new_message(self,
+                              discord_user: DiscordUser,
+                              timestamp: int,
+                              message_channel_id: int,
+                              message_word_count: int,
+                              message_char_count: int) -> None:
+        await self._run(self.writer, self.db_manager.add_new_message,
+                        discord_user=discord_user,
+                        timestamp=timestamp,
+                        message_channel_id=message_channel_id,
+                        message_word_count=message_word_count,
+                        message_char_count=message_char_count)
+
+    async def add_new_messages(self, messages: List[MessageItem]) -> int:
+        return await self._run(self.writer, self.db_manager.add_new_messages, messages)
+
+    async def warm_channel_cache(self, message_channel_id: int) -> None:
+        await self._run(self.writer, self.db_manager.warm_channel_cache, message_channel_id)
+
+    async def reset_cache(self) -> None:
+        await self._run(self.writer, self.db_manager.reset_cache)
+
+    async def rebuild_rollups(self) -> None:
+        await self._run(self.writer, self.db_manager.rebuild_rollups)
+
+    async def get_sync_watermark(self, message_channel_id: int) -> Optional[Tuple[int, int]]:
+        return await self._run(self.readers, self.db_manager.get_sync_watermark, message_channel_id)
+
+    async def advance_sync_watermark(self, message_channel_id: int, message_id: int, timestamp: int) -> None:
+        await self._run(self.writer, self.db_manager.advance_sync_watermark,
+                        message_channel_id, message_id, timestamp)
+
+    async def start_backfill(self, message_channel_id: int, status_channel_id: int, started_at: int) -> BackfillJob:
+        return await self._run(self.writer, self.db_manager.start_backfill,
+                               message_channel_id, status_channel_id, started_at)
+
+    async def checkpoint_backfill(self, message_channel_id: int, cursor_id: int, cursor_timestamp: int,
+                                  messages: int) -> None:
+        await self._run(self.writer, self.db_manager.checkpoint_backfill,
+                        message_channel_id, cursor_id, cursor_timestamp, messages)
+
+    async def finish_backfill(self, message_channel_id: int, finished_at: int) -> None:
+        await self._run(self.writer, self.db_manager.finish_backfill, message_channel_id, finished_at)
+
+    async def get_unfinished_backfills(self) -> List[BackfillJob]:
+        return await self._run(self.readers, self.db_manager.get_unfinished_backfills)
+
+    async def get_last_message_timestamp(self, message_channel_id: int) -> int:
+        return await self._run(self.readers, self.db_manager.get_last_message_timestamp, message_channel_id)
+
+    async def load_gif_state(self) -> None:
+        await self._run(self.writer, self.db_manager.load_gif_state)
+
+    async def flush_gif_state(self) -> int:
+        return await self._run(self.writer, self.db_manager.flush_gif_state)
+
+    async def get_last_gif_preference(self, discord_user: DiscordUser) -> Tuple[str, int]:
+        return await self._run(self.writer, self.db_manager.get_last_gif_preference, discord_user)
+
+    async def upsert_new_gif_entry(self, discord_user: DiscordUser, keyword: str, timestamp: int = 0) -> None:
+        await self._run(self.writer, self.db_manager.upsert_new_gif_entry,
+                        discord_user=discord_user,
+                        keyword=keyword,
+                        timestamp=timestamp)
+
+    async def get_user_by_char_count(self, channel_id: int, from_timestamp: int = 0) -> Dict[str, int]:
+        return await self._run(self.readers, self.analytics_engine.get_user_by_char_count,
+                               channel_id, from_timestamp)
+
+    async def get_stats_grouped_by_time(self, channel_id: int, filter_ts: int = 0) -> Dict[str, StatItem]:
+        return await self._run(self.readers, self.analytics_engine.get_stats_grouped_by_time,
+                               channel_id, filter_ts)
+
+    async def get_all_tracking_symbols(self) -> List[str]:
+        return await self._run(self.readers, self.db_manager.get_all_tracking_symbols)
+
+    async def get_stock_history(self,
+                                symbols: List[str],
+                                from_ts: float,
+                                to_ts: float = None) -> Dict[str, StatItem]:
+        return await self._run(self.readers, self.db_manager.get_stock_history,
+                               symbols=symbols, from_ts=from_ts, to_ts=to_ts)
+
+    def shutdown(self) -> None:
+        """
+        Waits for pending database calls and stops the thread pools.
+        """
+        self.writer.shutdown(wait=True)
+        self.readers.shutdown(wait=True)
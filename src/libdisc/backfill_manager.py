@@ -0,0 +1,269 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import timezone
+from typing import Callable, Dict, List, Optional, Set
+
+import discord  # type: ignore
+from discord import TextChannel  # type: ignore
+from discord.abc import Messageable  # type: ignore
+
+from app_configs.config_manager import ConfigManager
+from libdisc.constants import BACKFILL_REPORT_SECONDS
+from libdisc.dataclasses.discord_objects import MessageItem
+from libdisc.discord_manager import DiscordManager
+from libdisc.history_pipeline import run_history_pipeline
+from libdisc.models.backfill_job import BackfillJob
+
+# Most channels listed in a status message, keeping it short of Discord's limit
+STATUS_MAX_CHANNELS = 15
+
+
+@dataclass
+class BackfillProgress:
+    """Class for tracking the progress of a channel backfill"""
+    channel_name: str
+    # Timestamps of the channel's creation and of the backfill request
+    created_at: int
+    started_at: int
+    cursor_timestamp: int
+    messages: int
+    # Progress made since this process picked the job up
+    resumed_fraction: float = 0.0
+    resumed_messages: int = 0
+    resumed_at: float = 0.0
+    finished: bool = False
+    failed: bool = False
+
+    def fraction(self) -> float:
+        """
+        @return: Share of the channel's lifetime backfilled, as the number
+        of messages still to come is unknown.
+        """
+        if self.finished:
+            return 1.0
+        span = self.started_at - self.created_at
+        if span <= 0 or not self.cursor_timestamp:
+            return 0.0
+        return min(max((self.cursor_timestamp - self.created_at) / span, 0.0), 1.0)
+
+    def rate(self) -> float:
+        """
+        @return: Messages backfilled per second since the job was picked up.
+        """
+        if not self.resumed_at:
+            return 0.0
+        elapsed = time.monotonic() - self.resumed_at
+        return (self.messages - self.resumed_messages) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        """
+        @return: Estimated seconds left, None until there is progress to
+        extrapolate from.
+        """
+        done = self.fraction() - self.resumed_fraction
+        if not self.resumed_at or done <= 0:
+            return None
+        return (time.monotonic() - self.resumed_at) * (1 - self.fraction()) / done
+
+    def __str__(self):
+        if self.failed:
+            state = 'failed, will resume'
+        elif self.finished:
+            state = 'done'
+        else:
+            eta = self.eta()
+            state = f'{self.fraction():.0%} ETA {_format_seconds(eta) if eta is not None else "?"}'
+        return f'#{self.channel_name}: {self.messages} messages, {self.rate():.0f} msg/s, {state}'
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m' if hours else f'{minutes}m{seconds:02d}s'
+
+
+class BackfillManager:
+    """
+    Re-crawls the full history of channels to fill messages the
+    incremental sync never saw.
+
+    Every backfill is a job checkpointed in the database after each
+    written page, so a backfill interrupted by a restart resumes from its
+    last checkpoint (see resume). Channels are backfilled concurrently, at
+    most max_concurrency at a time, while a status message is edited with
+    each channel's rate and ETA.
+    """
+
+    def __init__(self,
+                 discord_manager: DiscordManager,
+                 max_concurrency: Optional[int] = None,
+                 report_seconds: float = BACKFILL_REPORT_SECONDS,
+                 batch_size: Optional[int] = None,
+                 queue_depth: Optional[int] = None) -> None:
+        """
+        @param discord_manager: Converts and stores the messages.
+        @param max_concurrency: Most channels backfilled at once,
+        defaults to the configured backfill concurrency.
+        @param report_seconds: Seconds between two status message edits.
+        @param batch_size: Number of messages written per checkpoint,
+        defaults to the configured history page size.
+        @param queue_depth: Most pages fetched ahead of the writes,
+        defaults to the configured history queue depth.
+        """
+        config = ConfigManager.get_instance()
+        self.discord_manager = discord_manager
+        self.async_db = discord_manager.async_db
+        self.max_concurrency = max_concurrency or config.get_backfill_concurrency()
+        # Created by the first job, as before Python 3.10 a semaphore binds
+        # to the event loop current when it is created
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.report_seconds = report_seconds
+        self.batch_size = batch_size or config.get_history_page_size()
+        self.queue_depth = queue_depth or config.get_history_queue_depth()
+        self.running: Set[int] = set()
+
+    async def backfill(self, channels: List[TextChannel], status_channel: Messageable) -> int:
+        """
+        Backfills channels, resuming the ones with an interrupted job.
+        Channels already being backfilled are skipped.
+
+        @param channels: The channels to backfill.
+        @param status_channel: Where the progress is reported.
+        @return: The number of messages backfilled.
+        """
+        channels = [channel for channel in channels if channel.id not in self.running]
+        if not channels:
+            await status_channel.send('Backfill already running')
+            return 0
+        self.running.update(channel.id for channel in channels)
+        try:
+            started_at = int(time.time())
+            progress: Dict[int, BackfillProgress] = {}
+            jobs: List[BackfillJob] = []
+            for channel in channels:
+                job = await self.async_db.start_backfill(channel.id, status_channel.id, started_at)
+                jobs.append(job)
+                progress[channel.id] = BackfillProgress(
+                    channel_name=channel.name,
+                    created_at=int(channel.created_at.replace(tzinfo=timezone.utc).timestamp()),
+                    started_at=job.started_at,
+                    cursor_timestamp=job.cursor_timestamp,
+                    messages=job.messages)
+
+            status_message = await status_channel.send(self._status(progress))
+            reporter = asyncio.ensure_future(self._report(status_message, progress))
+            try:
+                await asyncio.gather(*(self._run_job(channel, job, progress[channel.id])
+                                       for channel, job in zip(channels, jobs)))
+            finally:
+                reporter.cancel()
+            await self._edit(status_message, self._status(progress))
+            return sum(item.messages for item in progress.values())
+        finally:
+            self.running.difference_update(channel.id for channel in channels)
+
+    async def resume(self, get_channel: Callable[[int], Optional[TextChannel]]) -> int:
+        """
+        Resumes the backfills interrupted by a restart, reporting to the
+        channels they were requested from.
+
+        @param get_channel: Looks a channel up by id.
+        @return: The number of jobs resumed.
+        """
+        by_status_channel: Dict[int, List[TextChannel]] = {}
+        for job in await self.async_db.get_unfinished_backfills():
+            channel = get_channel(job.channel_id)
+            if channel is None:
+                print(f'Backfill of unknown channel {job.channel_id} not resumed')
+                continue
+            by_status_channel.setdefault(job.status_channel_id, []).append(channel)
+
+        resumed = []
+        for status_channel_id, channels in by_status_channel.items():
+            status_channel = get_channel(status_channel_id) or channels[0]
+            print(f'Resuming backfill of {len(channels)} channels')
+            resumed.append(self.backfill(channels, status_channel))
+        await asyncio.gather(*resumed)
+        return sum(len(channels) for channels in by_status_channel.values())
+
+    async def _run_job(self, channel: TextChannel, job: BackfillJob, progress: BackfillProgress) -> None:
+        """
+        Backfills a channel. A failure only stops this channel's job, which
+        stays unfinished in the database and resumes from its checkpoint.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            try:
+                await self._backfill_channel(channel, job, progress)
+            except asyncio.CancelledError:
+                # An Exception before Python 3.8
+                raise
+            except Exception as e:
+                print(f'{channel}: backfill failed: {e!r}')
+                progress.failed = True
+
+    async def _backfill_channel(self, channel: TextChannel, job: BackfillJob, progress: BackfillProgress) -> None:
+        progress.resumed_at = time.monotonic()
+        progress.resumed_fraction = progress.fraction()
+        progress.resumed_messages = progress.messages
+        after = discord.Object(id=job.cursor_id) if job.cursor_id else None
+        # Most of a re-crawled history is stored already, the cache skips it
+        # without a write
+        await self.async_db.warm_channel_cache(channel.id)
+
+        async def write_page(page: List[discord.Message]) -> None:
+            buffer = [self.discord_manager.to_message_item(msg, channel.id) for msg in page]
+            await self._checkpoint(channel, buffer, page[-1].id, progress)
+
+        try:
+            await run_history_pipeline(channel.history(limit=None, after=after, oldest_first=True),
+                                       write_page,
+                                       page_size=self.batch_size,
+                                       queue_depth=self.queue_depth)
+        except discord.Forbidden:
+            print(f'{channel}: no permission to read history, backfill dropped')
+        await self.async_db.finish_backfill(channel.id, int(time.time()))
+        progress.finished = True
+        print(f'{channel}: backfilled {progress.messages} messages')
+
+    async def _checkpoint(self,
+                          channel: TextChannel,
+                          buffer: List[MessageItem],
+                          cursor_id: int,
+                          progress: BackfillProgress) -> None:
+        if not buffer:
+            return
+        await self.async_db.add_new_messages(buffer)
+        progress.messages += len(buffer)
+        progress.cursor_timestamp = buffer[-1].timestamp
+        await self.async_db.checkpoint_backfill(channel.id, cursor_id, progress.cursor_timestamp, progress.messages)
+
+    async def _report(self, status_message: discord.Message, progress: Dict[int, BackfillProgress]) -> None:
+        while True:
+            await asyncio.sleep(self.report_seconds)
+            await self._edit(status_message, self._status(progress))
+
+    @staticmethod
+    async def _edit(status_message: discord.Message, content: str) -> None:
+        try:
+            await status_message.edit(content=content)
+        except discord.HTTPException as e:
+            print(f'Failed to update backfill status: {e!r}')
+
+    @staticmethod
+    def _status(progress: Dict[int, BackfillProgress]) -> str:
+        """
+        @return: A Discord friendly summary of the backfill, listing the
+        channels still running first.
+        """
+        items = sorted(progress.values(), key=lambda item: item.finished)
+        done = sum(item.finished for item in items)
+        messages = sum(item.messages for item in items)
+        rate = sum(item.rate() for item in items if not item.finished and not item.failed)
+        lines = [f'Backfill: {done}/{len(items)} channels done, {messages} messages, {rate:.0f} msg/s']
+        lines += [str(item) for item in items[:STATUS_MAX_CHANNELS]]
+        if len(items) > STATUS_MAX_CHANNELS:
+            lines.append(f'... and {len(items) - STATUS_MAX_CHANNELS} more')
+        return '```' + '\n'.join(lines) + '```'
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine
+
+from libdisc.constants import COMMAND_WORKER_THREADS, COMMAND_QUEUE_DEPTH
+
+
+class LatencyStats:
+    """
+    Thread safe count, mean and max of a latency in seconds.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def __str__(self) -> str:
+        mean = self.total / self.count if self.count else 0.0
+        return f'n={self.count} avg={mean * 1000:.0f}ms max={self.max * 1000:.0f}ms'
+
+
+class CommandExecutor:
+    """
+    Runs blocking command handlers on a shared, bounded thread pool and
+    posts their replies back onto the event loop.
+
+    At most max_workers handlers run at once and at most max_queue wait
+    for a worker. Submissions beyond that are rejected so the caller can
+    ask the user to try again later.
+    """
+
+    def __init__(self,
+                 loop: asyncio.AbstractEventLoop,
+                 max_workers: int = COMMAND_WORKER_THREADS,
+                 max_queue: int = COMMAND_QUEUE_DEPTH) -> None:
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='command')
+        self.capacity = max_workers + max_queue
+        self.pending = 0
+        self.rejected = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.queue_wait = LatencyStats()
+        self.handler_latency = LatencyStats()
+
+    def submit(self,
+               handler: Callable[..., str],
+               reply: Callable[[str], Coroutine[Any, Any, Any]],
+               **kwargs: Any) -> bool:
+        """
+        Schedules handler(**kwargs) and sends its result through reply.
+
+        @param handler: Blocking function returning the reply message.
+        @param reply: Coroutine function sending a message, run on the loop.
+        @return: False if the executor is busy and the command was dropped.
+        """
+        with self.lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                return False
+            self.pending += 1
+
+        submitted = time.monotonic()
+
+        def run() -> None:
+            started = time.monotonic()
+            self.queue_wait.record(started - submitted)
+            try:
+                result = handler(**kwargs)
+            except Exception as e:
+                print(f'Command {getattr(handler, "__name__", handler)} failed: {e!r}')
+                with self.lock:
+                    self.failed += 1
+                result = 'Something went wrong, try again later.'
+            finally:
+                self.handler_latency.record(time.monotonic() - started)
+                with self.lock:
+                    self.pending -= 1
+            asyncio.run_coroutine_threadsafe(reply(result), self.loop)
+
+        self.executor.submit(run)
+        return True
+
+    def metrics(self) -> str:
+        """
+        @return: A Discord friendly summary of the executor's counters.
+        """
+        return ('```'
+                f'commands pending: {self.pending}/{self.capacity} '
+                f'rejected: {self.rejected} failed: {self.failed}\n'
+                f'queue wait: {self.queue_wait}\n'
+                f'handler latency: {self.handler_latency}'
+                '```')
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
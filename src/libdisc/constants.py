@@ -1 +1,34 @@
 SECONDS_IN_HOUR = 3600
+SECONDS_IN_DAY = SECONDS_IN_HOUR * 24
+SECONDS_IN_WEEK = SECONDS_IN_DAY * 7
+MESSAGE_BATCH_SIZE = 500
+RESULT_CACHE_SIZE = 128
+DB_READER_THREADS = 4
+COMMAND_WORKER_THREADS = 4
+COMMAND_QUEUE_DEPTH = 16
+QUOTE_TTL = 60
+INVALID_QUOTE_TTL = 3600
+QUOTE_WORKER_THREADS = 20
+QUOTE_TIMEOUT = 30
+QUOTE_CACHE_SIZE = 1024
+FIRESTORE_BATCH_LIMIT = 500
+STOCK_BACKEND = 'firestore'
+HISTORY_POLL_SECONDS = 5
+WATCH_LOAD_TIMEOUT = 60
+HISTORY_REANCHOR_SECONDS = 60 * 60
+PLOT_MAX_POINTS = 300
+ALERT_QUEUE_DEPTH = 256
+PLOT_WORKER_PROCESSES = 2
+PLOT_CACHE_SIZE = 32
+SYNC_CONCURRENCY = 4
+SYNC_MAX_RETRIES = 5
+SYNC_BACKOFF_SECONDS = 2
+LIVE_FLUSH_SECONDS = 10
+LIVE_MAX_RETRIES = 3
+LIVE_BUFFER_LIMIT = 10000
+BACKFILL_CONCURRENCY = 2
+BACKFILL_REPORT_SECONDS = 10
+USER_CACHE_SIZE = 10000
+NICKNAME_REFRESH_SECONDS = 60 * 60
+GIF_FLUSH_SECONDS = 30
+HISTORY_QUEUE_DEPTH = 4
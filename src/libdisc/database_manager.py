@@ -1,15 +1,24 @@
-from typing import Dict, Set, Tuple, List, Callable, Any
+from typing import Dict, Tuple, List, Callable, Iterable, Optional
 
 from sqlalchemy import desc
+from sqlalchemy.exc import SQLAlchemyError
 
 from db.db import DB
-from db import fs_db
-from firebase_admin import firestore  # type: ignore
+from app_configs.config_manager import ConfigManager
+from libdisc.constants import PLOT_MAX_POINTS
 from libdisc.dataclasses.discord_objects import (DiscordUser, StockItem,
-                                                 AlertItem, StatItem)
+                                                 AlertItem, StatItem,
+                                                 MessageItem)
+from libdisc.gif_state import GifState
+from libdisc.message_cache import MessageCache
+from libdisc.models.backfill_job import BackfillJob
+from libdisc.models.channel_watermark import ChannelWatermark
 from libdisc.models.message import Message
-from libdisc.models.user import User
+from libdisc.models.rollup import refresh_rollups, rebuild_rollups
+from libdisc.models.user import user_key
 from libdisc.models.gif import Gif
+from libdisc.stock_store import StockStore, make_stock_store
+from libdisc.user_resolver import UserResolver
 
 
 class DatabaseManager:
@@ -17,44 +26,55 @@ class DatabaseManager:
     Serves as the main database access layer
     """
 
-    def __init__(self) -> None:
-        self.user_cache: Dict[Tuple[str, str], int] = {}
-        self.message_cache: Set[Tuple[int, int, int]] = set()
-        self.gif_cache: Dict[int, Tuple[str, int]] = {}
-        self.history_watch = None
+    def __init__(self, stock_store: StockStore = None) -> None:
+        """
+        @param stock_store: Where stock data lives, by default the backend
+        chosen in the configuration.
+        """
+        self.stock_store = stock_store or make_stock_store(ConfigManager.get_instance().get_stock_backend())
+        config = ConfigManager.get_instance()
+        self.user_resolver = UserResolver(capacity=config.get_user_cache_size())
+        self.message_cache = MessageCache(max_channels=config.get_message_cache_channels())
+        self.gif_state = GifState()
 
     def start_fs(self) -> None:
-        fs_db.init_fs_db()
+        self.stock_store.start()
 
-    def load_cache(self) -> None:
+    def warm_channel_cache(self, message_channel_id: int) -> None:
         """
-        Loads all caches
-        @return: None
+        Loads the message dedupe state of a channel the first time it is
+        needed. User and gif caches fill up lazily on their first miss.
+
+        @param message_channel_id: The message's channel id
         """
+        if self.message_cache.is_loaded(message_channel_id):
+            return
+
         with DB.get_instance().make_session() as db_session:
-            # Message cache
-            for user_id, channel_id, timestamp in db_session.query(Message.user_id,
-                                                                   Message.channel_id,
-                                                                   Message.timestamp):
-                self.message_cache.add((user_id, channel_id, timestamp))
-            # User cache
-            for user in db_session.query(User):
-                self.user_cache[(user.name, user.discriminator)] = user.id
-            # Gif cache
-            for gif in db_session.query(Gif):
-                self.gif_cache[gif.user_id] = (gif.keyword, gif.timestamp)
-
-        print(f'User cache size: {len(self.user_cache.items())}')
-        print(f'Message cache size: {len(self.message_cache)}')
-        print(f'Gif cache size: {len(self.gif_cache)}')
+            self.message_cache.load_channel(
+                message_channel_id,
+                db_session.query(Message.user_id, Message.timestamp)
+                .filter(Message.channel_id == message_channel_id)
+                .yield_per(10000))
+
+        print(f'Message cache size: {len(self.message_cache)} '
+              f'({self.message_cache.nbytes() / 2 ** 20:.1f} MiB)')
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        @return: The size and counters of the user, message and gif caches.
+        """
+        return {'user': self.user_resolver.cache.stats(),
+                'message': self.message_cache.stats(),
+                'gif': self.gif_state.stats()}
 
     def reset_cache(self) -> None:
         """
         Resets both user and message caches
         """
-        self.user_cache.clear()
+        self.user_resolver.clear()
         self.message_cache.clear()
-        self.gif_cache.clear()
+        self.gif_state.clear()
 
     def add_new_message(self,
                         discord_user: DiscordUser,
@@ -64,23 +84,129 @@ class DatabaseManager:
                         message_char_count: int) -> None:
         """
         Inserts message into the db, as well as user if it doesn't exist.
+        Goes through add_new_messages, the only path refreshing rollups.
         @param discord_user: The message's user.
         @param timestamp: The message's timestamp in unix-timestamp.
         @param message_channel_id: The message's channel id.
         @param message_word_count: The message's word count.
         @param message_char_count: The message's character count.
         """
+        self.add_new_messages([MessageItem(discord_user=discord_user,
+                                           timestamp=timestamp,
+                                           channel_id=message_channel_id,
+                                           word_count=message_word_count,
+                                           char_count=message_char_count)])
+
+    def add_new_messages(self, messages: List[MessageItem]) -> int:
+        """
+        Inserts a chunk of messages into the db, resolving the users of
+        the whole chunk at once. The rollups are refreshed once per chunk,
+        only if it inserted messages, and committed with them so they never
+        lag the message table. Chunks must be written one at a time, as the
+        async manager's single writer thread does, since two refreshes of
+        the same bucket would race.
+        @param messages: The messages to be stored.
+        @return: The number of newly inserted messages.
+        """
+        if not messages:
+            return 0
+
+        with DB.get_instance().make_session() as db_session:
+            user_ids = self.user_resolver.resolve(db_session=db_session,
+                                                  discord_users=(message.discord_user for message in messages))
+
+            rows = [{'user_id': user_ids[user_key(message.discord_user)],
+                     'channel_id': message.channel_id,
+                     'timestamp': message.timestamp,
+                     'word_count': message.word_count,
+                     'char_count': message.char_count} for message in messages]
+
+            try:
+                inserted = Message.add_messages(db_session=db_session,
+                                                rows=rows,
+                                                cache=self.message_cache)
+                if inserted:
+                    refresh_rollups(db_session=db_session, rows=rows)
+                db_session.commit()
+            except SQLAlchemyError:
+                db_session.rollback()
+                raise
+
+            self.message_cache.update((row['user_id'], row['channel_id'], row['timestamp']) for row in rows)
+            return inserted
+
+    def rebuild_rollups(self) -> None:
+        """
+        Recomputes the hourly and weekly message rollups from scratch.
+        """
+        with DB.get_instance().make_session() as db_session:
+            rebuild_rollups(db_session=db_session)
+
+    def get_sync_watermark(self, message_channel_id: int) -> Optional[Tuple[int, int]]:
+        """
+        @param message_channel_id: The message's channel id
+        @return: The id and timestamp of the channel's newest ingested
+        message, None if the channel was never synced.
+        """
+        with DB.get_instance().make_session() as db_session:
+            return ChannelWatermark.read(db_session=db_session, channel_id=message_channel_id)
+
+    def advance_sync_watermark(self, message_channel_id: int, message_id: int, timestamp: int) -> None:
+        """
+        Records that a channel's messages were ingested up to message_id.
+
+        @param message_channel_id: The message's channel id
+        @param message_id: The Discord id of the newest ingested message
+        @param timestamp: The timestamp of that message
+        """
         with DB.get_instance().make_session() as db_session:
-            user_id = User.get_or_create(db_session=db_session,
-                                         discord_user=discord_user,
-                                         cache=self.user_cache)
-            Message.add_message(db_session=db_session,
-                                user_id=user_id,
-                                channel_id=message_channel_id,
-                                timestamp=timestamp,
-                                word_count=message_word_count,
-                                char_count=message_char_count,
-                                cache=self.message_cache)
+            ChannelWatermark.advance(db_session=db_session,
+                                     channel_id=message_channel_id,
+                                     message_id=message_id,
+                                     timestamp=timestamp)
+
+    def start_backfill(self, message_channel_id: int, status_channel_id: int, started_at: int) -> BackfillJob:
+        """
+        @param message_channel_id: The id of the channel to backfill
+        @param status_channel_id: The id of the channel to report progress to
+        @param started_at: Timestamp the backfill was requested at
+        @return: A new backfill job, or the channel's interrupted one.
+        """
+        with DB.get_instance().make_session() as db_session:
+            return BackfillJob.start(db_session=db_session,
+                                     channel_id=message_channel_id,
+                                     status_channel_id=status_channel_id,
+                                     started_at=started_at)
+
+    def checkpoint_backfill(self, message_channel_id: int, cursor_id: int, cursor_timestamp: int,
+                            messages: int) -> None:
+        """
+        @param message_channel_id: The id of the backfilled channel
+        @param cursor_id: The Discord id of the newest backfilled message
+        @param cursor_timestamp: The timestamp of that message
+        @param messages: The number of messages backfilled so far
+        """
+        with DB.get_instance().make_session() as db_session:
+            BackfillJob.checkpoint(db_session=db_session,
+                                   channel_id=message_channel_id,
+                                   cursor_id=cursor_id,
+                                   cursor_timestamp=cursor_timestamp,
+                                   messages=messages)
+
+    def finish_backfill(self, message_channel_id: int, finished_at: int) -> None:
+        """
+        @param message_channel_id: The id of the backfilled channel
+        @param finished_at: Timestamp the backfill completed at
+        """
+        with DB.get_instance().make_session() as db_session:
+            BackfillJob.finish(db_session=db_session, channel_id=message_channel_id, finished_at=finished_at)
+
+    def get_unfinished_backfills(self) -> List[BackfillJob]:
+        """
+        @return: The backfill jobs interrupted before they completed.
+        """
+        with DB.get_instance().make_session() as db_session:
+            return BackfillJob.get_unfinished(db_session=db_session)
 
     def get_last_message_timestamp(self, message_channel_id: int) -> int:
         """
@@ -98,6 +224,15 @@ class DatabaseManager:
 
             return timestamp[0] if timestamp else 0
 
+    def load_gif_state(self) -> None:
+        """
+        Loads every user's gif preference into memory, once.
+        """
+        if self.gif_state.loaded:
+            return
+        with DB.get_instance().make_session() as db_session:
+            self.gif_state.load(Gif.read_all(db_session=db_session))
+
     def get_last_gif_preference(self,
                                 discord_user: DiscordUser) -> Tuple[str, int]:
         """
@@ -108,20 +243,13 @@ class DatabaseManager:
         API query and the latest timestamp corresponding to when the bot
         posted a Gif for user_id
         """
-        with DB.get_instance().make_session() as db_session:
-            user_id = User.get_or_create(db_session=db_session,
-                                         discord_user=discord_user,
-                                         cache=self.user_cache)
-
-            (keyword, timestamp) = Gif.read_gif_preference(db_session=db_session,
-                                                           user_id=user_id,
-                                                           cache=self.gif_cache)
-
-            return keyword, timestamp
+        self.load_gif_state()
+        return self.gif_state.get(discord_user)
 
     def upsert_new_gif_entry(self, discord_user: DiscordUser, keyword: str, timestamp: int = 0) -> None:
         """
-        Updates or creates a gif entry for a user in the DB.
+        Updates or creates a gif entry for a user. The entry is written
+        to the DB by the next flush_gif_state.
 
         @param discord_user: The Discord user name for the Gif preference.
         @param keyword: The Gif keyword string to be user for the API query
@@ -129,16 +257,30 @@ class DatabaseManager:
         bot posted a Gif for user_id
         @return: None
         """
-        with DB.get_instance().make_session() as db_session:
-            user_id = User.get_or_create(db_session=db_session,
-                                         discord_user=discord_user,
-                                         cache=self.user_cache)
+        self.load_gif_state()
+        self.gif_state.set(discord_user, keyword, timestamp)
 
-            Gif.upsert_gif_entry(db_session=db_session,
-                                 user_id=user_id,
-                                 keyword=keyword,
-                                 timestamp=timestamp,
-                                 cache=self.gif_cache)
+    def flush_gif_state(self) -> int:
+        """
+        Writes the gif preferences changed since the last flush in one
+        batch. Preferences that fail to be written stay dirty.
+
+        @return: The number of written preferences.
+        """
+        dirty = self.gif_state.take_dirty()
+        if not dirty:
+            return 0
+        try:
+            with DB.get_instance().make_session() as db_session:
+                user_ids = self.user_resolver.resolve(db_session=db_session,
+                                                      discord_users=(user for user, _, _ in dirty.values()))
+                Gif.upsert_gif_entries(db_session=db_session,
+                                       preferences={user_ids[key]: (keyword, timestamp)
+                                                    for key, (_, keyword, timestamp) in dirty.items()})
+        except Exception:
+            self.gif_state.restore_dirty(dirty)
+            raise
+        return len(dirty)
 
     def add_stock_alert(self,
                         discord_user: DiscordUser,
@@ -159,138 +301,83 @@ class DatabaseManager:
         :param high: upper boundry for alert to trigger
         :param note: note to print when alert triggers
         """
-
-        db_ref = fs_db.get_fs_db()
-        db_ref.collection(u'alerts').add(
-            {
-                u'user_id': discord_user.name + discord_user.discriminator,
-                u'timestamp': timestamp,
-                u'channel_id': channel_id,
-                u'symbol': symbol,
-                u'low': low,
-                u'high': high,
-                u'note': note
-            }
-        )
+        self.stock_store.add_alert(user_id=discord_user.name + discord_user.discriminator,
+                                   timestamp=timestamp,
+                                   channel_id=channel_id,
+                                   symbol=symbol,
+                                   low=low,
+                                   high=high,
+                                   note=note)
 
     def add_stock_track(self,
-                        symbol: str) -> None:
+                        symbol: str) -> bool:
         """
         Add stock to track for finance bot.
         :param symbol: stock symbol
+        :return: whether the symbol was not tracked before
         """
-        db_ref = fs_db.get_fs_db()
-        db_ref.collection(u'tracking').add(
-            {
-                u'symbol': symbol,
-            }
-        )
+        return self.stock_store.add_track(symbol)
+
+    def is_tracked_symbol(self, symbol: str) -> bool:
+        """
+        :param symbol: stock symbol
+        :return: whether the finance bot tracks the symbol
+        """
+        return self.stock_store.is_tracked(symbol)
 
     def add_stock_entry(self,
-                        timestamp: int,
+                        timestamp: float,
                         item: StockItem) -> None:
         """
         Add stock entry to history table
         :param item: stock item
         """
-        db_ref = fs_db.get_fs_db()
-        db_ref.collection(u'history').add(
-            {
-                u'timestamp': timestamp,
-                u'symbol': item.symbol,
-                u'day_low': item.price_day_low,
-                u'day_high': item.price_day_high,
-                u'price': item.price
-            }
-        )
+        self.stock_store.add_entry(timestamp, item)
+
+    def add_stock_entries(self,
+                          timestamp: float,
+                          items: Iterable[StockItem]) -> int:
+        """
+        Add stock entries to history table using batched writes.
+        :param timestamp: timestamp shared by every entry
+        :param items: stock items
+        :return: number of entries written
+        """
+        return self.stock_store.add_entries(timestamp, items)
 
     def get_all_tracking_symbols(self) -> List[str]:
         """
         :return: a list of all tracking symbols
         """
-        db_ref = fs_db.get_fs_db()
-        docs = db_ref.collection(u'tracking').stream()
-        out = []
-        for d in docs:
-            d = d.to_dict()
-            out.append(d[u'symbol'])
-        return out
-
-    def init_history_watch(self, func: Callable[[StockItem, AlertItem], bool]) -> None:
-        db_ref = fs_db.get_fs_db()
-
-        def on_snapshot(col_snapshot, changes, read_time):
-            for doc in col_snapshot:
-                history_info = doc.to_dict()
-                stock_item = StockItem(
-                    price=history_info['price'],
-                    price_day_low=history_info['day_low'],
-                    price_day_high=history_info['day_high'],
-                    symbol=history_info['symbol'])
-                alerts = self.find_matching_alerts(stock_item)
-                for alert in alerts:
-                    alert_info = alert.to_dict()
-                    print(f'Found alert: {alert_info}')
-                    alert_item = AlertItem(
-                        timestamp=alert_info['timestamp'],
-                        channel_id=alert_info['channel_id'],
-                        low=alert_info['low'],
-                        high=alert_info['high'],
-                        symbol=alert_info['symbol'],
-                        note=alert_info['note'])
-                    if not func(stock_item, alert_item):
-                        print('func fall failed, not deleting alert')
-                        return
-                    print(f'Deleting {alert.id}')
-                    db_ref.collection(u'alerts').document(alert.id).delete()
-
-        self.history_watch = (db_ref.collection(u'history')
-                              .order_by(u'timestamp', direction=firestore.Query.DESCENDING)
-                              .limit(1)
-                              .on_snapshot(on_snapshot))
-
-    def find_matching_alerts(self, item: StockItem) -> List[Any]:
+        return self.stock_store.get_all_tracking_symbols()
+
+    def init_history_watch(self, func: Callable[[StockItem], None]) -> None:
+        """
+        Calls func with every stock quote added to the history.
+        :param func: callback run on a background thread
+        """
+        self.stock_store.watch_history(func)
+
+    def find_matching_alerts(self, item: StockItem) -> List[AlertItem]:
         """
         Alert if stock is less than low or more than high
-        :param item: _description_
-        :return: _description_
+        :param item: latest stock quote
+        :return: the alerts item triggers
         """
-        db_ref = fs_db.get_fs_db()
-        out: Any = []
-        alert_ref = (db_ref.collection(u'alerts')
-                     .where(u'symbol', u'==', item.symbol)
-                     .where(u'low', u'>', item.price))
-
-        out.extend(doc for doc in alert_ref.stream())
-
-        alert_ref = (db_ref.collection(u'alerts')
-                     .where(u'symbol', u'==', item.symbol)
-                     .where(u'high', u'<', item.price))
-
-        out.extend(doc for doc in alert_ref.stream())
-
-        return out
+        return self.stock_store.find_matching_alerts(item)
 
     def get_stock_history(self,
                           symbols: List[str],
-                          from_ts: float) -> Dict[str, StatItem]:
-        """
-        Gets history for all stock symbols
-        :param symbol: _description_
-        :return: _description_
-        """
-        db_ref = fs_db.get_fs_db()
-        out = {}
-        for sym in symbols:
-            item = StatItem()
-            hist_ref = (
-                db_ref.collection(u'history')
-                .where(u'timestamp', u'>=', from_ts)
-                .where(u'symbol', u'==', sym))
-            for entry in hist_ref.stream():
-                info = entry.to_dict()
-                item.timestamps.append(int(info['timestamp'])/(3600*24))
-                item.values.append(int(info['price']))
-            out[sym] = item
-
-        return out
+                          from_ts: float,
+                          to_ts: float = None,
+                          max_points: int = PLOT_MAX_POINTS) -> Dict[str, StatItem]:
+        """
+        Gets history for all stock symbols, averaged down to max_points
+        samples per symbol.
+        :param symbols: stock symbols
+        :param from_ts: first timestamp of the history
+        :param to_ts: last timestamp of the history, now by default
+        :param max_points: most samples returned per symbol
+        :return: a dictionary of {sym: StatItem}
+        """
+        return self.stock_store.get_stock_history(symbols, from_ts, to_ts, max_points)
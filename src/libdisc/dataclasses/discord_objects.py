@@ -1,42 +1,155 @@
-from typing import List, Union
+from typing import Dict, Iterable, Tuple
 from dataclasses import dataclass, field
 
+import numpy as np  # type: ignore
+
 
 @dataclass
 class DiscordUser:
     name: str
     nickname: str
     discriminator: str
+    # Discord's stable author id, 0 when unknown
+    discord_id: int = 0
+
+
+@dataclass
+class MessageItem:
+    """Class for collecting message info before it is stored"""
+    discord_user: DiscordUser
+    timestamp: int
+    channel_id: int
+    word_count: int
+    char_count: int
 
 
 @dataclass
 class StockItem:
     """Class for collecting stock info"""
-    price: int
-    price_day_low: int
-    price_day_high: int
+    price: float
+    price_day_low: float
+    price_day_high: float
     symbol: str
 
     def __str__(self):
         return f'{self.symbol}: {self.price}'
 
 
+@dataclass
+class StockFetchError:
+    """Class for reporting a symbol that could not be fetched"""
+    symbol: str
+    reason: str
+
+    def __str__(self):
+        return f'{self.symbol}: {self.reason}'
+
+
 @dataclass
 class AlertItem:
     """Class for collecting stock info"""
     timestamp: int
     channel_id: int
-    low: int
-    high: int
+    low: float
+    high: float
     symbol: str
     note: str
+    alert_id: str = ''
 
     def __str__(self):
         return f'{self.symbol}: {self.low} {self.high}'
 
 
-@dataclass
+@dataclass(eq=False)
 class StatItem:
-    """Class for grouping stats"""
-    timestamps: List[Union[int, float]] = field(default_factory=list)
-    values: List[Union[int, float]] = field(default_factory=list)
+    """Class for grouping stats, a time series backed by NumPy arrays"""
+    timestamps: np.ndarray = field(default_factory=lambda: np.empty(0))
+    values: np.ndarray = field(default_factory=lambda: np.empty(0))
+
+    def __post_init__(self):
+        self.timestamps = np.asarray(self.timestamps, dtype=np.float64)
+        self.values = np.asarray(self.values, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, StatItem)
+                and np.array_equal(self.timestamps, other.timestamps)
+                and np.array_equal(self.values, other.values))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[float, float]]) -> 'StatItem':
+        """
+        @param rows: (timestamp, value) rows, e.g. a query result
+        @return: the rows as a time series ordered by time
+        """
+        series = np.array(list(rows), dtype=np.float64).reshape(-1, 2)
+        order = np.argsort(series[:, 0], kind='stable')
+        return cls(series[order, 0], series[order, 1])
+
+    @classmethod
+    def group_rows(cls, rows: Iterable[Tuple[str, float, float]]) -> Dict[str, 'StatItem']:
+        """
+        @param rows: (key, timestamp, value) rows, e.g. a grouped query result
+        @return: a time series per key ordered by time, keys in the order
+        they first appear in time
+        """
+        rows = list(rows)
+        if not rows:
+            return {}
+        keys = np.array([row[0] for row in rows], dtype=object)
+        series = np.array([row[1:] for row in rows], dtype=np.float64)
+        order = np.argsort(series[:, 0], kind='stable')
+        keys, series = keys[order], series[order]
+        names, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # One stable sort groups the rows of every key, still ordered by time
+        grouped = np.argsort(inverse, kind='stable')
+        ends = np.cumsum(np.bincount(inverse, minlength=len(names)))
+        starts = ends - np.bincount(inverse, minlength=len(names))
+        out = {}
+        for index in np.argsort(first):
+            rows_of_key = grouped[starts[index]:ends[index]]
+            out[names[index]] = cls(series[rows_of_key, 0], series[rows_of_key, 1])
+        return out
+
+    def resample(self, width: float, origin: float = None, how: str = 'sum') -> 'StatItem':
+        """
+        @param width: width of the new buckets
+        @param origin: start of the first bucket, the first timestamp by default
+        @param how: 'sum' or 'mean' of the values falling into a bucket
+        @return: one sample per non empty bucket, stamped with its start
+        """
+        if not len(self):
+            return StatItem()
+        origin = self.timestamps[0] if origin is None else origin
+        buckets = ((self.timestamps - origin) // width).astype(np.int64)
+        first = buckets.min()
+        totals = np.bincount(buckets - first, weights=self.values)
+        counts = np.bincount(buckets - first)
+        filled = counts > 0
+        values = totals[filled] / counts[filled] if how == 'mean' else totals[filled]
+        return StatItem(origin + (np.flatnonzero(filled) + first) * width, values)
+
+    def rolling_mean(self, window: int) -> 'StatItem':
+        """
+        @param window: number of samples averaged
+        @return: the mean of every window, stamped with its last sample
+        """
+        if window < 1 or len(self) < window:
+            return StatItem()
+        sums = np.cumsum(np.concatenate(([0.0], self.values)))
+        return StatItem(self.timestamps[window - 1:], (sums[window:] - sums[:-window]) / window)
+
+    def cumsum(self) -> 'StatItem':
+        return StatItem(self.timestamps, np.cumsum(self.values))
+
+    def normalize(self) -> 'StatItem':
+        """
+        @return: values scaled to [0, 1], constant series become 0
+        """
+        if not len(self):
+            return StatItem()
+        low, high = self.values.min(), self.values.max()
+        scale = high - low if high > low else 1.0
+        return StatItem(self.timestamps, (self.values - low) / scale)
@@ -1,17 +1,24 @@
+import asyncio
+import time
 from datetime import datetime, timezone
 
 import discord  # type: ignore
 from discord import TextChannel  # type: ignore
 
+from app_configs.config_manager import ConfigManager
 from discord_analytics.analytics_engine import AnalyticsEngine
-from libdisc.constants import SECONDS_IN_HOUR
+from libdisc.async_database_manager import AsyncDatabaseManager
+from libdisc.constants import SECONDS_IN_HOUR, GIF_FLUSH_SECONDS
 from libdisc.database_manager import DatabaseManager
-from libdisc.dataclasses.discord_objects import DiscordUser
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem
+from libdisc.lru_cache import format_cache_stats
 from libdisc.media_manager import MediaManager
+from libdisc.message_write_buffer import MessageWriteBuffer
 from libdisc.plot_manager import PlotManager
 from libdisc.finance_manager import FinanceManager
+from libdisc.history_pipeline import run_history_pipeline
 
-from typing import List
+from typing import List, Optional
 
 
 class DiscordManager:
@@ -24,50 +31,107 @@ class DiscordManager:
                  analytics_engine: AnalyticsEngine,
                  media_manager: MediaManager,
                  plot_manager: PlotManager,
-                 finance_manager: FinanceManager):
-        # dict where key is channel id and value last fetched timestamp
+                 finance_manager: FinanceManager,
+                 async_db: AsyncDatabaseManager = None):
         self.db_manager = db_manager
         self.analytics_engine = analytics_engine
         self.media_manager = media_manager
         self.plot_manager = plot_manager
         self.finance_manager = finance_manager
+        # Coroutines reach the database only through this, off the event loop
+        self.async_db = async_db or AsyncDatabaseManager(db_manager=db_manager,
+                                                         analytics_engine=analytics_engine)
+        self.write_buffer = MessageWriteBuffer(async_db=self.async_db)
+
+    @staticmethod
+    def to_discord_user(author: discord.User) -> DiscordUser:
+        """
+        @param author: The author of a discord message.
+        @return: The author as it is stored.
+        """
+        return DiscordUser(author.name, author.display_name, author.discriminator, author.id)
+
+    @staticmethod
+    def to_message_item(msg: discord.Message, channel_id: int) -> MessageItem:
+        """
+        @param msg: A discord message.
+        @param channel_id: The id of the channel the message was sent to.
+        @return: The message as it is stored.
+        """
+        return MessageItem(discord_user=DiscordManager.to_discord_user(msg.author),
+                           timestamp=int(msg.created_at.replace(tzinfo=timezone.utc).timestamp()),
+                           channel_id=channel_id,
+                           word_count=len(msg.content.split()),
+                           char_count=len(msg.content))
+
+    def ingest_message(self, msg: discord.Message) -> None:
+        """
+        Buffers a message received live, to be written with the next
+        batch of the write buffer.
+        @param msg: The discord message.
+        """
+        self.write_buffer.add(self.to_message_item(msg, msg.channel.id), msg.id)
 
     async def store_latest_chat_messages(self,
                                          channel: TextChannel,
-                                         is_backfill: bool = False) -> None:
+                                         batch_size: Optional[int] = None,
+                                         queue_depth: Optional[int] = None) -> int:
         """
-        Attempts to load chat messages since the last timestamp
-        in the database.
+        Attempts to load chat messages since the channel's watermark, the
+        newest message ingested so far. The history is fetched in pages of
+        batch_size while the pages before it are written, moving the
+        watermark after every page.
         @param channel: The discord text channel.
-        @param is_backfill: Whether or not backfill from beginning of time.
+        @param batch_size: Number of messages written per transaction,
+        defaults to the configured history page size.
+        @param queue_depth: Most pages fetched ahead of the writes,
+        defaults to the configured history queue depth.
+        @return: The number of newly stored messages.
         """
-        last_timestamp = self.db_manager.get_last_message_timestamp(channel.id)
-        after = (datetime.utcfromtimestamp(last_timestamp) if last_timestamp else None)
-
-        if is_backfill:
-            after = None
-            self.db_manager.reset_cache()
+        config = ConfigManager.get_instance()
+        watermark = await self.async_db.get_sync_watermark(channel.id)
+        if watermark is not None:
+            after = discord.Object(id=watermark[0])
+        else:
+            # Channels ingested before watermarks existed
+            last_timestamp = await self.async_db.get_last_message_timestamp(channel.id)
+            after = (datetime.utcfromtimestamp(last_timestamp) if last_timestamp else None)
+        # The unique key skips messages stored already, the message cache is
+        # not warmed as loading a channel's keys costs more than a catch up
 
+        start = time.monotonic()
         messages_processed = 0
-        async for msg in channel.history(limit=None, after=after):
-
-            self.db_manager.add_new_message(
-                discord_user=DiscordUser(msg.author.name,
-                                         msg.author.display_name,
-                                         msg.author.discriminator),
-                timestamp=int(msg.created_at.replace(
-                              tzinfo=timezone.utc).timestamp()),
-                message_channel_id=channel.id,
-                message_word_count=len(msg.content.split()),
-                message_char_count=len(msg.content))
-            messages_processed += 1
-            if messages_processed % 100 == 0:
-                print(messages_processed)
-
-    def send_character_analytics(self,
-                                 channel: TextChannel,
-                                 exclude_bot: bool = True,
-                                 hours_ago: int = 0) -> str:
+        messages_stored = 0
+
+        async def write_page(page: List[discord.Message]) -> None:
+            nonlocal messages_processed, messages_stored
+            buffer = [self.to_message_item(msg, channel.id) for msg in page]
+            messages_stored += await self._flush_messages(channel, buffer, page[-1].id)
+            messages_processed += len(page)
+            print(f'{channel}: {messages_processed} messages processed')
+
+        await run_history_pipeline(channel.history(limit=None, after=after, oldest_first=True),
+                                   write_page,
+                                   page_size=batch_size or config.get_history_page_size(),
+                                   queue_depth=queue_depth or config.get_history_queue_depth())
+
+        elapsed = time.monotonic() - start
+        rate = messages_processed / elapsed if elapsed > 0 else 0.0
+        print(f'{channel}: stored {messages_stored}/{messages_processed} messages '
+              f'in {elapsed:.1f}s ({rate:.0f} msg/s)')
+        return messages_stored
+
+    async def _flush_messages(self, channel: TextChannel, buffer: List[MessageItem], newest_id: int) -> int:
+        if not buffer:
+            return 0
+        stored = await self.async_db.add_new_messages(buffer)
+        await self.async_db.advance_sync_watermark(channel.id, newest_id, buffer[-1].timestamp)
+        return stored
+
+    async def send_character_analytics(self,
+                                       channel: TextChannel,
+                                       exclude_bot: bool = True,
+                                       hours_ago: int = 0) -> str:
         """
         Sends out the latest user and character count analytics.
 
@@ -77,7 +141,9 @@ class DiscordManager:
         @return: a Discord friendly character statistics string.
         """
         from_timestamp = int(datetime.now(timezone.utc).timestamp()) - hours_ago * SECONDS_IN_HOUR if hours_ago else 0
-        char_count_dict = (self.analytics_engine.get_user_by_char_count(channel.id, from_timestamp))
+        # Whole minutes let repeated calls share a cached result
+        from_timestamp -= from_timestamp % 60
+        char_count_dict = await self.async_db.get_user_by_char_count(channel.id, from_timestamp)
 
         output_str = '```'
         if hours_ago:
@@ -95,9 +161,9 @@ class DiscordManager:
 
         return output_str
 
-    def handle_gif_cooldown(self,
-                            author: discord.User,
-                            message_ts: int) -> str:
+    async def handle_gif_cooldown(self,
+                                  author: discord.User,
+                                  message_ts: int) -> str:
         """
         Handles whether or not the bot should post a Gif to
         the discord Channel.
@@ -107,9 +173,10 @@ class DiscordManager:
         @return: a Gif url string.
         """
         gif_url = ""
-        discord_user = DiscordUser(author.name,
-                                   author.display_name,
-                                   author.discriminator)
+        discord_user = self.to_discord_user(author)
+        # Gif state lives in memory once loaded, see run_gif_writer
+        if not self.db_manager.gif_state.loaded:
+            await self.async_db.load_gif_state()
         (keyword, gif_timestamp) = self.db_manager.get_last_gif_preference(discord_user)
 
         if keyword:
@@ -131,7 +198,7 @@ class DiscordManager:
         """
         return self.media_manager.get_gif(keyword) or f"No gifs found for keyword: {keyword}"
 
-    def upsert_gif_keyword(self, author: discord.User, keyword: str) -> None:
+    async def upsert_gif_keyword(self, author: discord.User, keyword: str) -> None:
         """
         Inserts a Gif keyword preference for a particular user.
 
@@ -139,14 +206,29 @@ class DiscordManager:
         @param keyword: Keyword used to find a gif.
         @return: None
         """
-        self.db_manager.upsert_new_gif_entry(discord_user=DiscordUser(author.name,
-                                                                      author.display_name,
-                                                                      author.discriminator),
-                                             keyword=keyword)
-
-    def handle_trend_command(self,
-                             channel: TextChannel, message_ts: int,
-                             week_limit: int = 30) -> str:
+        if not self.db_manager.gif_state.loaded:
+            await self.async_db.load_gif_state()
+        self.db_manager.upsert_new_gif_entry(discord_user=self.to_discord_user(author), keyword=keyword)
+
+    async def run_gif_writer(self, interval: float = GIF_FLUSH_SECONDS) -> None:
+        """
+        Writes changed gif preferences every interval until cancelled,
+        and once more on the way out.
+        @param interval: Seconds between two writes.
+        """
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.async_db.flush_gif_state()
+                except Exception as e:
+                    print(f'Failed to write gif preferences: {e!r}')
+        finally:
+            await self.async_db.flush_gif_state()
+
+    async def handle_trend_command(self,
+                                   channel: TextChannel, message_ts: int,
+                                   week_limit: int = 30) -> bytes:
         """
         Creates a trend plot displaying user's char weekly statistics.
 
@@ -154,52 +236,53 @@ class DiscordManager:
         @param message_ts: Timestamp of the latest message sent.
         @param week_limit: Number of weeks to show in trend relative to
         current time.
-        @return: Filename of the trend image (png) file
+        @return: The PNG encoded trend image
         """
         sec_in_week = 60 * 60 * 24 * 7
         limit_ts = (int(message_ts / sec_in_week) - week_limit) * sec_in_week
-        stats_item = self.analytics_engine.get_stats_grouped_by_time(channel.id, limit_ts)
-        filename = self.plot_manager.generate_trend_image(
+        stats_item = await self.async_db.get_stats_grouped_by_time(channel.id, limit_ts)
+        return await self.plot_manager.generate_trend_image_async(
             chart_title='User Trends',
             x_label='Time',
             y_label='Char count',
             stat_item=stats_item)
-        return filename
 
-    def handle_stock_trend_command(self,
-                                   symbols: List[str],
-                                   day_limit: int) -> str:
+    async def handle_stock_trend_command(self,
+                                         symbols: List[str],
+                                         day_limit: int) -> bytes:
         """
         Prints stock trends for each symbol
-        :param symbols: _description_
-        :return: _description_
+        :param symbols: symbols to plot, up to 4 tracked ones if empty
+        :param day_limit: number of days to plot
+        :return: the PNG encoded trend image, empty if no symbol is tracked
         """
         query_symbols: List[str] = []
-        existing_symbols = self.db_manager.get_all_tracking_symbols()
+        existing_symbols = await self.async_db.get_all_tracking_symbols()
 
         if len(existing_symbols) == 0:
-            return ''
+            return b''
 
         if len(symbols) == 0:
             query_symbols.extend(
                 existing_symbols[:min(4, len(existing_symbols))])
         else:
+            tracked = set(existing_symbols)
             query_symbols.extend(
-                (sym for sym in symbols if sym in existing_symbols))
+                (sym for sym in symbols if sym in tracked))
 
         if len(query_symbols) == 0:
-            return ''
+            return b''
         print(query_symbols)
         sec_in_day = 60 * 60 * 24
-        from_ts = datetime.now(timezone.utc).timestamp() - sec_in_day * day_limit
-        stats_item = self.db_manager.get_stock_history(symbols=query_symbols,
-                                                       from_ts=from_ts)
-        filename = self.plot_manager.generate_trend_image(
+        to_ts = datetime.now(timezone.utc).timestamp()
+        stats_item = await self.async_db.get_stock_history(symbols=query_symbols,
+                                                           from_ts=to_ts - sec_in_day * day_limit,
+                                                           to_ts=to_ts)
+        return await self.plot_manager.generate_trend_image_async(
             chart_title='Stock Trends',
             x_label='Date',
             y_label='$',
             stat_item=stats_item)
-        return filename
 
     def handle_stock_command(self, symbol: str) -> str:
         """
@@ -216,7 +299,7 @@ class DiscordManager:
             msg += '```'
             stock_dict = self.finance_manager.get_stock_item_concurrent(special_symbols[symbol])
             for sym in special_symbols[symbol]:
-                msg += f'{sym}: ${stock_dict[sym].price}\n'
+                msg += f'{sym}: ${stock_dict[sym].price}\n' if sym in stock_dict else f'{sym}: unavailable\n'
             msg += '```'
         else:
             msg += '```'
@@ -224,10 +307,25 @@ class DiscordManager:
             msg += '```'
         return msg
 
-    def handle_show_tracked_command(self) -> str:
-        return '```' + '  '.join(self.db_manager.get_all_tracking_symbols()) + '```'
+    def handle_cache_stats_command(self) -> str:
+        """
+        @return: the counters of every cache of the bot
+        """
+        stats = self.db_manager.cache_stats()
+        stats['analytics result'] = self.analytics_engine.result_cache.stats()
+        stats['plot image'] = self.plot_manager.image_cache.stats()
+        return format_cache_stats(stats)
+
+    async def handle_show_tracked_command(self) -> str:
+        """
+        @return: the tracked symbols, read off the event loop as loading
+        them may wait for the stock store
+        """
+        return '```' + '  '.join(await self.async_db.get_all_tracking_symbols()) + '```'
 
     def handle_track_command(self, symbol: str) -> str:
+        if self.db_manager.is_tracked_symbol(symbol):
+            return f'Already tracking {symbol}'
         item = self.finance_manager.get_stock_item(symbol)
         valid = self.finance_manager.check_valid_stock(item)
         if not valid:
@@ -253,17 +351,14 @@ class DiscordManager:
         :return: _description_
         """
         print(f'Adding alert {symbol}: {low} {high}')
-        symbols = set(self.db_manager.get_all_tracking_symbols())
-        if symbol not in symbols:
+        if not self.db_manager.is_tracked_symbol(symbol):
             valid = self.finance_manager.check_valid_stock(
                 self.finance_manager.get_stock_item(symbol))
             if not valid:
                 return f'Alert wasnt added, {symbol} is not a valid symbol.'
             self.db_manager.add_stock_track(symbol)
         self.db_manager.add_stock_alert(
-            discord_user=DiscordUser(author.name,
-                                     author.display_name,
-                                     author.discriminator),
+            discord_user=self.to_discord_user(author),
             timestamp=datetime.now(timezone.utc).timestamp(),
             channel_id=channel.id,
             symbol=symbol,
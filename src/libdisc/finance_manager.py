@@ -1,34 +1,50 @@
 import yfinance as yf  # type: ignore
 import threading
-import queue
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
-from libdisc.dataclasses.discord_objects import StockItem
-from typing import List, Dict
+from libdisc.constants import QUOTE_TTL, INVALID_QUOTE_TTL, QUOTE_WORKER_THREADS, QUOTE_TIMEOUT, QUOTE_CACHE_SIZE
+from libdisc.dataclasses.discord_objects import StockItem, StockFetchError
+from libdisc.lru_cache import LRUCache
+from typing import List, Dict, Optional, Tuple
 
 PRICE_KEY = 'regularMarketPrice'
 HIGH_DAY_KEY = 'regularMarketDayHigh'
 LOW_DAY_KEY = 'regularMarketDayLow'
-WORKER_THREADS = 20
 
 
-class FinanceManager:
+class QuoteSource(ABC):
     """
-    Serves financial data
+    Where the finance manager fetches quotes from.
     """
 
-    def __init__(self):
-        pass
+    @abstractmethod
+    def fetch(self, symbol: str) -> StockItem:
+        """
+        @param symbol: stock symbol
+        @return: a stock item containing stock info
+        """
 
-    def check_valid_stock(self, item: StockItem) -> bool:
-        return item.price is not None and item.price != -1
+    @abstractmethod
+    def fetch_many(self, symbols: List[str]) -> Dict[str, StockItem]:
+        """
+        @param symbols: stock symbols
+        @return: a dictionary of {sym: StockItem}, missing unknown symbols
+        """
 
-    def get_stock_item(self, symbol: str) -> StockItem:
+
+class YahooQuoteSource(QuoteSource):
+    """
+    Fetches quotes from Yahoo Finance
+    """
+
+    def fetch(self, symbol: str) -> StockItem:
         """
         It takes roughly 10 seconds to fetch a symbol.
         @param symbol: stock symbol
         @return: a stock item containing stock info
         """
-
         info = yf.Ticker(symbol).info
         return StockItem(
             symbol=symbol,
@@ -37,6 +53,176 @@ class FinanceManager:
             price_day_high=info[HIGH_DAY_KEY] if HIGH_DAY_KEY in info else -1,
         )
 
+    def fetch_many(self, symbols: List[str]) -> Dict[str, StockItem]:
+        """
+        Fetches today's quotes of every symbol with one bulk download.
+        @param symbols: stock symbols
+        @return: a dictionary of {sym: StockItem}, missing unknown symbols
+        """
+        data = yf.download(tickers=symbols, period='1d', group_by='ticker', progress=False)
+        out = {}
+        for symbol in symbols:
+            if data.columns.nlevels > 1:
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                frame = data[symbol]
+            else:
+                frame = data
+            frame = frame.dropna(subset=['Close'])
+            if frame.empty:
+                continue
+            out[symbol] = StockItem(symbol=symbol,
+                                    price=float(frame['Close'].iloc[-1]),
+                                    price_day_low=float(frame['Low'].min()),
+                                    price_day_high=float(frame['High'].max()))
+        return out
+
+
+class FinanceManager:
+    """
+    Serves financial data
+    """
+
+    def __init__(self,
+                 quote_ttl: float = QUOTE_TTL,
+                 invalid_quote_ttl: float = INVALID_QUOTE_TTL,
+                 worker_threads: int = QUOTE_WORKER_THREADS,
+                 symbol_timeout: float = QUOTE_TIMEOUT,
+                 quote_source: QuoteSource = None,
+                 quote_cache_size: int = QUOTE_CACHE_SIZE):
+        """
+        @param quote_ttl: Seconds a fetched quote is served from memory.
+        @param invalid_quote_ttl: Seconds an invalid symbol is remembered.
+        @param worker_threads: Size of the pool fetching symbols in parallel.
+        @param symbol_timeout: Seconds to wait for the symbols of a request.
+        @param quote_source: Where quotes come from, Yahoo Finance by default.
+        @param quote_cache_size: Most quotes kept in memory.
+        """
+        self.quote_source = quote_source or YahooQuoteSource()
+        self.quote_ttl = quote_ttl
+        self.invalid_quote_ttl = invalid_quote_ttl
+        self.symbol_timeout = symbol_timeout
+        self.pool = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix='quote')
+        # symbol -> (monotonic expiry time, stock item)
+        self.quotes: LRUCache[Tuple[float, StockItem]] = LRUCache(quote_cache_size)
+        self.in_flight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def check_valid_stock(self, item: StockItem) -> bool:
+        return item.price is not None and item.price != -1
+
+    def get_stock_item(self, symbol: str) -> StockItem:
+        """
+        Returns a quote no older than quote_ttl. Concurrent requests for
+        the same symbol share a single fetch.
+        @param symbol: stock symbol
+        @return: a stock item containing stock info
+        """
+        with self.lock:
+            cached = self._cached_quote(symbol, time.monotonic())
+            if cached is not None:
+                return cached
+            waiting = self.in_flight.get(symbol)
+            if waiting is None:
+                owned: Future = Future()
+                self.in_flight[symbol] = owned
+
+        if waiting is not None:
+            return waiting.result()
+        return self._fetch_shared(symbol, owned)
+
+    def _fetch_shared(self, symbol: str, future: Future) -> StockItem:
+        """
+        Fetches a symbol on behalf of every request waiting on future.
+        """
+        try:
+            item = self._fetch_stock_item(symbol)
+        except Exception as e:
+            with self.lock:
+                del self.in_flight[symbol]
+            future.set_exception(e)
+            raise
+
+        self._store_quote(item)
+        with self.lock:
+            del self.in_flight[symbol]
+        future.set_result(item)
+        return item
+
+    def _fetch_stock_item(self, symbol: str) -> StockItem:
+        return self.quote_source.fetch(symbol)
+
+    def _cached_quote(self, symbol: str, now: float) -> Optional[StockItem]:
+        cached = self.quotes.get(symbol)
+        return cached[1] if cached is not None and cached[0] > now else None
+
+    def _store_quote(self, item: StockItem) -> None:
+        ttl = self.quote_ttl if self.check_valid_stock(item) else self.invalid_quote_ttl
+        self.quotes.put(item.symbol, (time.monotonic() + ttl, item))
+
+    def get_stock_items(self,
+                        symbol_list: List[str]) -> Tuple[Dict[str, StockItem], List[StockFetchError]]:
+        """
+        Fetches all symbols from symbol_list in parallel on the manager's
+        worker pool, waiting at most symbol_timeout for all of them.
+        @param symbol_list: list of symbols to process
+        @return: a dictionary of {sym: StockItem} and the symbols that failed
+        """
+        futures = {symbol: self.pool.submit(self.get_stock_item, symbol)
+                   for symbol in dict.fromkeys(symbol_list)}
+        done, _ = wait(futures.values(), timeout=self.symbol_timeout)
+        stock_dict: Dict[str, StockItem] = {}
+        errors: List[StockFetchError] = []
+        for symbol, future in futures.items():
+            if future not in done:
+                # Frees the pool of the symbols still queued
+                future.cancel()
+                errors.append(StockFetchError(symbol=symbol,
+                                              reason=f'timed out after {self.symbol_timeout}s'))
+                continue
+            try:
+                stock_dict[symbol] = future.result()
+            except Exception as e:
+                errors.append(StockFetchError(symbol=symbol, reason=repr(e)))
+        return stock_dict, errors
+
+    def get_stock_items_batch(self,
+                              symbol_list: List[str]) -> Tuple[Dict[str, StockItem], List[StockFetchError]]:
+        """
+        Fetches every symbol not cached yet with a single bulk request,
+        falling back to per symbol fetches if the bulk request fails.
+        @param symbol_list: list of symbols to process
+        @return: a dictionary of {sym: StockItem} and the symbols that failed
+        """
+        stock_dict: Dict[str, StockItem] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        with self.lock:
+            for symbol in dict.fromkeys(symbol_list):
+                cached = self._cached_quote(symbol, now)
+                if cached is not None:
+                    stock_dict[symbol] = cached
+                else:
+                    missing.append(symbol)
+
+        if not missing:
+            return stock_dict, []
+
+        try:
+            fetched = self.quote_source.fetch_many(missing)
+        except Exception as e:
+            print(f'Bulk quote download failed, fetching one by one: {e!r}')
+            fetched_dict, errors = self.get_stock_items(missing)
+            stock_dict.update(fetched_dict)
+            return stock_dict, errors
+
+        for symbol in missing:
+            # Symbols absent from the bulk result are unknown to the source
+            item = fetched.get(symbol) or StockItem(price=-1, price_day_low=-1, price_day_high=-1, symbol=symbol)
+            self._store_quote(item)
+            stock_dict[symbol] = item
+        return stock_dict, []
+
     def get_stock_item_concurrent(self,
                                   symbol_list: List[str]) -> Dict[str, StockItem]:
         """
@@ -45,29 +231,13 @@ class FinanceManager:
         @param symbol_list: list of symbols to process
         @return: a dictionary of {sym: StockItem}
         """
-        q: queue.Queue = queue.Queue()
-        stock_dict = {}
-
-        def worker():
-            try:
-                while True:
-                    symbol = q.get(True, .5)
-                    try:
-                        stock_dict[symbol] = self.get_stock_item(symbol)
-                    except Exception as e:
-                        print(e)
-                    finally:
-                        q.task_done()
-            except queue.Empty:
-                pass
-
-        for i in range(WORKER_THREADS):
-            threading.Thread(target=worker, daemon=True).start()
-
-        for symbol in symbol_list:
-            q.put(symbol)
-
-        # Block until all tasks are done.
-        q.join()
-
+        stock_dict, errors = self.get_stock_items(symbol_list)
+        for error in errors:
+            print(f'Failed to fetch {error}')
         return stock_dict
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker pool without waiting for stuck fetches.
+        """
+        self.pool.shutdown(wait=False)
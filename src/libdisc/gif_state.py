@@ -0,0 +1,96 @@
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from libdisc.dataclasses.discord_objects import DiscordUser
+from libdisc.lru_cache import CacheCounters
+from libdisc.models.user import UserKey, user_key
+
+GifPreference = Tuple[str, int]
+
+
+class GifState(CacheCounters):
+    """
+    In-memory gif keyword and cooldown timestamp of every user, so the
+    per-message gif check costs a dict lookup.
+
+    Changes are written behind: set() only marks the user dirty and the
+    owner periodically persists take_dirty(). All operations are thread
+    safe.
+
+    Every user's preference is held, so the state is unbounded. A lookup
+    counts as a hit if the user has a preference, as a miss otherwise.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.preferences: Dict[UserKey, GifPreference] = {}
+        # Preferences of users stored before their Discord id was known,
+        # by name and discriminator, moved to their id on first access
+        self.legacy: Dict[Tuple[str, str], GifPreference] = {}
+        self.dirty: Dict[UserKey, DiscordUser] = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.preferences) + len(self.legacy)
+
+    def load(self, rows: Iterable[Tuple[Optional[int], str, str, str, int]]) -> None:
+        """
+        @param rows: discord_id, name, discriminator, keyword and timestamp
+        of every stored preference.
+        """
+        with self.lock:
+            for discord_id, name, discriminator, keyword, timestamp in rows:
+                if discord_id:
+                    self.preferences.setdefault(discord_id, (keyword, timestamp))
+                else:
+                    self.legacy.setdefault((name, discriminator), (keyword, timestamp))
+            self.loaded = True
+
+    def get(self, discord_user: DiscordUser) -> GifPreference:
+        """
+        @return: The user's keyword and timestamp, empty if none is set.
+        """
+        key = user_key(discord_user)
+        with self.lock:
+            preference = self.preferences.get(key)
+            if preference is None and self.legacy:
+                preference = self.legacy.pop((discord_user.name, discord_user.discriminator), None)
+                if preference is not None:
+                    self.preferences[key] = preference
+            self.count(preference is not None)
+            return preference or ('', 0)
+
+    def set(self, discord_user: DiscordUser, keyword: str, timestamp: int) -> None:
+        key = user_key(discord_user)
+        with self.lock:
+            if self.preferences.get(key) == (keyword, timestamp):
+                return
+            self.preferences[key] = (keyword, timestamp)
+            self.dirty[key] = discord_user
+
+    def take_dirty(self) -> Dict[UserKey, Tuple[DiscordUser, str, int]]:
+        """
+        Clears the dirty set.
+        @return: The user and current preference of every changed user.
+        """
+        with self.lock:
+            dirty, self.dirty = self.dirty, {}
+            return {key: (discord_user, *self.preferences[key]) for key, discord_user in dirty.items()}
+
+    def restore_dirty(self, dirty: Dict[UserKey, Tuple[DiscordUser, str, int]]) -> None:
+        """
+        Marks users dirty again after their preferences failed to be written.
+        """
+        with self.lock:
+            for key, (discord_user, _, _) in dirty.items():
+                self.dirty.setdefault(key, discord_user)
+
+    def clear(self) -> None:
+        """
+        Drops every preference already written, to be loaded again.
+        """
+        with self.lock:
+            self.preferences = {key: self.preferences[key] for key in self.dirty}
+            self.legacy.clear()
+            self.loaded = False
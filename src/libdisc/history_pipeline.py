@@ -0,0 +1,61 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List
+
+import discord  # type: ignore
+
+from libdisc.constants import HISTORY_QUEUE_DEPTH, MESSAGE_BATCH_SIZE
+
+PageConsumer = Callable[[List[discord.Message]], Awaitable[None]]
+
+
+async def run_history_pipeline(history: AsyncIterator[discord.Message],
+                               consume: PageConsumer,
+                               page_size: int = MESSAGE_BATCH_SIZE,
+                               queue_depth: int = HISTORY_QUEUE_DEPTH) -> int:
+    """
+    Fetches a channel's history while the pages fetched so far are being
+    written. A producer task pages the history into a bounded queue, so
+    fetching runs at most queue_depth pages ahead of consume, which is
+    called with one page at a time, in order.
+
+    If fetching fails, the pages already fetched are still consumed
+    before the error is raised, so the progress they carry is kept. If
+    consume fails, fetching stops.
+
+    @param history: The messages to ingest, e.g. channel.history().
+    @param consume: Writes a page of messages.
+    @param page_size: Number of messages per page.
+    @param queue_depth: Most pages fetched but not consumed yet.
+    @return: The number of messages fetched.
+    """
+    queue: 'asyncio.Queue[List[discord.Message]]' = asyncio.Queue(maxsize=queue_depth)
+    fetched = 0
+
+    async def produce() -> None:
+        nonlocal fetched
+        page: List[discord.Message] = []
+        async for message in history:
+            page.append(message)
+            fetched += 1
+            if len(page) >= page_size:
+                await queue.put(page)
+                page = []
+        if page:
+            await queue.put(page)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({get, producer}, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                await consume(get.result())
+                continue
+            # The producer is done, whatever it fetched is queued already
+            get.cancel()
+            while not queue.empty():
+                await consume(queue.get_nowait())
+            producer.result()
+            return fetched
+    finally:
+        producer.cancel()
@@ -0,0 +1,119 @@
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar('V')
+
+
+class CacheCounters(ABC):
+    """
+    Hit, miss and eviction counters shared by the bot's caches, so their
+    effectiveness can be reported the same way.
+
+    Subclasses set capacity, 0 meaning unbounded, and implement __len__.
+    """
+
+    capacity = 0
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """
+        @return: The number of entries held.
+        """
+
+    def count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def reset_counters(self) -> None:
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        @return: The cache's size and counters.
+        """
+        return {'size': len(self),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def format_cache_stats(stats: Dict[str, Dict[str, int]]) -> str:
+    """
+    @param stats: The stats of caches, by cache name.
+    @return: A Discord friendly table of the caches' counters.
+    """
+    lines = []
+    for name, counters in stats.items():
+        lookups = counters['hits'] + counters['misses']
+        hit_rate = f"{counters['hits'] / lookups:.1%}" if lookups else '-'
+        capacity = counters['capacity'] or 'unbounded'
+        lines.append(f"{name}: size {counters['size']}/{capacity} hits {counters['hits']} "
+                     f"misses {counters['misses']} evictions {counters['evictions']} hit rate {hit_rate}")
+    return '```' + '\n'.join(lines) + '```'
+
+
+class LRUCache(CacheCounters, Generic[V]):
+    """
+    Size bounded cache evicting the least recently used entry, with hit
+    and miss counters.
+
+    Entries may carry a tag, e.g. the version of the data they were
+    computed from. A lookup passing a different tag is a miss and drops
+    the stale entry. All operations are thread safe.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__()
+        self.capacity = capacity
+        self.entries: 'OrderedDict[Hashable, Tuple[Any, V]]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable, default: Optional[V] = None, tag: Any = None) -> Optional[V]:
+        """
+        @param key: The entry's key.
+        @param default: Value returned on a miss.
+        @param tag: Tag the entry must have been stored with.
+        @return: The cached value or default.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != tag:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: V, tag: Any = None) -> None:
+        """
+        Stores value under key, evicting the least recently used entries
+        if the cache is full.
+        """
+        with self.lock:
+            self.entries[key] = (tag, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,180 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, Set, Tuple
+
+import numpy as np  # type: ignore
+
+from libdisc.lru_cache import CacheCounters
+
+# Pending keys are merged into the sorted array once they outgrow this
+# fraction of it, which keeps the amortized insert cost constant.
+MERGE_RATIO = 8
+MIN_MERGE_SIZE = 1024
+MAX_CACHED_CHANNELS = 32
+# A key is the timestamp above the user id in a signed 64-bit integer, so
+# user ids must fit in 32 bits and timestamps in 31, which lasts until 2038.
+USER_ID_BITS = 32
+MAX_TIMESTAMP = 2 ** 31 - 1
+
+
+def pack_key(user_id: int, timestamp: int) -> int:
+    """
+    Packs a user id and a unix timestamp into a single 64-bit integer.
+
+    @param user_id: The database id of the user, must fit in 32 bits.
+    @param timestamp: The message's timestamp in unix-timestamp, at most
+    MAX_TIMESTAMP.
+    @return: a packed key.
+    @raise ValueError: If either does not fit, as its key would collide.
+    """
+    if not 0 <= user_id < 1 << USER_ID_BITS or not 0 <= timestamp <= MAX_TIMESTAMP:
+        raise ValueError(f'Cannot pack user {user_id} at {timestamp} into a message key')
+    return (timestamp << USER_ID_BITS) | user_id
+
+
+class _ChannelKeys:
+    """
+    Packed message keys for a single channel: a sorted int64 array
+    searched with bisect plus a small set of recent additions.
+    """
+
+    def __init__(self, keys: np.ndarray = None) -> None:
+        self.keys = array('q')
+        self.pending: Set[int] = set()
+        if keys is not None:
+            self._set_keys(keys)
+
+    def __contains__(self, key: int) -> bool:
+        if key in self.pending:
+            return True
+        # bisect on array('q') is cheaper than np.searchsorted for scalars
+        index = bisect_left(self.keys, key)
+        return index < len(self.keys) and self.keys[index] == key
+
+    def _set_keys(self, keys: np.ndarray) -> None:
+        self.keys = array('q')
+        self.keys.frombytes(keys.astype(np.int64).tobytes())
+
+    def union(self, keys: np.ndarray) -> None:
+        self._set_keys(np.union1d(np.frombuffer(self.keys, dtype=np.int64), keys))
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self.pending)
+
+    def add(self, key: int) -> None:
+        if key in self:
+            return
+        self.pending.add(key)
+        if len(self.pending) > max(MIN_MERGE_SIZE, len(self.keys) // MERGE_RATIO):
+            self.merge()
+
+    def merge(self) -> None:
+        if not self.pending:
+            return
+        self.union(np.fromiter(self.pending, dtype=np.int64, count=len(self.pending)))
+        self.pending = set()
+
+    def nbytes(self) -> int:
+        # Python ints in the pending set cost roughly 60 bytes each
+        return self.keys.itemsize * len(self.keys) + len(self.pending) * 60
+
+
+class MessageCache(CacheCounters):
+    """
+    Memory compact set of (user_id, channel_id, timestamp) message keys.
+    It exposes the same membership interface as a set of tuples while
+    storing each key as 8 bytes in a per-channel sorted array.
+
+    Channels are warmed one at a time with load_channel and the least
+    recently used ones are evicted once max_channels is exceeded. A hit
+    is a message found to be stored already.
+    """
+
+    def __init__(self, max_channels: int = MAX_CACHED_CHANNELS) -> None:
+        super().__init__()
+        self.capacity = max_channels
+        self.channels: 'OrderedDict[int, _ChannelKeys]' = OrderedDict()
+        self.loaded_channels: Set[int] = set()
+
+    def __contains__(self, key: Tuple[int, int, int]) -> bool:
+        user_id, channel_id, timestamp = key
+        channel = self.channels.get(channel_id)
+        found = channel is not None and pack_key(user_id, timestamp) in channel
+        self.count(found)
+        return found
+
+    def __len__(self) -> int:
+        return sum(len(channel) for channel in self.channels.values())
+
+    def _get_channel(self, channel_id: int) -> _ChannelKeys:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = _ChannelKeys()
+            self._evict()
+        else:
+            self.channels.move_to_end(channel_id)
+        return channel
+
+    def _evict(self) -> None:
+        while len(self.channels) > self.capacity:
+            channel_id, _ = self.channels.popitem(last=False)
+            self.loaded_channels.discard(channel_id)
+            self.evictions += 1
+            print(f'Evicted channel {channel_id} from message cache')
+
+    def is_loaded(self, channel_id: int) -> bool:
+        """
+        @return: Whether all stored messages of the channel are cached.
+        """
+        return channel_id in self.loaded_channels
+
+    def add(self, key: Tuple[int, int, int]) -> None:
+        """
+        Adds a (user_id, channel_id, timestamp) key.
+        """
+        user_id, channel_id, timestamp = key
+        self._get_channel(channel_id).add(pack_key(user_id, timestamp))
+
+    def update(self, keys: Iterable[Tuple[int, int, int]]) -> None:
+        """
+        Adds many (user_id, channel_id, timestamp) keys.
+        """
+        for key in keys:
+            self.add(key)
+
+    def load_channel(self, channel_id: int, rows: Iterable[Tuple[int, int]]) -> None:
+        """
+        Bulk loads every stored message of a channel, sorting its keys
+        once instead of inserting them one by one.
+
+        @param channel_id: The id of the channel.
+        @param rows: (user_id, timestamp) rows as returned by a database query.
+        """
+        buffer = array('q')
+        for user_id, timestamp in rows:
+            buffer.append(pack_key(user_id, timestamp))
+
+        keys = np.unique(np.frombuffer(buffer, dtype=np.int64))
+        self._get_channel(channel_id).union(keys)
+        self.loaded_channels.add(channel_id)
+
+    def clear(self) -> None:
+        self.channels.clear()
+        self.loaded_channels.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        @return: The cache's size and capacity in channels, its number of
+        keys and its counters.
+        """
+        stats = super().stats()
+        stats['size'] = len(self.channels)
+        stats['keys'] = len(self)
+        return stats
+
+    def nbytes(self) -> int:
+        """
+        @return: Approximate memory used by the stored keys in bytes.
+        """
+        return sum(channel.nbytes() for channel in self.channels.values())
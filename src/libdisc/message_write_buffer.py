@@ -0,0 +1,209 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+from typing_extensions import Protocol
+
+from libdisc.constants import LIVE_BUFFER_LIMIT, LIVE_FLUSH_SECONDS, LIVE_MAX_RETRIES, MESSAGE_BATCH_SIZE
+from libdisc.dataclasses.discord_objects import MessageItem
+
+
+class MessageWriter(Protocol):
+    """
+    Writes messages and watermarks off the event loop, e.g. the
+    AsyncDatabaseManager.
+    """
+
+    async def add_new_messages(self, messages: List[MessageItem]) -> int:
+        ...
+
+    async def advance_sync_watermark(self, message_channel_id: int, message_id: int, timestamp: int) -> None:
+        ...
+
+
+class MessageWriteBuffer:
+    """
+    Collects messages received live from the gateway and writes them to
+    the database in batches, once max_size messages are buffered or every
+    flush_seconds, whichever comes first.
+
+    A channel's watermark is only moved by live writes once the history
+    crawler has caught the channel up (see mark_live). Until then the
+    crawler still owns the watermark, so messages missed while the bot
+    was offline are not skipped. Writes are idempotent, so messages
+    stored by both paths are only counted once.
+
+    A batch failing more than max_retries flushes in a row is bisected to
+    drop the messages failing on their own. At most max_buffered messages
+    are held; the oldest ones are dropped beyond that and their channels
+    handed back to the crawler, which fetches them again.
+    """
+
+    def __init__(self,
+                 async_db: MessageWriter,
+                 max_size: int = MESSAGE_BATCH_SIZE,
+                 flush_seconds: float = LIVE_FLUSH_SECONDS,
+                 max_retries: int = LIVE_MAX_RETRIES,
+                 max_buffered: int = LIVE_BUFFER_LIMIT) -> None:
+        """
+        @param async_db: Writes the messages.
+        @param max_size: Number of buffered messages triggering a flush.
+        @param flush_seconds: Seconds between two timed flushes.
+        @param max_retries: Failed flushes of a batch before it is bisected.
+        @param max_buffered: Most messages held while writes fail.
+        """
+        self.async_db = async_db
+        self.max_size = max_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.max_buffered = max_buffered
+        # Failed flushes in a row of the messages at the head of the buffer
+        self.attempts = 0
+        self.items: List[MessageItem] = []
+        # Newest buffered message id and timestamp per channel
+        self.newest: Dict[int, Tuple[int, int]] = {}
+        self.live_channels: Set[int] = set()
+        # Created by the first flush, as before Python 3.10 a lock binds to
+        # the event loop current when it is created
+        self.lock: Optional[asyncio.Lock] = None
+        self.received = 0
+        self.stored = 0
+        self.flushes = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def add(self, item: MessageItem, message_id: int) -> None:
+        """
+        Buffers a message, scheduling a flush if the buffer is full.
+
+        @param item: The message to store.
+        @param message_id: Discord snowflake of the message.
+        """
+        self.items.append(item)
+        newest = self.newest.get(item.channel_id)
+        if newest is None or message_id > newest[0]:
+            self.newest[item.channel_id] = (message_id, item.timestamp)
+        self.received += 1
+        self._shed()
+        if len(self.items) >= self.max_size:
+            asyncio.ensure_future(self.flush())
+
+    def mark_live(self, channel_id: int) -> None:
+        """
+        Lets live writes move the watermark of a channel the history
+        crawler has caught up.
+        """
+        self.live_channels.add(channel_id)
+
+    def reset_live(self) -> None:
+        """
+        Hands every watermark back to the history crawler, e.g. after the
+        gateway session was lost and events may have been missed.
+        """
+        self.live_channels.clear()
+
+    async def flush(self) -> int:
+        """
+        Writes the buffered messages. Messages that fail to be written
+        are kept for the next flush, up to max_retries times.
+
+        @return: The number of newly stored messages.
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if not self.items:
+                return 0
+            items, self.items = self.items, []
+            newest, self.newest = self.newest, {}
+            try:
+                stored = await self.async_db.add_new_messages(items)
+                await self._advance_watermarks(newest)
+            except Exception as e:
+                print(f'Failed to write {len(items)} live messages: {e!r}')
+                self.failed += 1
+                self.attempts += 1
+                if self.attempts <= self.max_retries:
+                    self._requeue(items, newest)
+                    return 0
+                stored, failing = await self._bisect(items)
+                if len(failing) == len(items):
+                    # The database is down rather than the batch bad
+                    self.attempts = 0
+                    self._requeue(items, newest)
+                    return 0
+                print(f'Dropped {len(failing)} live messages failing to be written: {failing}')
+                self.dropped += len(failing)
+                try:
+                    await self._advance_watermarks(newest)
+                except Exception as e:
+                    print(f'Failed to advance live watermarks: {e!r}')
+
+            self.attempts = 0
+            self.flushes += 1
+            self.stored += stored
+            return stored
+
+    async def _advance_watermarks(self, newest: Dict[int, Tuple[int, int]]) -> None:
+        for channel_id, (message_id, timestamp) in newest.items():
+            if channel_id in self.live_channels:
+                await self.async_db.advance_sync_watermark(channel_id, message_id, timestamp)
+
+    def _requeue(self, items: List[MessageItem], newest: Dict[int, Tuple[int, int]]) -> None:
+        self.items = items + self.items
+        for channel_id, (message_id, timestamp) in newest.items():
+            current = self.newest.get(channel_id)
+            if current is None or message_id > current[0]:
+                self.newest[channel_id] = (message_id, timestamp)
+        self._shed()
+
+    def _shed(self) -> None:
+        """
+        Drops the oldest messages beyond max_buffered. Their channels are
+        handed back to the crawler so their watermarks do not skip them.
+        """
+        excess = len(self.items) - self.max_buffered
+        if excess <= 0:
+            return
+        shed, self.items = self.items[:excess], self.items[excess:]
+        self.live_channels.difference_update(item.channel_id for item in shed)
+        self.dropped += excess
+        print(f'Live buffer full, dropped its {excess} oldest messages')
+
+    async def _bisect(self, items: List[MessageItem]) -> Tuple[int, List[MessageItem]]:
+        """
+        Writes the messages half by half, down to the ones failing on
+        their own.
+        @return: The number of newly stored messages and the messages
+        failing to be written on their own.
+        """
+        try:
+            return await self.async_db.add_new_messages(items), []
+        except Exception:
+            if len(items) == 1:
+                return 0, items
+        middle = len(items) // 2
+        stored, failing = await self._bisect(items[:middle])
+        stored_rest, failing_rest = await self._bisect(items[middle:])
+        return stored + stored_rest, failing + failing_rest
+
+    async def run(self) -> None:
+        """
+        Flushes every flush_seconds until cancelled, flushing what is
+        left on the way out.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.flush_seconds)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    def metrics(self) -> str:
+        """
+        @return: A Discord friendly summary of the buffer's counters.
+        """
+        return ('```'
+                f'live messages received: {self.received} stored: {self.stored} '
+                f'buffered: {len(self.items)} flushes: {self.flushes} failed: {self.failed} '
+                f'dropped: {self.dropped}'
+                '```')
@@ -0,0 +1,100 @@
+from typing import List
+
+from sqlalchemy import Column, BigInteger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from libdisc.models.base_mixin import BaseModel
+
+
+class BackfillJob(BaseModel):
+    """
+    Table used to checkpoint the history backfill of a channel, so an
+    interrupted backfill resumes where it stopped.
+    """
+
+    __tablename__ = "backfill_job"
+    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+    channel_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    # Channel to post progress to when the job resumes
+    status_channel_id = Column(BigInteger, nullable=False)
+    # Discord snowflake and timestamp of the newest backfilled message
+    cursor_id = Column(BigInteger, nullable=False, default=0)
+    cursor_timestamp = Column(BigInteger, nullable=False, default=0)
+    messages = Column(BigInteger, nullable=False, default=0)
+    started_at = Column(BigInteger, nullable=False)
+    finished_at = Column(BigInteger, nullable=False, default=0)
+
+    @staticmethod
+    def _commit(db_session: Session) -> None:
+        try:
+            db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
+
+    @staticmethod
+    def start(db_session: Session, channel_id: int, status_channel_id: int, started_at: int) -> 'BackfillJob':
+        """
+        Starts the backfill of a channel, or returns its unfinished job to
+        resume it.
+
+        @param db_session: The current database session
+        @param channel_id: The id of the channel to backfill.
+        @param status_channel_id: The id of the channel to report progress to.
+        @param started_at: Timestamp the backfill was requested at.
+        @return: The job, detached from the session.
+        """
+        job = db_session.query(BackfillJob).get(channel_id)
+        if job is None:
+            job = BackfillJob(channel_id=channel_id, status_channel_id=status_channel_id)
+            db_session.add(job)
+        if job.finished_at or job.started_at is None:
+            job.cursor_id = 0
+            job.cursor_timestamp = 0
+            job.messages = 0
+            job.started_at = started_at
+            job.finished_at = 0
+        job.status_channel_id = status_channel_id
+        BackfillJob._commit(db_session)
+        db_session.refresh(job)
+        db_session.expunge(job)
+        return job
+
+    @staticmethod
+    def checkpoint(db_session: Session, channel_id: int, cursor_id: int, cursor_timestamp: int, messages: int) -> None:
+        """
+        Records that a channel was backfilled up to cursor_id.
+
+        @param db_session: The current database session
+        @param channel_id: The id of the backfilled channel.
+        @param cursor_id: Id of the newest backfilled message.
+        @param cursor_timestamp: Timestamp of that message.
+        @param messages: Number of messages backfilled so far.
+        """
+        db_session.query(BackfillJob).filter(BackfillJob.channel_id == channel_id).update(
+            {'cursor_id': cursor_id, 'cursor_timestamp': cursor_timestamp, 'messages': messages},
+            synchronize_session=False)
+        BackfillJob._commit(db_session)
+
+    @staticmethod
+    def finish(db_session: Session, channel_id: int, finished_at: int) -> None:
+        """
+        @param db_session: The current database session
+        @param channel_id: The id of the backfilled channel.
+        @param finished_at: Timestamp the backfill completed at.
+        """
+        db_session.query(BackfillJob).filter(BackfillJob.channel_id == channel_id).update(
+            {'finished_at': finished_at}, synchronize_session=False)
+        BackfillJob._commit(db_session)
+
+    @staticmethod
+    def get_unfinished(db_session: Session) -> List['BackfillJob']:
+        """
+        @param db_session: The current database session
+        @return: The jobs that were interrupted, detached from the session.
+        """
+        jobs = db_session.query(BackfillJob).filter(BackfillJob.finished_at == 0).all()
+        for job in jobs:
+            db_session.expunge(job)
+        return jobs
@@ -1,5 +1,8 @@
+from sqlalchemy import Table
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import Insert
 
 Base = declarative_base()
 
@@ -10,3 +13,26 @@ class BaseModel(Base):  # type: ignore
     @declared_attr
     def __tablename__(cls):
         return cls.__name__.lower()
+
+
+def insert_ignore(db_session: Session, table: Table) -> Insert:
+    """
+    Builds an INSERT statement that silently skips rows violating a
+    unique key, using the native construct of the session's dialect.
+
+    @param db_session: The current database session
+    @param table: The table to insert into
+    @return: an insert statement
+    """
+    dialect = db_session.get_bind().dialect.name
+    if dialect == 'mysql':
+        # Not ON DUPLICATE KEY UPDATE id = id: mysqlclient connects with
+        # CLIENT_FOUND_ROWS, so its rowcount would count the skipped rows
+        return table.insert().prefix_with('IGNORE')
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        # INSERT OR IGNORE is SQLite's statement level ON CONFLICT DO NOTHING
+        return table.insert().prefix_with('OR IGNORE')
+    return table.insert()
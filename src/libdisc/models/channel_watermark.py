@@ -0,0 +1,57 @@
+from typing import Optional, Tuple
+
+from sqlalchemy import Column, BigInteger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from libdisc.models.base_mixin import BaseModel
+
+
+class ChannelWatermark(BaseModel):
+    """
+    Table used to store how far the messages of a channel were ingested
+    """
+
+    __tablename__ = "channel_watermark"
+    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+    channel_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    # Discord snowflake of the newest ingested message
+    message_id = Column(BigInteger, nullable=False)
+    timestamp = Column(BigInteger, nullable=False)
+
+    @staticmethod
+    def read(db_session: Session, channel_id: int) -> Optional[Tuple[int, int]]:
+        """
+        @param db_session: The current database session
+        @param channel_id: The id of the channel.
+        @return: The newest ingested message id and its timestamp, if any.
+        """
+        watermark = db_session.query(ChannelWatermark).get(channel_id)
+        if watermark is None:
+            return None
+        return watermark.message_id, watermark.timestamp
+
+    @staticmethod
+    def advance(db_session: Session, channel_id: int, message_id: int, timestamp: int) -> None:
+        """
+        Moves the watermark of a channel forward, never backwards.
+
+        @param db_session: The current database session
+        @param channel_id: The id of the channel.
+        @param message_id: Id of a message that was ingested.
+        @param timestamp: Timestamp of that message.
+        """
+        watermark = db_session.query(ChannelWatermark).get(channel_id)
+        if watermark is None:
+            db_session.add(ChannelWatermark(channel_id=channel_id, message_id=message_id, timestamp=timestamp))
+        elif message_id > watermark.message_id:
+            watermark.message_id = message_id
+            watermark.timestamp = timestamp
+        else:
+            return
+
+        try:
+            db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
@@ -1,10 +1,11 @@
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Optional
 
-from sqlalchemy import Column, String, UniqueConstraint, Integer, ForeignKey, BigInteger
+from sqlalchemy import Column, String, UniqueConstraint, Integer, ForeignKey, BigInteger, bindparam
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from libdisc.models.base_mixin import Base
+from libdisc.models.base_mixin import Base, insert_ignore
+from libdisc.models.user import User
 
 
 class Gif(Base):
@@ -23,67 +24,39 @@ class Gif(Base):
     timestamp = Column(BigInteger, server_default='0', nullable=False)
 
     @staticmethod
-    def upsert_gif_entry(db_session: Session,
-                         user_id: int, keyword: str,
-                         timestamp: int,
-                         cache: Dict[int, Tuple[str, int]] = None) -> None:
+    def upsert_gif_entries(db_session: Session, preferences: Dict[int, Tuple[str, int]]) -> None:
         """
-        Updates or creates a gif entry for a user in the DB.
+        Updates or creates the gif entries of many users with one insert
+        and one batched update.
 
         @param db_session: The current database session
-        @param user_id: The id of the user
-        @param keyword: The Gif keyword string to be user for the API query
-        @param timestamp: The latest timestamp corresponding to when the bot
-        posted a Gif for user_id
-        @param cache: Optional cache object to lookup database users
-        @return: None
+        @param preferences: The keyword and timestamp of users, by user id
         """
+        if not preferences:
+            return
 
-        gif = db_session.query(Gif).filter(Gif.user_id == user_id).one_or_none()
-
-        if gif is None:
-            db_session.add(
-                Gif(user_id=user_id, keyword=keyword, timestamp=timestamp))
-        else:
-            db_session.query(Gif).filter(Gif.user_id == user_id).update({"keyword": keyword, "timestamp": timestamp})
-
+        rows = [{'entry_user_id': user_id, 'entry_keyword': keyword, 'entry_timestamp': timestamp}
+                for user_id, (keyword, timestamp) in preferences.items()]
         try:
+            db_session.execute(insert_ignore(db_session, Gif.__table__),
+                               [{'user_id': user_id, 'keyword': keyword, 'timestamp': timestamp}
+                                for user_id, (keyword, timestamp) in preferences.items()])
+            db_session.execute(Gif.__table__.update()
+                               .where(Gif.user_id == bindparam('entry_user_id'))
+                               .values(keyword=bindparam('entry_keyword'),
+                                       timestamp=bindparam('entry_timestamp')), rows)
             db_session.commit()
         except SQLAlchemyError:
             db_session.rollback()
             raise
 
-        if cache:
-            cache[user_id] = (keyword, timestamp)
-
     @staticmethod
-    def read_gif_preference(db_session: Session,
-                            user_id: int,
-                            cache: Dict[int, Tuple[str, int]] = None) -> Tuple[str, int]:
+    def read_all(db_session: Session) -> List[Tuple[Optional[int], str, str, str, int]]:
         """
-        Reads the latest timestamp for a user in the DB.
-
         @param db_session: The current database session
-        @param user_id: The id of the user
-        @param cache: Optional cache object to lookup database users
-        @return: Tuple with The Gif keyword string to
-        be user for the API query and the latest timestamp
-        corresponding to when the bot posted a Gif for user_id
+        @return: The discord_id, name and discriminator of every user with
+        a gif entry, with its keyword and timestamp.
         """
-
-        if cache and user_id in cache:
-            return cache[user_id]
-
-        timestamp = 0
-        keyword = ""
-
-        gif = db_session.query(Gif).filter(Gif.user_id == user_id).one_or_none()
-
-        if gif is not None:
-            timestamp = gif.timestamp
-            keyword = gif.keyword
-
-        if cache:
-            cache[user_id] = (keyword, timestamp)
-
-        return keyword, timestamp
+        return [tuple(row) for row in
+                db_session.query(User.discord_id, User.name, User.discriminator, Gif.keyword, Gif.timestamp)
+                .join(User, User.id == Gif.user_id)]
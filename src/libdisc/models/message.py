@@ -1,9 +1,12 @@
-from typing import Set, Tuple
+from typing import Tuple, List, Dict
 
-from sqlalchemy import Column, Integer, ForeignKey, BigInteger, func
+from sqlalchemy import Column, Integer, ForeignKey, BigInteger, Index
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from libdisc.models.base_mixin import BaseModel
+from libdisc.message_cache import MessageCache
+from libdisc.models.base_mixin import BaseModel, insert_ignore
+# Registers the table behind the user_id foreign key
+from libdisc.models.user import User  # noqa: F401
 
 
 class Message(BaseModel):
@@ -12,7 +15,11 @@ class Message(BaseModel):
     """
 
     __tablename__ = "message"
-    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+    __table_args__ = (Index('uq_message_timestamp_user_channel',
+                            'timestamp', 'user_id', 'channel_id',
+                            unique=True),
+                      Index('ix_message_channel_timestamp', 'channel_id', 'timestamp'),
+                      {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'})
     id = Column(Integer, primary_key=True)
     timestamp = Column(BigInteger, nullable=False, index=True)
     user_id = Column(Integer, ForeignKey("user.id",
@@ -30,7 +37,7 @@ class Message(BaseModel):
             timestamp: int,
             word_count: int,
             char_count: int,
-            cache: Set[Tuple[int, int, int]] = None) -> None:
+            cache: MessageCache = None) -> None:
 
         """
         Adds message into the database
@@ -45,28 +52,50 @@ class Message(BaseModel):
         @return: None
         """
 
-        if cache and (user_id, channel_id, timestamp) in cache:
+        if cache is not None and (user_id, channel_id, timestamp) in cache:
             return
 
-        message_count = (db_session.query(func.count(Message.id))
-                         .filter(Message.timestamp == timestamp,
-                                 Message.user_id == user_id,
-                                 Message.channel_id == channel_id)
-                         .scalar())
+        try:
+            db_session.execute(insert_ignore(db_session, Message.__table__),
+                               {'timestamp': timestamp,
+                                'user_id': user_id,
+                                'channel_id': channel_id,
+                                'word_count': word_count,
+                                'char_count': char_count})
+            db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
 
-        if message_count == 0:
-            message = Message(timestamp=timestamp,
-                              user_id=user_id,
-                              channel_id=channel_id,
-                              word_count=word_count,
-                              char_count=char_count)
-            db_session.add(message)
+        if cache is not None:
+            cache.add((user_id, channel_id, timestamp))
+
+    @staticmethod
+    def add_messages(
+            db_session: Session,
+            rows: List[Dict[str, int]],
+            cache: MessageCache = None) -> int:
+        """
+        Adds a chunk of messages into the database with a single
+        multi-row INSERT, letting the unique key skip existing messages.
+        The caller commits, then records the rows in the cache.
+        @param db_session: The current database session
+        @param rows: Message rows, each holding user_id, channel_id,
+        timestamp, word_count and char_count.
+        @param cache: Optional cache to determine if the message
+        already exists in the database
+        @return: The number of inserted messages
+        """
+        pending: Dict[Tuple[int, int, int], Dict[str, int]] = {}
+        for row in rows:
+            key = (row['user_id'], row['channel_id'], row['timestamp'])
+            if cache is not None and key in cache:
+                continue
+            pending.setdefault(key, row)
 
-            try:
-                db_session.commit()
-            except SQLAlchemyError:
-                db_session.rollback()
-                raise
+        if not pending:
+            return 0
 
-        if cache:
-            cache.add((user_id, channel_id, timestamp))
+        result = db_session.execute(insert_ignore(db_session, Message.__table__),
+                                    list(pending.values()))
+        return max(result.rowcount, 0)
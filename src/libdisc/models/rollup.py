@@ -0,0 +1,150 @@
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import Column, Integer, BigInteger, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from libdisc.constants import SECONDS_IN_HOUR, SECONDS_IN_WEEK
+from libdisc.models.base_mixin import BaseModel
+from libdisc.models.message import Message
+
+
+class _Rollup(BaseModel):
+    """
+    Per (channel_id, user_id, bucket) message totals, where bucket is
+    the unix-timestamp at which a bucket of BUCKET_SECONDS starts.
+    """
+
+    __abstract__ = True
+    BUCKET_SECONDS = 0
+
+    # Key order (channel_id, bucket, user_id) serves time range scans
+    channel_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    bucket = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    char_count = Column(BigInteger, server_default='0', nullable=False)
+    word_count = Column(BigInteger, server_default='0', nullable=False)
+    message_count = Column(BigInteger, server_default='0', nullable=False)
+
+    @classmethod
+    def bucket_start(cls, timestamp: int) -> int:
+        """
+        @return: The start of the bucket holding timestamp.
+        """
+        return timestamp - timestamp % cls.BUCKET_SECONDS
+
+    @classmethod
+    def _source(cls, db_session: Session, channel_id: int, start: int, end: int):
+        bucket = (Message.timestamp - Message.timestamp % cls.BUCKET_SECONDS).label('bucket_start')
+        return (db_session.query(Message.channel_id,
+                                 Message.user_id,
+                                 bucket,
+                                 func.sum(Message.char_count),
+                                 func.sum(Message.word_count),
+                                 func.count(Message.id))
+                .filter(Message.channel_id == channel_id,
+                        Message.timestamp >= start,
+                        Message.timestamp < end)
+                .group_by(Message.channel_id, Message.user_id, 'bucket_start'))
+
+    @classmethod
+    def refresh(cls,
+                db_session: Session,
+                channel_id: int,
+                from_ts: int,
+                to_ts: int) -> None:
+        """
+        Recomputes every bucket of a channel overlapping [from_ts, to_ts].
+        Recomputing instead of incrementing keeps the rollup correct when
+        duplicated messages are skipped by the database. The caller commits.
+
+        @param db_session: The current database session
+        @param channel_id: The id of the channel.
+        @param from_ts: First timestamp that changed.
+        @param to_ts: Last timestamp that changed.
+        """
+        start = cls.bucket_start(from_ts)
+        end = cls.bucket_start(to_ts) + cls.BUCKET_SECONDS
+        (db_session.query(cls)
+         .filter(cls.channel_id == channel_id, cls.bucket >= start, cls.bucket < end)
+         .delete(synchronize_session=False))
+        db_session.execute(cls.__table__.insert().from_select(
+            ['channel_id', 'user_id', 'bucket', 'char_count', 'word_count', 'message_count'],
+            cls._source(db_session, channel_id, start, end).statement))
+
+
+class HourlyRollup(_Rollup):
+    """
+    Table used to store hourly message totals
+    """
+
+    __tablename__ = "message_hourly_rollup"
+    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+    BUCKET_SECONDS = SECONDS_IN_HOUR
+
+
+class WeeklyRollup(_Rollup):
+    """
+    Table used to store weekly message totals, aligned like the
+    unix epoch weeks used by the trend plots.
+    """
+
+    __tablename__ = "message_weekly_rollup"
+    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+    BUCKET_SECONDS = SECONDS_IN_WEEK
+
+    @classmethod
+    def _source(cls, db_session: Session, channel_id: int, start: int, end: int):
+        # Weeks are summed from the hourly rollup, which is refreshed first
+        bucket = (HourlyRollup.bucket - HourlyRollup.bucket % cls.BUCKET_SECONDS).label('bucket_start')
+        return (db_session.query(HourlyRollup.channel_id,
+                                 HourlyRollup.user_id,
+                                 bucket,
+                                 func.sum(HourlyRollup.char_count),
+                                 func.sum(HourlyRollup.word_count),
+                                 func.sum(HourlyRollup.message_count))
+                .filter(HourlyRollup.channel_id == channel_id,
+                        HourlyRollup.bucket >= start,
+                        HourlyRollup.bucket < end)
+                .group_by(HourlyRollup.channel_id, HourlyRollup.user_id, 'bucket_start'))
+
+
+def refresh_rollups(db_session: Session, rows: Iterable[Dict[str, int]]) -> None:
+    """
+    Brings every rollup up to date with freshly inserted message rows,
+    in the transaction inserting them. The caller commits.
+
+    @param db_session: The current database session
+    @param rows: Message rows, each holding channel_id and timestamp.
+    """
+    ranges: Dict[int, Tuple[int, int]] = {}
+    for row in rows:
+        channel_id, timestamp = row['channel_id'], row['timestamp']
+        low, high = ranges.get(channel_id, (timestamp, timestamp))
+        ranges[channel_id] = (min(low, timestamp), max(high, timestamp))
+
+    for channel_id, (from_ts, to_ts) in ranges.items():
+        for rollup in (HourlyRollup, WeeklyRollup):
+            rollup.refresh(db_session, channel_id, from_ts, to_ts)
+
+
+def rebuild_rollups(db_session: Session) -> None:
+    """
+    Recomputes every rollup from the raw message table.
+
+    @param db_session: The current database session
+    """
+    channel_ranges = (db_session.query(Message.channel_id,
+                                       func.min(Message.timestamp),
+                                       func.max(Message.timestamp))
+                      .group_by(Message.channel_id)
+                      .all())
+    try:
+        for rollup in (HourlyRollup, WeeklyRollup):
+            db_session.query(rollup).delete(synchronize_session=False)
+            for channel_id, from_ts, to_ts in channel_ranges:
+                rollup.refresh(db_session, channel_id, from_ts, to_ts)
+        db_session.commit()
+    except SQLAlchemyError:
+        db_session.rollback()
+        raise
@@ -0,0 +1,52 @@
+from sqlalchemy import Column, String, Integer, BigInteger, Float, Index
+
+from libdisc.models.base_mixin import BaseModel
+
+
+class StockTracking(BaseModel):
+    """
+    Table used to store the symbols tracked by the finance cron
+    """
+
+    __tablename__ = "stock_tracking"
+    __table_args__ = (Index('uq_stock_tracking_symbol', 'symbol', unique=True),
+                      {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'})
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(length=32), nullable=False)
+
+
+class StockHistory(BaseModel):
+    """
+    Table used to store stock quotes fetched by the finance cron
+    """
+
+    __tablename__ = "stock_history"
+    __table_args__ = (Index('ix_stock_history_symbol_timestamp', 'symbol', 'timestamp'),
+                      {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'})
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String(length=32), nullable=False)
+    # Double precision, a single precision FLOAT on MySQL rounds epoch
+    # timestamps to about 2 minutes and prices to a few digits
+    timestamp = Column(Float(precision=53), nullable=False)
+    price = Column(Float(precision=53), nullable=False)
+    day_low = Column(Float(precision=53), nullable=False)
+    day_high = Column(Float(precision=53), nullable=False)
+
+
+class StockAlert(BaseModel):
+    """
+    Table used to store stock price alerts
+    """
+
+    __tablename__ = "stock_alert"
+    __table_args__ = (Index('ix_stock_alert_symbol_low', 'symbol', 'low'),
+                      Index('ix_stock_alert_symbol_high', 'symbol', 'high'),
+                      {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'})
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String(length=256), nullable=False)
+    timestamp = Column(Float(precision=53), nullable=False)
+    channel_id = Column(BigInteger, nullable=False)
+    symbol = Column(String(length=32), nullable=False)
+    low = Column(Float(precision=53), nullable=False)
+    high = Column(Float(precision=53), nullable=False)
+    note = Column(String(length=1024), server_default='', nullable=False)
@@ -1,10 +1,20 @@
-from typing import Dict, Tuple
-from sqlalchemy import Column, String, UniqueConstraint, Integer
+from typing import Dict, Iterable, Tuple, Union
+from sqlalchemy import Column, String, UniqueConstraint, Integer, BigInteger, Index, bindparam, or_
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from libdisc.dataclasses.discord_objects import DiscordUser
-from libdisc.models.base_mixin import BaseModel
+from libdisc.models.base_mixin import BaseModel, insert_ignore
+
+UserKey = Union[int, Tuple[str, str]]
+
+
+def user_key(discord_user: DiscordUser) -> UserKey:
+    """
+    @return: The Discord id of the user, or its name and discriminator if
+    the id is unknown.
+    """
+    return discord_user.discord_id or (discord_user.name, discord_user.discriminator)
 
 
 class User(BaseModel):
@@ -14,6 +24,7 @@ class User(BaseModel):
 
     __tablename__ = "user"
     __table_args__ = (UniqueConstraint('name', 'discriminator'),
+                      Index('uq_user_discord_id', 'discord_id', unique=True),
                       {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'})
     id = Column(Integer, primary_key=True)
     name = Column(String(length=256), server_default='', nullable=False)
@@ -21,42 +32,114 @@ class User(BaseModel):
     discriminator = Column(String(length=256),
                            server_default='',
                            nullable=False)
+    # NULL for users stored before Discord ids were recorded
+    discord_id = Column(BigInteger, nullable=True)
 
     @staticmethod
-    def get_or_create(db_session: Session,
-                      discord_user: DiscordUser,
-                      cache: Dict[Tuple[str, str], int] = None) -> int:
-        """
-        Returns a user's id which it will create if necessary in the DB.
+    def _commit(db_session: Session) -> None:
+        try:
+            db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
 
-        @param db_session: current database session
-        @param discord_user: user to fetch or create
-        @param cache: optional cache object to lookup database users
-        @return: fetched used id
+    @staticmethod
+    def _select(db_session: Session, users: Dict[UserKey, DiscordUser]) -> Dict[UserKey, Tuple[int, str]]:
+        """
+        Finds stored users by Discord id, or by name and discriminator for
+        users stored before their Discord id was known, with one query.
+        Those legacy users get their Discord id recorded. A row of another
+        Discord id holding a user's name is never matched: its owner was
+        renamed, so it is tombstoned as "name (discord id)" to free the name.
         """
+        discord_ids = [user.discord_id for user in users.values() if user.discord_id]
+        by_name = {(user.name, user.discriminator): key for key, user in users.items()}
+        rows = (db_session.query(User.id, User.nickname, User.name, User.discriminator, User.discord_id)
+                .filter(or_(User.discord_id.in_(discord_ids),
+                            User.name.in_({name for name, _ in by_name}))))
+
+        found: Dict[UserKey, Tuple[int, str]] = {}
+        adopted = []
+        stale = []
+        for row in rows:
+            named = by_name.get((row.name, row.discriminator))
+            name_owner = users[named].discord_id if named is not None else None
+            if name_owner and row.discord_id is not None and row.discord_id != name_owner:
+                stale.append({'user_id': row.id, 'new_name': f'{row.name} ({row.discord_id})'})
+
+            if row.discord_id in users:
+                key = row.discord_id
+            elif row.discord_id is None or not name_owner:
+                key = named
+            else:
+                continue
+            if key is None or key in found:
+                continue
+            found[key] = (row.id, row.nickname)
+            if row.discord_id is None and name_owner:
+                adopted.append({'user_id': row.id, 'new_discord_id': name_owner})
+
+        if adopted:
+            db_session.execute(User.__table__.update()
+                               .where(User.id == bindparam('user_id'))
+                               .values(discord_id=bindparam('new_discord_id')), adopted)
+        if stale:
+            db_session.execute(User.__table__.update()
+                               .where(User.id == bindparam('user_id'))
+                               .values(name=bindparam('new_name')), stale)
+        if adopted or stale:
+            User._commit(db_session)
+        return found
 
-        user_key = (discord_user.name, discord_user.discriminator)
-        if cache and user_key in cache:
-            return cache[user_key]
+    @staticmethod
+    def resolve_many(db_session: Session, discord_users: Iterable[DiscordUser]) -> Dict[UserKey, Tuple[int, str]]:
+        """
+        Returns the ids of many users, creating the missing ones with a
+        single multi-row insert.
 
-        user = (db_session.query(User)
-                .filter(User.name == discord_user.name,
-                        User.discriminator == discord_user.discriminator)
-                .one_or_none())
+        @param db_session: current database session
+        @param discord_users: users to fetch or create
+        @return: the id and stored nickname of every user, by user_key
+        """
+        users = {user_key(user): user for user in discord_users}
+        if not users:
+            return {}
 
-        if user is None:
-            user = User(name=discord_user.name,
-                        nickname=discord_user.nickname,
-                        discriminator=discord_user.discriminator)
-            db_session.add(user)
+        found = User._select(db_session, users)
+        missing = {key: user for key, user in users.items() if key not in found}
+        if missing:
+            # Existing rows are skipped, e.g. users created concurrently
+            db_session.execute(insert_ignore(db_session, User.__table__),
+                               [{'name': user.name,
+                                 'nickname': user.nickname,
+                                 'discriminator': user.discriminator,
+                                 'discord_id': user.discord_id or None} for user in missing.values()])
+            User._commit(db_session)
+            found.update(User._select(db_session, missing))
+        return found
 
-            try:
-                db_session.commit()
-            except SQLAlchemyError:
-                db_session.rollback()
-                raise
+    @staticmethod
+    def update_nicknames(db_session: Session, nicknames: Dict[int, str]) -> None:
+        """
+        @param db_session: current database session
+        @param nicknames: the new nickname of users, by user id
+        """
+        if not nicknames:
+            return
+        db_session.execute(User.__table__.update()
+                           .where(User.id == bindparam('user_id'))
+                           .values(nickname=bindparam('new_nickname')),
+                           [{'user_id': user_id, 'new_nickname': nickname} for user_id, nickname in nicknames.items()])
+        User._commit(db_session)
 
-        if cache:
-            cache[user_key] = user.id
+    @staticmethod
+    def get_or_create(db_session: Session, discord_user: DiscordUser) -> int:
+        """
+        Returns a user's id which it will create if necessary in the DB.
+        Resolves the user like UserResolver, without caching; prefer it.
 
-        return user.id
+        @param db_session: current database session
+        @param discord_user: user to fetch or create
+        @return: fetched used id
+        """
+        return User.resolve_many(db_session, [discord_user])[user_key(discord_user)][0]
@@ -1,21 +1,86 @@
-import os
-from typing import Dict, Tuple, Optional, List, Union
+import asyncio
+import hashlib
+import io
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Tuple, Optional
 
 import matplotlib.dates as mdates  # type: ignore
-import matplotlib.pyplot as plt  # type: ignore
 import numpy as np  # type: ignore
-from scipy.interpolate import make_interp_spline, BSpline  # type: ignore
+from matplotlib.figure import Figure  # type: ignore
+from scipy.interpolate import make_interp_spline  # type: ignore
 
+from libdisc.constants import PLOT_CACHE_SIZE, PLOT_WORKER_PROCESSES
 from libdisc.dataclasses.discord_objects import StatItem
+from libdisc.lru_cache import LRUCache
+
+
+def _render_trend_png(chart_title: str,
+                      x_label: str,
+                      y_label: str,
+                      stat_item: Dict[str, StatItem]) -> bytes:
+    """
+    Renders a trend plot. Runs in the render worker processes, without
+    pyplot so no GUI backend or global figure state is involved.
+
+    @return: the PNG encoded image
+    """
+    fig = Figure(figsize=(8, 6), dpi=300)
+    ax = fig.add_subplot(111)
+
+    for key, item in stat_item.items():
+        try:
+            timestamps_smooth = np.linspace(item.timestamps[0], item.timestamps[-1], 300)
+            spl = make_interp_spline(item.timestamps, item.values, k=3)
+            values_smooth = spl(timestamps_smooth)
+            ax.plot(timestamps_smooth, values_smooth, label=key,
+                    ls='-', markersize=0)
+        except (ValueError, IndexError):
+            print(f"Not enough trend data to smooth: {key}")
+            ax.plot(item.timestamps,
+                    item.values,
+                    label=key,
+                    ls='-',
+                    markersize=0)
+
+    # Timestamps are days since the epoch, as plot_date used to expect
+    ax.xaxis_date()
+    ax.xaxis.set_major_locator(mdates.MonthLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b"))
+    ax.set_title(chart_title)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_aspect('auto')
+    ax.legend()
+    ax.grid()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+
+    return buffer.getvalue()
 
 
 class PlotManager:
     """
     This class serves as the plot generator for any analytics.
+
+    Images are rendered in a pool of worker processes, so rendering
+    neither blocks the event loop nor holds the GIL of the bot, and are
+    returned as PNG bytes. Rendered images are cached by a hash of the
+    plotted data and chart parameters.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self,
+                 render_workers: int = PLOT_WORKER_PROCESSES,
+                 cache_size: int = PLOT_CACHE_SIZE):
+        """
+        @param render_workers: Number of render worker processes.
+        @param cache_size: Number of rendered images kept in memory.
+        """
+        # Forking a process running the bot's threads is unsafe
+        self.pool = ProcessPoolExecutor(max_workers=render_workers,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        self.image_cache: LRUCache[bytes] = LRUCache(cache_size)
+        self.renders = 0
 
     def _prepare_stat_items(self,
                             stat_item: Optional[Dict[str, StatItem]]) -> Tuple[int, int, int, int]:
@@ -26,71 +91,90 @@ class PlotManager:
         @return: a Tuple with a StatItem object, and min and max values for
         both: timestamps and values within inputted StatItem.
         """
-        all_ts: List[Union[int, float]] = list()
-        all_vals: List[Union[int, float]] = list()
-
         if stat_item is None or not stat_item:
             return 0, 0, 0, 0
 
-        for user in stat_item.keys():
-            all_ts.extend(stat_item[user].timestamps)
-            all_vals.extend(stat_item[user].values)
+        all_ts = np.concatenate([item.timestamps for item in stat_item.values()])
+        all_vals = np.concatenate([item.values for item in stat_item.values()])
 
-        max_ts, min_ts = int(max(all_ts)), int(min(all_ts))
-        max_val, min_val = int(max(all_vals)), int(min(all_vals))
+        max_ts, min_ts = int(all_ts.max()), int(all_ts.min())
+        max_val, min_val = int(all_vals.max()), int(all_vals.min())
 
         return max_ts, min_ts, max_val, min_val
 
+    @staticmethod
+    def image_key(chart_title: str,
+                  x_label: str,
+                  y_label: str,
+                  stat_item: Dict[str, StatItem]) -> str:
+        """
+        @return: a hash of everything that ends up in the image
+        """
+        digest = hashlib.sha256(repr((chart_title, x_label, y_label)).encode())
+        for key, item in stat_item.items():
+            digest.update(repr(key).encode())
+            digest.update(item.timestamps.tobytes())
+            digest.update(b'|')
+            digest.update(item.values.tobytes())
+            digest.update(b'|')
+        return digest.hexdigest()
+
+    def _render(self,
+                chart_title: str,
+                x_label: str,
+                y_label: str,
+                stat_item: Optional[Dict[str, StatItem]]) -> Tuple[Optional[str], Future]:
+        """
+        Looks the image up in the cache, submitting it to the render
+        workers on a miss.
+
+        @return: The image's cache key, None if it needs no caching, and a
+        future of the PNG, already done if there was nothing to render.
+        """
+        done: Future = Future()
+        if stat_item is None:
+            print("Empty StatItem - Possible no data in DB for discord channel.")
+            done.set_result(b'')
+            return None, done
+
+        key = self.image_key(chart_title, x_label, y_label, stat_item)
+        cached = self.image_cache.get(key)
+        if cached is not None:
+            done.set_result(cached)
+            return None, done
+        self.renders += 1
+        return key, self.pool.submit(_render_trend_png, chart_title, x_label, y_label, stat_item)
+
+    def _store(self, key: Optional[str], image: bytes) -> bytes:
+        if key is not None:
+            self.image_cache.put(key, image)
+        return image
+
     def generate_trend_image(self,
                              chart_title: str,
                              x_label: str,
                              y_label: str,
-                             stat_item: Optional[Dict[str, StatItem]]) -> str:
+                             stat_item: Optional[Dict[str, StatItem]]) -> bytes:
         """
         Generates a trend image based on StatItem.
 
         @param stat_item: StatItem object
-        @return: a filepath/filename to the generated trend image.
+        @return: the PNG encoded trend image, empty if there is no data.
+        """
+        key, image = self._render(chart_title, x_label, y_label, stat_item)
+        return self._store(key, image.result())
+
+    async def generate_trend_image_async(self,
+                                         chart_title: str,
+                                         x_label: str,
+                                         y_label: str,
+                                         stat_item: Optional[Dict[str, StatItem]]) -> bytes:
+        """
+        Same as generate_trend_image, awaiting the render worker instead
+        of blocking the event loop.
         """
-        filename = os.getcwd() + '/trend.png'
-        # (max_ts, min_ts, max_val, min_val) = \
-        # self._prepare_stat_items(stat_item)
+        key, image = self._render(chart_title, x_label, y_label, stat_item)
+        return self._store(key, await asyncio.wrap_future(image))
 
-        if stat_item is None:
-            print("Empty StatItem - Possible no data in DB for discord channel.")
-            return ""
-
-        fig = plt.figure(figsize=(8, 6), dpi=300)
-        ax = fig.add_subplot(111)
-
-        for key in stat_item:
-            try:
-                timestamps_smooth = np.linspace(min(stat_item[key].timestamps),
-                                                max(stat_item[key].timestamps),
-                                                300)
-                spl = make_interp_spline(stat_item[key].timestamps,
-                                         stat_item[key].values,
-                                         k=3)  # type: BSpline
-                values_smooth = spl(timestamps_smooth)
-                ax.plot_date(timestamps_smooth, values_smooth, label=key,
-                             ls='-', markersize=0)
-            except ValueError:
-                print(f"Not enough trend data to smooth: {key}")
-                ax.plot_date(stat_item[key].timestamps,
-                             stat_item[key].values,
-                             label=key,
-                             ls='-',
-                             markersize=0)
-
-        ax.xaxis.set_major_locator(mdates.MonthLocator())
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%b"))
-        ax.set_title(chart_title)
-        ax.set_xlabel(x_label)
-        ax.set_ylabel(y_label)
-        ax.set_aspect('auto')
-        plt.legend()
-        plt.grid()
-        fig.savefig(filename)
-        plt.close()
-
-        return filename
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,655 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np  # type: ignore
+
+from sqlalchemy import Integer, cast, func, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from db.db import DB
+from db import fs_db
+from libdisc.alert_index import AlertIndex
+from libdisc.constants import (FIRESTORE_BATCH_LIMIT, HISTORY_POLL_SECONDS, HISTORY_REANCHOR_SECONDS, PLOT_MAX_POINTS,
+                               WATCH_LOAD_TIMEOUT)
+from libdisc.dataclasses.discord_objects import AlertItem, StatItem, StockItem
+from libdisc.models.base_mixin import insert_ignore
+from libdisc.models.stock import StockAlert, StockHistory, StockTracking
+from libdisc.time_series import bucket_width, downsample, to_stat_item
+from libdisc.tracked_symbol_registry import TrackedSymbolRegistry
+
+QuoteCallback = Callable[[StockItem], None]
+
+
+class StockStore(ABC):
+    """
+    Storage of the tracked symbols, their quote history and the alerts
+    set on them.
+
+    Once the history is watched, alerts are matched against an in-memory
+    AlertIndex kept in sync with the store. Tracked symbols are read from
+    a TrackedSymbolRegistry loaded on first use.
+    """
+
+    def __init__(self) -> None:
+        self.alert_index: Optional[AlertIndex] = None
+        self.tracked: Optional[TrackedSymbolRegistry] = None
+
+    def start(self) -> None:
+        """
+        Connects to the backend if it needs to.
+        """
+
+    @abstractmethod
+    def add_alert(self,
+                  user_id: str,
+                  timestamp: float,
+                  channel_id: int,
+                  symbol: str,
+                  low: float,
+                  high: float,
+                  note: str) -> None:
+        pass
+
+    def delete_alert(self, alert_id: str) -> None:
+        self.delete_alerts([alert_id])
+
+    def delete_alerts(self, alert_ids: List[str]) -> None:
+        """
+        Deletes the alerts with a single write.
+        """
+        if not alert_ids:
+            return
+        self._delete_alerts(alert_ids)
+        if self.alert_index is not None:
+            for alert_id in alert_ids:
+                self.alert_index.remove(alert_id)
+
+    @abstractmethod
+    def _delete_alerts(self, alert_ids: List[str]) -> None:
+        pass
+
+    @abstractmethod
+    def get_all_alerts(self) -> List[AlertItem]:
+        pass
+
+    def find_matching_alerts(self, item: StockItem) -> List[AlertItem]:
+        """
+        :return: the alerts of item's symbol whose price range item left
+        """
+        if self.alert_index is not None:
+            return self.alert_index.match(item)
+        return self._query_matching_alerts(item)
+
+    @abstractmethod
+    def _query_matching_alerts(self, item: StockItem) -> List[AlertItem]:
+        pass
+
+    def watch_alerts(self) -> None:
+        """
+        Loads every alert into the alert index.
+        """
+        self.alert_index = AlertIndex(self.get_all_alerts())
+
+    def add_track(self, symbol: str) -> bool:
+        """
+        Tracks a symbol. Tracking an already tracked symbol writes nothing.
+        :return: whether the symbol was not tracked before
+        """
+        tracked = self._tracked_symbols()
+        if symbol in tracked:
+            return False
+        self._add_track(symbol)
+        return tracked.add(symbol)
+
+    @abstractmethod
+    def _add_track(self, symbol: str) -> None:
+        """
+        Stores a tracked symbol, idempotently.
+        """
+
+    def is_tracked(self, symbol: str) -> bool:
+        return symbol in self._tracked_symbols()
+
+    def get_all_tracking_symbols(self) -> List[str]:
+        """
+        :return: the tracked symbols, oldest first
+        """
+        return self._tracked_symbols().to_list()
+
+    @abstractmethod
+    def _query_tracking_symbols(self) -> List[str]:
+        pass
+
+    def _tracked_symbols(self) -> TrackedSymbolRegistry:
+        if self.tracked is None:
+            return self.watch_tracking()
+        return self.tracked
+
+    def watch_tracking(self) -> TrackedSymbolRegistry:
+        """
+        Loads every tracked symbol into the registry.
+        :return: the registry
+        """
+        self.tracked = TrackedSymbolRegistry(self._query_tracking_symbols())
+        return self.tracked
+
+    def add_entry(self, timestamp: float, item: StockItem) -> None:
+        self.add_entries(timestamp, [item])
+
+    @abstractmethod
+    def add_entries(self, timestamp: float, items: Iterable[StockItem]) -> int:
+        """
+        :return: number of entries written
+        """
+
+    @abstractmethod
+    def get_history_arrays(self,
+                           symbols: List[str],
+                           from_ts: float,
+                           to_ts: float,
+                           max_points: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Reads the price history of every symbol with a single query,
+        averaged into at most max_points buckets per symbol.
+
+        :return: a dictionary of {sym: (timestamps, prices)}
+        """
+
+    def get_stock_history(self,
+                          symbols: List[str],
+                          from_ts: float,
+                          to_ts: float = None,
+                          max_points: int = PLOT_MAX_POINTS) -> Dict[str, StatItem]:
+        """
+        :return: a dictionary of {sym: StatItem} with timestamps in days
+        """
+        to_ts = time.time() if to_ts is None else to_ts
+        arrays = self.get_history_arrays(symbols, from_ts, to_ts, max_points)
+        return {sym: to_stat_item(*arrays[sym]) for sym in symbols}
+
+    def watch_history(self, func: QuoteCallback) -> None:
+        """
+        Calls func with every history entry added from now on, on a
+        background thread. Alerts are indexed first so matching them
+        needs no queries.
+        """
+        if self.alert_index is None:
+            self.watch_alerts()
+        self._watch_history(func)
+
+    @abstractmethod
+    def _watch_history(self, func: QuoteCallback) -> None:
+        pass
+
+    def stop(self) -> None:
+        """
+        Stops watching the history.
+        """
+
+
+class FirestoreStockStore(StockStore):
+    """
+    Keeps stock data in the tracking, history and alerts collections of
+    Firestore.
+    """
+
+    def __init__(self,
+                 load_timeout: float = WATCH_LOAD_TIMEOUT,
+                 reanchor_seconds: float = HISTORY_REANCHOR_SECONDS) -> None:
+        """
+        @param load_timeout: Seconds to wait for the first snapshot of a
+        watched collection.
+        @param reanchor_seconds: How often the history listener is
+        restarted at the newest entry, bounding its result set.
+        """
+        super().__init__()
+        self.load_timeout = load_timeout
+        self.reanchor_seconds = reanchor_seconds
+        self.history_stopped = threading.Event()
+        self.reanchorer: Optional[threading.Thread] = None
+        self.history_watch: Any = None
+        self.alerts_watch = None
+        self.tracking_watch = None
+
+    def start(self) -> None:
+        fs_db.init_fs_db()
+
+    def add_alert(self,
+                  user_id: str,
+                  timestamp: float,
+                  channel_id: int,
+                  symbol: str,
+                  low: float,
+                  high: float,
+                  note: str) -> None:
+        db_ref = fs_db.get_fs_db()
+        db_ref.collection(u'alerts').add(
+            {
+                u'user_id': user_id,
+                u'timestamp': timestamp,
+                u'channel_id': channel_id,
+                u'symbol': symbol,
+                u'low': low,
+                u'high': high,
+                u'note': note
+            }
+        )
+
+    def _delete_alerts(self, alert_ids: List[str]) -> None:
+        db_ref = fs_db.get_fs_db()
+        alerts = db_ref.collection(u'alerts')
+        for i in range(0, len(alert_ids), FIRESTORE_BATCH_LIMIT):
+            batch = db_ref.batch()
+            for alert_id in alert_ids[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.delete(alerts.document(alert_id))
+            batch.commit()
+
+    @staticmethod
+    def _to_alert_item(doc: Any) -> AlertItem:
+        alert_info = doc.to_dict()
+        return AlertItem(
+            timestamp=alert_info['timestamp'],
+            channel_id=alert_info['channel_id'],
+            low=alert_info['low'],
+            high=alert_info['high'],
+            symbol=alert_info['symbol'],
+            note=alert_info['note'],
+            alert_id=doc.id)
+
+    def get_all_alerts(self) -> List[AlertItem]:
+        return [self._to_alert_item(doc) for doc in fs_db.get_fs_db().collection(u'alerts').stream()]
+
+    def _query_matching_alerts(self, item: StockItem) -> List[AlertItem]:
+        db_ref = fs_db.get_fs_db()
+        out: List[AlertItem] = []
+        for field, op in ((u'low', u'>'), (u'high', u'<')):
+            alert_ref = (db_ref.collection(u'alerts')
+                         .where(u'symbol', u'==', item.symbol)
+                         .where(field, op, item.price))
+            out.extend(self._to_alert_item(doc) for doc in alert_ref.stream())
+        return out
+
+    def watch_alerts(self) -> None:
+        """
+        Keeps the alert index in sync with the alerts collection. The first
+        snapshot delivers every existing alert.
+        """
+        alert_index = AlertIndex()
+        loaded = threading.Event()
+
+        def on_snapshot(col_snapshot, changes, read_time):
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    alert_index.remove(change.document.id)
+                else:
+                    alert_index.add(self._to_alert_item(change.document))
+            loaded.set()
+
+        self.alerts_watch = fs_db.get_fs_db().collection(u'alerts').on_snapshot(on_snapshot)
+        self._wait_loaded(self.alerts_watch, loaded, u'alerts')
+        self.alert_index = alert_index
+
+    def _wait_loaded(self, watch: Any, loaded: threading.Event, collection: str) -> None:
+        """
+        Waits for the first snapshot of a watch, which never comes if the
+        listener failed.
+        @raise TimeoutError: If it did not arrive within load_timeout.
+        """
+        if not loaded.wait(self.load_timeout):
+            watch.unsubscribe()
+            raise TimeoutError(f'No snapshot of {collection} within {self.load_timeout}s')
+
+    def _add_track(self, symbol: str) -> None:
+        db_ref = fs_db.get_fs_db()
+        # The symbol is the document id, so tracking it twice is a no-op
+        db_ref.collection(u'tracking').document(symbol).set(
+            {
+                u'symbol': symbol,
+            }
+        )
+
+    def _query_tracking_symbols(self) -> List[str]:
+        db_ref = fs_db.get_fs_db()
+        return [d.to_dict()[u'symbol'] for d in db_ref.collection(u'tracking').stream()]
+
+    def watch_tracking(self) -> TrackedSymbolRegistry:
+        """
+        Keeps the registry in sync with the tracking collection. The first
+        snapshot delivers every tracked symbol.
+        :return: the registry
+        """
+        tracked = TrackedSymbolRegistry()
+        loaded = threading.Event()
+
+        def on_snapshot(col_snapshot, changes, read_time):
+            for change in changes:
+                symbol = change.document.to_dict()[u'symbol']
+                if change.type.name == 'REMOVED':
+                    tracked.discard(symbol)
+                else:
+                    tracked.add(symbol)
+            loaded.set()
+
+        self.tracking_watch = fs_db.get_fs_db().collection(u'tracking').on_snapshot(on_snapshot)
+        self._wait_loaded(self.tracking_watch, loaded, u'tracking')
+        self.tracked = tracked
+        return tracked
+
+    def add_entry(self, timestamp: float, item: StockItem) -> None:
+        db_ref = fs_db.get_fs_db()
+        db_ref.collection(u'history').add(self._entry(timestamp, item))
+
+    def add_entries(self, timestamp: float, items: Iterable[StockItem]) -> int:
+        db_ref = fs_db.get_fs_db()
+        history = db_ref.collection(u'history')
+        batch = db_ref.batch()
+        pending = written = 0
+        for item in items:
+            batch.set(history.document(), self._entry(timestamp, item))
+            pending += 1
+            if pending == FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                written += pending
+                batch, pending = db_ref.batch(), 0
+        if pending:
+            batch.commit()
+            written += pending
+        return written
+
+    @staticmethod
+    def _entry(timestamp: float, item: StockItem) -> Dict[str, Any]:
+        return {
+            u'timestamp': timestamp,
+            u'symbol': item.symbol,
+            u'day_low': item.price_day_low,
+            u'day_high': item.price_day_high,
+            u'price': item.price
+        }
+
+    def get_history_arrays(self,
+                           symbols: List[str],
+                           from_ts: float,
+                           to_ts: float,
+                           max_points: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Firestore cannot aggregate, so every history document in the range
+        is read and averaged here. Downsampling only bounds the plotting
+        cost, reads still grow with the number of days plotted.
+        """
+        db_ref = fs_db.get_fs_db()
+        samples: Dict[str, List[Tuple[float, float]]] = {sym: [] for sym in symbols}
+        # Firestore 'in' filters take at most 10 values
+        for i in range(0, len(symbols), 10):
+            hist_ref = (db_ref.collection(u'history')
+                        .where(u'symbol', u'in', symbols[i:i + 10])
+                        .where(u'timestamp', u'>=', from_ts)
+                        .where(u'timestamp', u'<=', to_ts)
+                        .select([u'symbol', u'timestamp', u'price']))
+            for entry in hist_ref.stream():
+                info = entry.to_dict()
+                samples[info['symbol']].append((info['timestamp'], info['price']))
+
+        out = {}
+        for sym, rows in samples.items():
+            series = np.array(rows, dtype=np.float64).reshape(-1, 2)
+            out[sym] = downsample(series[:, 0], series[:, 1], from_ts, to_ts, max_points)
+        return out
+
+    def _watch_history(self, func: QuoteCallback) -> None:
+        """
+        Listens to the history from now on. A listener keeps its whole
+        result set in memory, so every reanchor_seconds a new listener
+        starts at the newest timestamp seen and replaces the old one. They
+        overlap, and documents both deliver are passed to func only once.
+        """
+        lock = threading.Lock()
+        # Ids of the documents seen since the current anchor, by timestamp
+        seen: Dict[str, float] = {}
+        anchor = time.time()
+
+        def on_snapshot(col_snapshot, changes, read_time):
+            # Every document the cron added, not only the latest one
+            for change in changes:
+                if change.type.name != 'ADDED':
+                    continue
+                with lock:
+                    if change.document.id in seen:
+                        continue
+                    history_info = change.document.to_dict()
+                    seen[change.document.id] = history_info['timestamp']
+                func(StockItem(price=history_info['price'],
+                               price_day_low=history_info['day_low'],
+                               price_day_high=history_info['day_high'],
+                               symbol=history_info['symbol']))
+
+        def listen(from_ts: float) -> Any:
+            return (fs_db.get_fs_db().collection(u'history')
+                    .where(u'timestamp', u'>=', from_ts)
+                    .on_snapshot(on_snapshot))
+
+        def reanchor() -> None:
+            nonlocal anchor, seen
+            while not self.history_stopped.wait(self.reanchor_seconds):
+                with lock:
+                    anchor = max(seen.values(), default=anchor)
+                    seen = {doc_id: ts for doc_id, ts in seen.items() if ts >= anchor}
+                watch = listen(anchor)
+                if self.history_watch is not None:
+                    self.history_watch.unsubscribe()
+                self.history_watch = watch
+
+        self.history_stopped.clear()
+        self.history_watch = listen(anchor)
+        reanchorer = threading.Thread(target=reanchor, name='stock-history-reanchor', daemon=True)
+        reanchorer.start()
+        self.reanchorer = reanchorer
+
+    def stop(self) -> None:
+        self.history_stopped.set()
+        if self.reanchorer is not None:
+            self.reanchorer.join()
+            self.reanchorer = None
+        for watch in (self.history_watch, self.alerts_watch, self.tracking_watch):
+            if watch is not None:
+                watch.unsubscribe()
+        self.history_watch = self.alerts_watch = self.tracking_watch = None
+
+
+class SqlStockStore(StockStore):
+    """
+    Keeps stock data in indexed tables of the SQL database holding the
+    chat data.
+    """
+
+    def __init__(self, poll_seconds: float = HISTORY_POLL_SECONDS) -> None:
+        """
+        @param poll_seconds: How often watch_history looks for new entries.
+        """
+        super().__init__()
+        self.poll_seconds = poll_seconds
+        self.tracked_at = 0.0
+        self.alerts_at = 0.0
+        self.stopped = threading.Event()
+        self.watcher: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _commit(db_session) -> None:
+        try:
+            db_session.commit()
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
+
+    def add_alert(self,
+                  user_id: str,
+                  timestamp: float,
+                  channel_id: int,
+                  symbol: str,
+                  low: float,
+                  high: float,
+                  note: str) -> None:
+        with DB.get_instance().make_session() as db_session:
+            alert = StockAlert(user_id=user_id,
+                               timestamp=timestamp,
+                               channel_id=channel_id,
+                               symbol=symbol,
+                               low=low,
+                               high=high,
+                               note=note)
+            db_session.add(alert)
+            self._commit(db_session)
+            if self.alert_index is not None:
+                self.alert_index.add(self._to_alert_item(alert))
+
+    def _delete_alerts(self, alert_ids: List[str]) -> None:
+        with DB.get_instance().make_session() as db_session:
+            (db_session.query(StockAlert)
+             .filter(StockAlert.id.in_([int(alert_id) for alert_id in alert_ids]))
+             .delete(synchronize_session=False))
+            self._commit(db_session)
+
+    @staticmethod
+    def _to_alert_item(alert: StockAlert) -> AlertItem:
+        return AlertItem(timestamp=alert.timestamp,
+                         channel_id=alert.channel_id,
+                         low=alert.low,
+                         high=alert.high,
+                         symbol=alert.symbol,
+                         note=alert.note,
+                         alert_id=str(alert.id))
+
+    def get_all_alerts(self) -> List[AlertItem]:
+        with DB.get_instance().make_session() as db_session:
+            return [self._to_alert_item(alert) for alert in db_session.query(StockAlert)]
+
+    def _query_matching_alerts(self, item: StockItem) -> List[AlertItem]:
+        with DB.get_instance().make_session() as db_session:
+            alerts = (db_session.query(StockAlert)
+                      .filter(StockAlert.symbol == item.symbol)
+                      .filter(or_(StockAlert.low > item.price, StockAlert.high < item.price)))
+            return [self._to_alert_item(alert) for alert in alerts]
+
+    def find_matching_alerts(self, item: StockItem) -> List[AlertItem]:
+        # Like the tracked symbols, a watched index is reloaded at most once
+        # per poll interval to see alerts added by other processes
+        if self.alert_index is not None and time.monotonic() - self.alerts_at > self.poll_seconds:
+            self.watch_alerts()
+        return super().find_matching_alerts(item)
+
+    def watch_alerts(self) -> None:
+        super().watch_alerts()
+        self.alerts_at = time.monotonic()
+
+    def _add_track(self, symbol: str) -> None:
+        with DB.get_instance().make_session() as db_session:
+            # The unique key on symbol skips symbols tracked by another process
+            db_session.execute(insert_ignore(db_session, StockTracking.__table__), {'symbol': symbol})
+            self._commit(db_session)
+
+    def _query_tracking_symbols(self) -> List[str]:
+        with DB.get_instance().make_session() as db_session:
+            return [symbol for symbol, in db_session.query(StockTracking.symbol).order_by(StockTracking.id)]
+
+    def _tracked_symbols(self) -> TrackedSymbolRegistry:
+        # There is no change feed to listen to, the registry is reloaded
+        # at most once per poll interval to see other processes' symbols
+        if self.tracked is None or time.monotonic() - self.tracked_at > self.poll_seconds:
+            tracked = self.watch_tracking()
+            self.tracked_at = time.monotonic()
+            return tracked
+        return self.tracked
+
+    def add_entries(self, timestamp: float, items: Iterable[StockItem]) -> int:
+        rows = [{'symbol': item.symbol,
+                 'timestamp': timestamp,
+                 'price': item.price,
+                 'day_low': item.price_day_low,
+                 'day_high': item.price_day_high} for item in items]
+        if not rows:
+            return 0
+        with DB.get_instance().make_session() as db_session:
+            db_session.execute(StockHistory.__table__.insert(), rows)
+            self._commit(db_session)
+        return len(rows)
+
+    def get_history_arrays(self,
+                           symbols: List[str],
+                           from_ts: float,
+                           to_ts: float,
+                           max_points: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        width = bucket_width(from_ts, to_ts, max_points)
+        with DB.get_instance().make_session() as db_session:
+            offset = (StockHistory.timestamp - from_ts) / width
+            if db_session.bind.dialect.name == 'sqlite':
+                # SQLite has no FLOOR, offsets are never negative
+                bucket = cast(offset, Integer)
+            else:
+                bucket = func.floor(offset)
+            rows = (db_session.query(StockHistory.symbol,
+                                     func.avg(StockHistory.timestamp),
+                                     func.avg(StockHistory.price))
+                    .filter(StockHistory.symbol.in_(symbols))
+                    .filter(StockHistory.timestamp >= from_ts, StockHistory.timestamp <= to_ts)
+                    .group_by(StockHistory.symbol, bucket)
+                    .all())
+
+        out = {}
+        names = np.array([row[0] for row in rows], dtype=object)
+        series = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 2)
+        for sym in symbols:
+            sym_series = series[names == sym]
+            order = np.argsort(sym_series[:, 0], kind='stable')
+            out[sym] = (sym_series[order, 0], sym_series[order, 1])
+        return out
+
+    def _new_entries(self, after_id: int) -> List[StockHistory]:
+        with DB.get_instance().make_session() as db_session:
+            entries = (db_session.query(StockHistory)
+                       .filter(StockHistory.id > after_id)
+                       .order_by(StockHistory.id)
+                       .all())
+            db_session.expunge_all()
+            return entries
+
+    def _watch_history(self, func: QuoteCallback) -> None:
+        with DB.get_instance().make_session() as db_session:
+            last_id = db_session.query(StockHistory.id).order_by(StockHistory.id.desc()).limit(1).scalar() or 0
+
+        def poll() -> None:
+            nonlocal last_id
+            while not self.stopped.wait(self.poll_seconds):
+                try:
+                    for entry in self._new_entries(last_id):
+                        last_id = entry.id
+                        func(StockItem(price=entry.price,
+                                       price_day_low=entry.day_low,
+                                       price_day_high=entry.day_high,
+                                       symbol=entry.symbol))
+                except SQLAlchemyError as e:
+                    print(f'Polling stock history failed: {e!r}')
+
+        self.stopped.clear()
+        watcher = threading.Thread(target=poll, name='stock-history-watch', daemon=True)
+        watcher.start()
+        self.watcher = watcher
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
+
+
+STOCK_STORES = {'firestore': FirestoreStockStore, 'sql': SqlStockStore}
+
+
+def make_stock_store(backend: str) -> StockStore:
+    """
+    @param backend: 'firestore' or 'sql'
+    @return: a stock store of the named backend
+    """
+    if backend not in STOCK_STORES:
+        raise ValueError(f'Unknown stock backend {backend!r}, expected one of {sorted(STOCK_STORES)}')
+    return STOCK_STORES[backend]()
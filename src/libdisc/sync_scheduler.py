@@ -0,0 +1,141 @@
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import discord  # type: ignore
+from discord import TextChannel  # type: ignore
+from typing_extensions import Protocol
+
+from libdisc.constants import SYNC_CONCURRENCY, SYNC_MAX_RETRIES, SYNC_BACKOFF_SECONDS
+from libdisc.message_write_buffer import MessageWriteBuffer
+
+
+class ChannelHistoryStore(Protocol):
+    """
+    Stores the messages of a channel since its watermark, e.g. the
+    DiscordManager.
+    """
+
+    async def store_latest_chat_messages(self, channel: TextChannel) -> int:
+        ...
+
+
+class SyncScheduler:
+    """
+    Catches the stored messages of every channel up with what was sent
+    while the bot was offline. From then on messages are ingested live
+    through the MessageWriteBuffer.
+
+    Channels are synced from their watermark concurrently, at most
+    max_concurrency at a time. Rate limited requests are retried with
+    exponential backoff. Channels the bot can't read are skipped, and a
+    channel failing for any other reason doesn't stop the others.
+    """
+
+    def __init__(self,
+                 discord_manager: ChannelHistoryStore,
+                 channels: Callable[[], Iterable[TextChannel]],
+                 write_buffer: Optional[MessageWriteBuffer] = None,
+                 max_concurrency: int = SYNC_CONCURRENCY,
+                 max_retries: int = SYNC_MAX_RETRIES,
+                 backoff: float = SYNC_BACKOFF_SECONDS) -> None:
+        """
+        @param discord_manager: Stores the messages of a channel.
+        @param channels: Returns the channels to sync.
+        @param write_buffer: Live ingest buffer, handed the watermark of
+        every channel that was caught up.
+        @param max_concurrency: Most channels synced at once.
+        @param max_retries: Retries of a rate limited channel sync.
+        @param backoff: Seconds waited before the first retry, doubled
+        on every further retry.
+        """
+        self.discord_manager = discord_manager
+        self.channels = channels
+        self.write_buffer = write_buffer
+        self.max_concurrency = max_concurrency
+        # Created by the first sync, as before Python 3.10 a semaphore binds
+        # to the event loop current when it is created
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.syncing: Dict[int, asyncio.Task] = {}
+        self.stored = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.last_sync_seconds = 0.0
+
+    async def catch_up(self) -> Dict[int, int]:
+        """
+        Fills the gaps left while the bot was disconnected. Live writes
+        stop moving watermarks until each channel is caught up again.
+        @return: Number of new messages stored per channel id.
+        """
+        if self.write_buffer is not None:
+            self.write_buffer.reset_live()
+        return await self.sync_all()
+
+    async def sync_all(self) -> Dict[int, int]:
+        """
+        @return: Number of new messages stored per channel id.
+        """
+        start = time.monotonic()
+        channels = list(self.channels())
+        results = await asyncio.gather(*(self.sync_channel(channel) for channel in channels))
+        self.last_sync_seconds = time.monotonic() - start
+        print(f'Synced {len(channels)} channels in {self.last_sync_seconds:.1f}s, '
+              f'{sum(results)} new messages')
+        return {channel.id: stored for channel, stored in zip(channels, results)}
+
+    async def sync_channel(self, channel: TextChannel) -> int:
+        """
+        Syncs a channel, joining the sync already running for it if any.
+        @return: Number of new messages stored.
+        """
+        task = self.syncing.get(channel.id)
+        if task is None:
+            task = asyncio.ensure_future(self._sync_channel(channel))
+            self.syncing[channel.id] = task
+            task.add_done_callback(lambda _: self.syncing.pop(channel.id, None))
+        return await asyncio.shield(task)
+
+    async def _sync_channel(self, channel: TextChannel) -> int:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    stored = await self.discord_manager.store_latest_chat_messages(channel=channel)
+                    self.stored += stored
+                    if self.write_buffer is not None:
+                        self.write_buffer.mark_live(channel.id)
+                    return stored
+                except discord.Forbidden:
+                    print(f'{channel}: no permission to read history, skipping')
+                    return 0
+                except discord.HTTPException as e:
+                    if e.status != 429 or attempt == self.max_retries:
+                        print(f'{channel}: sync failed: {e!r}')
+                        self.failed += 1
+                        return 0
+                    # Whatever was stored is kept, the retry resumes from the watermark
+                    self.rate_limited += 1
+                    delay = self.backoff * 2 ** attempt
+                    print(f'{channel}: rate limited, retrying in {delay:.0f}s')
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    # An Exception before Python 3.8
+                    raise
+                except Exception as e:
+                    print(f'{channel}: sync failed: {e!r}')
+                    self.failed += 1
+                    return 0
+        return 0
+
+    def metrics(self) -> str:
+        """
+        @return: A Discord friendly summary of the scheduler's counters.
+        """
+        return ('```'
+                f'messages synced: {self.stored} rate limited: {self.rate_limited} '
+                f'failed: {self.failed} last sync: {self.last_sync_seconds:.1f}s'
+                '```')
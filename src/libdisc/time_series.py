@@ -0,0 +1,49 @@
+from typing import Tuple
+
+import numpy as np  # type: ignore
+
+from libdisc.dataclasses.discord_objects import StatItem
+from libdisc.constants import SECONDS_IN_DAY
+
+
+def bucket_width(from_ts: float, to_ts: float, max_points: int) -> float:
+    """
+    @return: Width of the buckets splitting [from_ts, to_ts] into at most
+    max_points buckets.
+    """
+    return max(to_ts - from_ts, 1) / max_points
+
+
+def downsample(timestamps: np.ndarray,
+               values: np.ndarray,
+               from_ts: float,
+               to_ts: float,
+               max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Averages samples falling into the same of max_points equal buckets of
+    [from_ts, to_ts]. Empty buckets are dropped.
+
+    @param timestamps: Sample timestamps.
+    @param values: Sample values.
+    @return: Mean timestamp and mean value of every non empty bucket,
+    ordered by time.
+    """
+    if len(timestamps) <= max_points:
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], values[order]
+
+    buckets = ((timestamps - from_ts) // bucket_width(from_ts, to_ts, max_points)).astype(np.int64)
+    buckets = np.clip(buckets, 0, max_points - 1)
+    counts = np.bincount(buckets, minlength=max_points)
+    filled = counts > 0
+    mean_ts = np.bincount(buckets, weights=timestamps, minlength=max_points)[filled] / counts[filled]
+    mean_values = np.bincount(buckets, weights=values, minlength=max_points)[filled] / counts[filled]
+    return mean_ts, mean_values
+
+
+def to_stat_item(timestamps: np.ndarray, values: np.ndarray) -> StatItem:
+    """
+    @return: A StatItem of the series with timestamps in days, as the
+    trend plots expect.
+    """
+    return StatItem(timestamps=timestamps / SECONDS_IN_DAY, values=values)
@@ -0,0 +1,52 @@
+import threading
+from typing import Dict, Iterable, List
+
+
+class TrackedSymbolRegistry:
+    """
+    In-memory set of the symbols tracked by the finance cron, kept in
+    the order they were first tracked. All operations are thread safe, so
+    a store's change listener can update it while commands read it.
+    """
+
+    def __init__(self, symbols: Iterable[str] = ()) -> None:
+        # Insertion ordered keys used as an ordered set
+        self.symbols: Dict[str, None] = {}
+        self.lock = threading.Lock()
+        self.replace(symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.symbols
+
+    def add(self, symbol: str) -> bool:
+        """
+        @return: Whether the symbol was not tracked before.
+        """
+        with self.lock:
+            if symbol in self.symbols:
+                return False
+            self.symbols[symbol] = None
+            return True
+
+    def discard(self, symbol: str) -> None:
+        with self.lock:
+            self.symbols.pop(symbol, None)
+
+    def replace(self, symbols: Iterable[str]) -> None:
+        """
+        Replaces the registry's content, keeping the first occurrence of
+        duplicated symbols.
+        """
+        fresh = dict.fromkeys(symbols)
+        with self.lock:
+            self.symbols = fresh
+
+    def to_list(self) -> List[str]:
+        """
+        @return: The tracked symbols, oldest first.
+        """
+        with self.lock:
+            return list(self.symbols)
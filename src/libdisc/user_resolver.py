@@ -0,0 +1,90 @@
+import time
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy.orm import Session
+
+from libdisc.constants import NICKNAME_REFRESH_SECONDS, USER_CACHE_SIZE
+from libdisc.dataclasses.discord_objects import DiscordUser
+from libdisc.lru_cache import LRUCache
+from libdisc.models.user import User, UserKey, user_key
+
+
+class UserResolver:
+    """
+    Maps Discord users to their database ids through a bounded cache
+    keyed by Discord's stable author id. Cache misses are resolved in
+    bulk, see User.resolve_many.
+
+    Nicknames change far more often than anything else about a user and
+    differ between guilds, so they are refreshed lazily: a changed
+    nickname is written with the next resolution, at most once per
+    refresh_seconds per user.
+    """
+
+    def __init__(self,
+                 capacity: int = USER_CACHE_SIZE,
+                 refresh_seconds: float = NICKNAME_REFRESH_SECONDS) -> None:
+        """
+        @param capacity: Number of users kept in memory.
+        @param refresh_seconds: Least seconds between two nickname
+        updates of a user.
+        """
+        # user_key -> (user id, stored nickname, time the nickname was stored)
+        self.cache: LRUCache[Tuple[int, str, float]] = LRUCache(capacity)
+        self.refresh_seconds = refresh_seconds
+
+    def resolve(self, db_session: Session, discord_users: Iterable[DiscordUser]) -> Dict[UserKey, int]:
+        """
+        @param db_session: The current database session
+        @param discord_users: Users to fetch or create.
+        @return: The id of every user, by user_key.
+        """
+        now = time.monotonic()
+        ids: Dict[UserKey, int] = {}
+        misses: Dict[UserKey, DiscordUser] = {}
+        nicknames: Dict[int, str] = {}
+        for discord_user in discord_users:
+            key = user_key(discord_user)
+            if key in ids or key in misses:
+                continue
+            entry = self.cache.get(key)
+            if entry is None:
+                misses[key] = discord_user
+                continue
+            ids[key] = entry[0]
+            refreshed = self._refresh(discord_user, entry, now, nicknames)
+            if refreshed is not entry:
+                self.cache.put(key, refreshed)
+
+        for key, (user_id, nickname) in User.resolve_many(db_session, misses.values()).items():
+            ids[key] = user_id
+            # Stored nicknames may be stale, they are due for a refresh
+            self.cache.put(key, self._refresh(misses[key], (user_id, nickname, float('-inf')), now, nicknames))
+
+        User.update_nicknames(db_session, nicknames)
+        return ids
+
+    def resolve_one(self, db_session: Session, discord_user: DiscordUser) -> int:
+        """
+        @return: The id of the user.
+        """
+        return self.resolve(db_session, [discord_user])[user_key(discord_user)]
+
+    def _refresh(self,
+                 discord_user: DiscordUser,
+                 entry: Tuple[int, str, float],
+                 now: float,
+                 nicknames: Dict[int, str]) -> Tuple[int, str, float]:
+        """
+        Queues the user's nickname for an update if it changed and was
+        not updated recently.
+        @return: The entry to cache, entry itself if nothing changed.
+        """
+        user_id, nickname, stored_at = entry
+        if discord_user.nickname == nickname or now - stored_at < self.refresh_seconds:
+            return entry
+        nicknames[user_id] = discord_user.nickname
+        return user_id, discord_user.nickname, now
+
+    def clear(self) -> None:
+        self.cache.clear()
@@ -0,0 +1,104 @@
+import asyncio
+import random
+from typing import Dict, List
+
+from db.db import DB
+from libdisc.alert_evaluator import AlertEvaluator, AlertNotification
+from libdisc.dataclasses.discord_objects import StockItem
+from libdisc.stock_store import SqlStockStore
+
+SYMBOLS = ['MSFT', 'AAPL', 'GOOG', 'AMZN', 'TSLA']
+FAILING_CHANNEL = 13
+
+
+def _replay_day(seed: int = 7) -> List[StockItem]:
+    """
+    A trading day of minute quotes, random walks starting at 100.
+    """
+    rng = random.Random(seed)
+    prices = {symbol: 100.0 for symbol in SYMBOLS}
+    quotes = []
+    for _ in range(390):
+        for symbol in SYMBOLS:
+            prices[symbol] *= 1 + rng.gauss(0, 0.002)
+            quotes.append(StockItem(price=prices[symbol], price_day_low=0, price_day_high=0, symbol=symbol))
+    return quotes
+
+
+def _setup_store() -> SqlStockStore:
+    DB.get_instance().setup_db('sqlite://')
+    store = SqlStockStore()
+    rng = random.Random(11)
+    for i in range(200):
+        low = rng.uniform(90, 99.9)
+        store.add_alert(user_id='John1234', timestamp=0, channel_id=FAILING_CHANNEL if i % 10 == 0 else 7,
+                        symbol=rng.choice(SYMBOLS), low=low, high=rng.uniform(100.1, 110), note=str(i))
+    store.watch_alerts()
+    return store
+
+
+def test_replaying_a_day_notifies_every_triggered_alert_once() -> None:
+    store = _setup_store()
+    alerts = store.get_all_alerts()
+    quotes = _replay_day()
+    triggered = {alert.alert_id for alert in alerts
+                 if any(quote.symbol == alert.symbol and not alert.low <= quote.price <= alert.high
+                        for quote in quotes)}
+    sent: List[str] = []
+
+    async def send(notification: AlertNotification) -> None:
+        if notification.alert_item.channel_id == FAILING_CHANNEL:
+            raise ConnectionError('channel unavailable')
+        await asyncio.sleep(0)
+        sent.append(notification.alert_item.alert_id)
+
+    async def replay() -> AlertEvaluator:
+        loop = asyncio.get_running_loop()
+        evaluator = AlertEvaluator(stock_store=store, loop=loop, max_queue=len(alerts))
+        task = loop.create_task(evaluator.run(send))
+
+        def feed() -> None:
+            for quote in quotes:
+                evaluator.evaluate(quote)
+
+        await loop.run_in_executor(None, feed)
+        while evaluator.pending or evaluator.sent + evaluator.failed < evaluator.triggered:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return evaluator
+
+    evaluator = asyncio.run(replay())
+
+    by_id: Dict[str, int] = {alert.alert_id: alert.channel_id for alert in alerts}
+    expected = {alert_id for alert_id in triggered if by_id[alert_id] != FAILING_CHANNEL}
+    assert expected
+    assert sorted(sent) == sorted(expected)
+    assert evaluator.quotes == len(quotes)
+    assert evaluator.sent == len(expected)
+    assert evaluator.failed > 0
+    assert evaluator.dropped == 0
+    # Sent alerts are deleted, failed ones stay active
+    remaining = {alert.alert_id for alert in store.get_all_alerts()}
+    assert remaining == set(by_id) - expected
+    assert store.alert_index is not None and len(store.alert_index) == len(remaining)
+
+
+def test_full_queue_drops_notifications_without_deleting_alerts() -> None:
+    store = _setup_store()
+    crash = StockItem(price=1, price_day_low=0, price_day_high=0, symbol='MSFT')
+    msft_alerts = len(store.find_matching_alerts(crash))
+
+    async def evaluate() -> AlertEvaluator:
+        evaluator = AlertEvaluator(stock_store=store, loop=asyncio.get_running_loop(), max_queue=1)
+        assert evaluator.evaluate(crash) == msft_alerts
+        # Repeated quotes don't queue alerts that are already waiting
+        assert evaluator.evaluate(crash) == 0
+        await asyncio.sleep(0)
+        return evaluator
+
+    evaluator = asyncio.run(evaluate())
+
+    assert evaluator.queue.qsize() == 1
+    assert evaluator.dropped == msft_alerts - 1
+    assert evaluator.pending == {evaluator.queue.get_nowait().alert_item.alert_id}
+    assert len(store.find_matching_alerts(crash)) == msft_alerts
@@ -0,0 +1,56 @@
+import random
+import time
+
+from libdisc.alert_index import AlertIndex
+from libdisc.dataclasses.discord_objects import AlertItem, StockItem
+
+
+def _alert(alert_id: str, low: float, high: float, symbol: str = 'MSFT') -> AlertItem:
+    return AlertItem(timestamp=0, channel_id=7, low=low, high=high, symbol=symbol, note='', alert_id=alert_id)
+
+
+def _quote(price: float, symbol: str = 'MSFT') -> StockItem:
+    return StockItem(price=price, price_day_low=price, price_day_high=price, symbol=symbol)
+
+
+def test_match_finds_alerts_outside_their_range() -> None:
+    index = AlertIndex([_alert('a', 10, 20), _alert('b', 15, 30), _alert('c', 1, 100), _alert('d', 50, 60, 'AAPL')])
+
+    assert [alert.alert_id for alert in index.match(_quote(12))] == ['b']
+    assert [alert.alert_id for alert in index.match(_quote(25))] == ['a']
+    assert sorted(alert.alert_id for alert in index.match(_quote(0))) == ['a', 'b', 'c']
+    # Prices on a boundary do not trigger
+    assert index.match(_quote(15)) == []
+    assert index.match(_quote(12, 'GME')) == []
+
+
+def test_add_replaces_and_remove_drops() -> None:
+    index = AlertIndex([_alert('a', 10, 20)])
+
+    index.add(_alert('a', 30, 40))
+    assert len(index) == 1
+    assert [alert.low for alert in index.match(_quote(25))] == [30]
+
+    index.remove('a')
+    index.remove('missing')
+    assert len(index) == 0
+    assert 'a' not in index
+    assert index.match(_quote(25)) == []
+
+
+def test_match_scales_to_thousands_of_alerts() -> None:
+    symbols = [f'S{i}' for i in range(50)]
+    # Alerts are set around the current price of about 100
+    index = AlertIndex(_alert(str(i), random.uniform(80, 99), random.uniform(101, 120), random.choice(symbols))
+                       for i in range(5000))
+    quotes = [_quote(random.uniform(95, 105), random.choice(symbols)) for _ in range(5000)]
+
+    start = time.perf_counter()
+    matches = [index.match(quote) for quote in quotes]
+    elapsed = (time.perf_counter() - start) / len(quotes)
+
+    assert elapsed < 0.001
+    for quote, alerts in zip(quotes[:200], matches):
+        expected = {alert.alert_id for alert in index.by_id.values()
+                    if alert.symbol == quote.symbol and not alert.low <= quote.price <= alert.high}
+        assert {alert.alert_id for alert in alerts} == expected
@@ -1,9 +1,16 @@
-from typing import List
+import random
+from dataclasses import replace
+from typing import Any, List
+
+import pytest
+from sqlalchemy.exc import OperationalError
 
 from db.db import DB
 from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.constants import SECONDS_IN_WEEK
 from libdisc.database_manager import DatabaseManager
-from libdisc.dataclasses.discord_objects import DiscordUser
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem
+from libdisc.models.rollup import HourlyRollup, WeeklyRollup
 
 
 def _get_sample_users() -> List[DiscordUser]:
@@ -46,3 +53,101 @@ def test_db_analytics_user_char_count() -> None:
 #     filename = PlotManager().generate_trend_image(result)
 #     print(filename)
 #     assert(str(result) == output)
+
+
+BASE_TS = SECONDS_IN_WEEK * 2600
+
+
+def _seed_random_messages(database_manager: DatabaseManager, channel_id: int) -> None:
+    rng = random.Random(4)
+    users = _get_sample_users() + [DiscordUser("bodega-bot", "bot", "0000")]
+    messages = [MessageItem(discord_user=rng.choice(users),
+                            timestamp=BASE_TS + rng.randrange(SECONDS_IN_WEEK * 10),
+                            channel_id=channel_id,
+                            word_count=1,
+                            char_count=rng.randrange(1, 100))
+                for _ in range(2000)]
+    for i in range(0, len(messages), 300):
+        database_manager.add_new_messages(messages[i:i + 300])
+
+
+def _assert_rollups_match_raw_messages(channel_id: int) -> None:
+    rollup_engine = AnalyticsEngine()
+    raw_engine = AnalyticsEngine(use_rollups=False)
+    for from_ts in [0, BASE_TS + 1, BASE_TS + 3599, BASE_TS + 3600,
+                    BASE_TS + SECONDS_IN_WEEK - 1, BASE_TS + SECONDS_IN_WEEK * 3 + 7200 + 15]:
+        assert (rollup_engine.get_user_by_char_count(channel_id, from_ts)
+                == raw_engine.get_user_by_char_count(channel_id, from_ts))
+    for filter_ts in [0, BASE_TS + SECONDS_IN_WEEK, BASE_TS + SECONDS_IN_WEEK * 4 + 5000]:
+        rollup_stats = rollup_engine.get_stats_grouped_by_time(channel_id, filter_ts)
+        raw_stats = raw_engine.get_stats_grouped_by_time(channel_id, filter_ts)
+        assert rollup_stats.keys() == raw_stats.keys()
+        for name in raw_stats:
+            assert list(rollup_stats[name].timestamps) == list(raw_stats[name].timestamps)
+            assert list(rollup_stats[name].values) == list(raw_stats[name].values)
+
+
+def test_rollups_match_raw_messages() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    channel_id = 3
+    _seed_random_messages(database_manager, channel_id)
+
+    _assert_rollups_match_raw_messages(channel_id)
+
+    with DB.get_instance().make_session() as db_session:
+        db_session.query(HourlyRollup).delete()
+        db_session.query(WeeklyRollup).delete()
+        db_session.commit()
+    database_manager.rebuild_rollups()
+
+    _assert_rollups_match_raw_messages(channel_id)
+
+
+def test_query_results_are_cached_until_new_messages() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    analytics_engine = AnalyticsEngine()
+    database_manager = DatabaseManager()
+    john = _get_sample_users()[0]
+    database_manager.add_new_message(discord_user=john,
+                                     timestamp=BASE_TS,
+                                     message_channel_id=1,
+                                     message_char_count=10,
+                                     message_word_count=2)
+
+    assert analytics_engine.get_user_by_char_count(1) == {'John': 10}
+    assert analytics_engine.get_user_by_char_count(1) == {'John': 10}
+    assert (analytics_engine.result_cache.hits, analytics_engine.result_cache.misses) == (1, 1)
+
+    # An older, backfilled message still invalidates the cached result
+    database_manager.add_new_message(discord_user=john,
+                                     timestamp=BASE_TS - 100,
+                                     message_channel_id=1,
+                                     message_char_count=5,
+                                     message_word_count=1)
+
+    assert analytics_engine.get_user_by_char_count(1) == {'John': 15}
+    assert (analytics_engine.result_cache.hits, analytics_engine.result_cache.misses) == (1, 2)
+
+
+def test_failed_write_keeps_cached_results_tagged(monkeypatch: Any) -> None:
+    DB.get_instance().setup_db('sqlite://')
+    analytics_engine = AnalyticsEngine()
+    database_manager = DatabaseManager()
+    john = _get_sample_users()[0]
+    message = MessageItem(discord_user=john, timestamp=BASE_TS, channel_id=1, word_count=2, char_count=10)
+    database_manager.add_new_messages([message])
+    assert analytics_engine.get_user_by_char_count(1) == {'John': 10}
+    watermark = analytics_engine.get_channel_watermark(1)
+
+    def broken_refresh(*args: Any) -> None:
+        raise OperationalError('refresh', {}, Exception('disk full'))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(HourlyRollup, 'refresh', broken_refresh)
+        with pytest.raises(OperationalError):
+            database_manager.add_new_messages([replace(message, timestamp=BASE_TS + 1)])
+
+    # No message became visible without the rollups counting it
+    assert analytics_engine.get_channel_watermark(1) == watermark
+    assert analytics_engine.get_user_by_char_count(1) == {'John': 10}
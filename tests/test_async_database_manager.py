@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+from db.db import DB
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.async_database_manager import AsyncDatabaseManager
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem
+
+
+def test_async_database_manager_runs_off_the_event_loop() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    async_db = AsyncDatabaseManager(db_manager=database_manager, analytics_engine=AnalyticsEngine())
+    john = DiscordUser("John", "Jonny", "1234")
+    threads = set()
+
+    original = database_manager.add_new_messages
+
+    def add_new_messages(messages):
+        threads.add(threading.current_thread().name)
+        return original(messages)
+
+    database_manager.add_new_messages = add_new_messages  # type: ignore
+
+    async def run():
+        stored = await asyncio.gather(*[
+            async_db.add_new_messages([MessageItem(john, timestamp, channel_id, 1, 10)
+                                       for timestamp in range(5)])
+            for channel_id in range(3)])
+        await async_db.upsert_new_gif_entry(john, "Matrix", 100)
+        return (stored,
+                await async_db.get_user_by_char_count(1),
+                await async_db.get_last_gif_preference(john),
+                await async_db.get_last_message_timestamp(2))
+
+    try:
+        stored, char_count, gif_preference, last_timestamp = asyncio.run(run())
+    finally:
+        async_db.shutdown()
+
+    assert stored == [5, 5, 5]
+    assert char_count == {'John': 50}
+    assert gif_preference == ("Matrix", 100)
+    assert last_timestamp == 4
+    assert threading.current_thread().name not in threads
+    assert all(name.startswith('db-writer') for name in threads)
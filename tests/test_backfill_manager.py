@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime
+from typing import List
+
+import discord  # type: ignore
+
+from db.db import DB
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.backfill_manager import BackfillManager
+from libdisc.database_manager import DatabaseManager
+from libdisc.discord_manager import DiscordManager
+from libdisc.finance_manager import FinanceManager
+from libdisc.media_manager import MediaManager
+from libdisc.plot_manager import PlotManager
+
+
+class _FakeAuthor:
+    id = 1234
+    name = "John"
+    display_name = "Jonny"
+    discriminator = "1234"
+
+
+class _FakeMessage:
+    def __init__(self, timestamp: int) -> None:
+        self.id = timestamp + 1
+        self.author = _FakeAuthor()
+        self.created_at = datetime.utcfromtimestamp(timestamp)
+        self.content = "hello"
+
+
+class _FakeResponse:
+    status = 500
+    reason = 'Internal Server Error'
+
+
+class _FakeStatusMessage:
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.edits = 0
+
+    async def edit(self, content: str) -> None:
+        self.content = content
+        self.edits += 1
+
+
+class _FakeChannel:
+    def __init__(self, channel_id: int, messages: int, fail_after: int = -1, error: Exception = None) -> None:
+        self.id = channel_id
+        self.name = f'channel-{channel_id}'
+        self.created_at = datetime.utcfromtimestamp(0)
+        self.messages = [_FakeMessage(i) for i in range(messages)]
+        self.fail_after = fail_after
+        self.error = error or discord.HTTPException(_FakeResponse(), 'server error')
+        self.sent: List[_FakeStatusMessage] = []
+
+    async def history(self, limit=None, after=None, oldest_first=None):
+        for count, message in enumerate(m for m in self.messages if after is None or m.id > after.id):
+            if count == self.fail_after:
+                raise self.error
+            await asyncio.sleep(0)
+            yield message
+
+    async def send(self, content: str) -> _FakeStatusMessage:
+        self.sent.append(_FakeStatusMessage(content))
+        return self.sent[-1]
+
+
+def _make_backfill_manager() -> BackfillManager:
+    discord_manager = DiscordManager(db_manager=DatabaseManager(),
+                                     analytics_engine=AnalyticsEngine(),
+                                     media_manager=MediaManager(""),
+                                     plot_manager=PlotManager(),
+                                     finance_manager=FinanceManager())
+    return BackfillManager(discord_manager=discord_manager, max_concurrency=2, report_seconds=0.001, batch_size=10)
+
+
+def test_interrupted_backfill_resumes_from_checkpoint() -> None:
+    DB.get_instance().setup_db("sqlite://")
+    failing = _FakeChannel(1, messages=45, fail_after=25)
+    healthy = _FakeChannel(2, messages=30)
+    channels = {channel.id: channel for channel in (failing, healthy)}
+
+    backfill_manager = _make_backfill_manager()
+    assert asyncio.run(backfill_manager.backfill([failing, healthy], status_channel=healthy)) == 50
+    status = healthy.sent[0]
+    assert 'Backfill: 1/2 channels done, 50 messages' in status.content
+    assert 'failed, will resume' in status.content
+
+    # Only the failed job is resumed after a restart, from its last checkpoint
+    failing.fail_after = -1
+    backfill_manager = _make_backfill_manager()
+    assert asyncio.run(backfill_manager.resume(channels.get)) == 1
+    assert 'Backfill: 1/1 channels done, 45 messages' in healthy.sent[1].content
+    assert asyncio.run(backfill_manager.async_db.get_unfinished_backfills()) == []
+    assert backfill_manager.discord_manager.analytics_engine.get_user_by_char_count(1) == {'John': 45 * 5}
+
+
+def test_finished_backfill_starts_over() -> None:
+    DB.get_instance().setup_db("sqlite://")
+    channel = _FakeChannel(1, messages=12)
+    backfill_manager = _make_backfill_manager()
+
+    assert asyncio.run(backfill_manager.backfill([channel], status_channel=channel)) == 12
+    assert asyncio.run(backfill_manager.backfill([channel], status_channel=channel)) == 12
+    assert backfill_manager.discord_manager.db_manager.message_cache.is_loaded(1)
+    assert backfill_manager.discord_manager.analytics_engine.get_user_by_char_count(1) == {'John': 12 * 5}
+
+
+def test_unexpected_error_fails_only_its_channel() -> None:
+    DB.get_instance().setup_db("sqlite://")
+    broken = _FakeChannel(1, messages=30, fail_after=15, error=ValueError('bad row'))
+    healthy = _FakeChannel(2, messages=40)
+
+    backfill_manager = _make_backfill_manager()
+    assert asyncio.run(backfill_manager.backfill([broken, healthy], status_channel=healthy)) == 50
+    assert 'Backfill: 1/2 channels done, 50 messages' in healthy.sent[0].content
+    assert 'failed, will resume' in healthy.sent[0].content
+    assert not backfill_manager.running
+    unfinished = asyncio.run(backfill_manager.async_db.get_unfinished_backfills())
+    assert [(job.channel_id, job.messages) for job in unfinished] == [(1, 10)]
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+from typing import List
+
+from libdisc.command_executor import CommandExecutor
+
+
+def test_command_executor_rejects_when_full_and_replies_on_loop() -> None:
+    release = threading.Event()
+    replies: List[str] = []
+    reply_threads = set()
+
+    def handler(symbol: str) -> str:
+        release.wait(5)
+        return f'{symbol}: $1'
+
+    def failing_handler() -> str:
+        raise ValueError('boom')
+
+    async def reply(message: str) -> None:
+        reply_threads.add(threading.current_thread().name)
+        replies.append(message)
+
+    async def run() -> List[bool]:
+        executor = CommandExecutor(loop=asyncio.get_event_loop(), max_workers=2, max_queue=1)
+        accepted = [executor.submit(handler=handler, reply=reply, symbol=f'S{i}') for i in range(5)]
+        release.set()
+        while len(replies) < 3:
+            await asyncio.sleep(0.01)
+        assert executor.submit(handler=failing_handler, reply=reply)
+        while len(replies) < 4:
+            await asyncio.sleep(0.01)
+        assert executor.rejected == 2
+        assert executor.failed == 1
+        assert executor.handler_latency.count == 4
+        assert executor.queue_wait.count == 4
+        executor.shutdown()
+        return accepted
+
+    assert asyncio.run(run()) == [True, True, True, False, False]
+    assert sorted(replies[:3]) == ['S0: $1', 'S1: $1', 'S2: $1']
+    assert replies[3] == 'Something went wrong, try again later.'
+    assert reply_threads == {threading.main_thread().name}
@@ -0,0 +1,128 @@
+from typing import Any
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from db.db import DB
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem
+from libdisc.models.rollup import WeeklyRollup
+
+
+def test_add_new_messages_skips_duplicates() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    john = DiscordUser("John", "Jonny", "1234")
+    jane = DiscordUser("Jane", "Jenny", "4312")
+    channel_id = 7
+    messages = [MessageItem(discord_user=user,
+                            timestamp=i,
+                            channel_id=channel_id,
+                            word_count=1,
+                            char_count=10)
+                for i, user in enumerate([john, jane, john, jane])]
+
+    assert database_manager.add_new_messages(messages[:3]) == 3
+    # First three messages are already stored, only the last one is new
+    assert database_manager.add_new_messages(messages) == 1
+    assert database_manager.add_new_messages([]) == 0
+
+    result = AnalyticsEngine().get_user_by_char_count(channel_id)
+
+    assert result == {'John': 20, 'Jane': 20}
+
+
+def test_failed_rollup_refresh_rolls_messages_back(monkeypatch: Any) -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    messages = [MessageItem(discord_user=DiscordUser("John", "Jonny", "1234", 42),
+                            timestamp=i, channel_id=7, word_count=1, char_count=10) for i in range(3)]
+
+    def broken_refresh(*args: Any) -> None:
+        raise OperationalError('refresh', {}, Exception('disk full'))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(WeeklyRollup, 'refresh', broken_refresh)
+        with pytest.raises(OperationalError):
+            database_manager.add_new_messages(messages)
+
+    # Neither the messages nor the cache kept the failed chunk
+    assert database_manager.add_new_messages(messages) == 3
+    assert AnalyticsEngine().get_user_by_char_count(7) == {"John": 30}
+
+
+def test_caches_warm_lazily() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    john = DiscordUser("John", "Jonny", "1234")
+    database_manager.add_new_message(discord_user=john,
+                                     timestamp=5,
+                                     message_channel_id=1,
+                                     message_word_count=1,
+                                     message_char_count=1)
+
+    assert ("John", "1234") in database_manager.user_resolver.cache
+    assert not database_manager.message_cache.is_loaded(2)
+
+    database_manager.reset_cache()
+    database_manager.warm_channel_cache(1)
+
+    assert database_manager.message_cache.is_loaded(1)
+    assert (len(database_manager.user_resolver.cache) == 0 and len(database_manager.message_cache) == 1)
+
+
+def test_gif_state_is_written_behind() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    john = DiscordUser("John", "Jonny", "1234", 42)
+    jane = DiscordUser("Jane", "Jenny", "4312", 43)
+
+    database_manager.upsert_new_gif_entry(john, "Matrix", 100)
+    database_manager.upsert_new_gif_entry(john, "Matrix", 200)
+    database_manager.upsert_new_gif_entry(jane, "Iron Man", 300)
+    assert database_manager.get_last_gif_preference(john) == ("Matrix", 200)
+    # Nothing is written before the flush
+    assert DatabaseManager().get_last_gif_preference(john) == ("", 0)
+
+    assert database_manager.flush_gif_state() == 2
+    assert database_manager.flush_gif_state() == 0
+    database_manager.upsert_new_gif_entry(jane, "Twin Peaks", 400)
+    assert database_manager.flush_gif_state() == 1
+
+    restarted = DatabaseManager()
+    assert restarted.get_last_gif_preference(john) == ("Matrix", 200)
+    assert restarted.get_last_gif_preference(jane) == ("Twin Peaks", 400)
+
+
+def test_gif_state_finds_users_stored_without_discord_id() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    database_manager.upsert_new_gif_entry(DiscordUser("Bob", "Bobby", "3134"), "Stranger Things", 100)
+    database_manager.flush_gif_state()
+
+    restarted = DatabaseManager()
+    bob = DiscordUser("Bob", "Bobby", "3134", 44)
+    assert restarted.get_last_gif_preference(bob) == ("Stranger Things", 100)
+    restarted.upsert_new_gif_entry(bob, "Stranger Things", 200)
+    assert restarted.flush_gif_state() == 1
+    assert DatabaseManager().get_last_gif_preference(bob) == ("Stranger Things", 200)
+
+
+def test_cache_stats_count_lookups() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager()
+    john = DiscordUser("John", "Jonny", "1234", 42)
+    messages = [MessageItem(discord_user=john, timestamp=i, channel_id=1, word_count=1, char_count=1)
+                for i in range(3)]
+    database_manager.add_new_messages(messages)
+    database_manager.add_new_messages(messages)
+    database_manager.get_last_gif_preference(john)
+    database_manager.upsert_new_gif_entry(john, "Stranger Things", 100)
+    database_manager.get_last_gif_preference(john)
+
+    stats = database_manager.cache_stats()
+
+    assert (stats['user']['hits'], stats['user']['misses']) == (1, 1)
+    assert (stats['message']['hits'], stats['message']['misses']) == (3, 3)
+    assert (stats['gif']['hits'], stats['gif']['misses']) == (1, 1)
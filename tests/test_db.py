@@ -1,4 +1,7 @@
+from sqlalchemy import create_engine, inspect, text
+
 from db.db import DB
+from db.migrations import MESSAGE_UNIQUE_INDEX, TRACKING_UNIQUE_INDEX, USER_DISCORD_ID_INDEX
 
 
 def test_db_connect_success() -> None:
@@ -13,3 +16,63 @@ def test_db_connect_fail() -> None:
         raise Exception('DB instance creation should have failed')
     except Exception as error_msg:
         assert str(error_msg) == "Could not parse rfc1738 URL from string '/fake_db.db'"
+
+
+def test_migration_dedupes_messages(tmp_path) -> None:
+    db_url = f'sqlite:///{tmp_path}/legacy.db'
+    legacy_engine = create_engine(db_url)
+    with legacy_engine.begin() as connection:
+        connection.execute(text('CREATE TABLE message (id INTEGER PRIMARY KEY, timestamp BIGINT NOT NULL, '
+                                'user_id INTEGER NOT NULL, channel_id BIGINT, word_count BIGINT, '
+                                'char_count BIGINT)'))
+        for timestamp in [1, 1, 2, 2, 2, 3]:
+            connection.execute(text('INSERT INTO message (timestamp, user_id, channel_id, word_count, char_count) '
+                                    f'VALUES ({timestamp}, 1, 1, 1, 1)'))
+    legacy_engine.dispose()
+
+    DB.get_instance().setup_db(db_url)
+
+    engine = DB.get_instance().engine
+    assert engine is not None
+    with engine.connect() as connection:
+        assert [row[0] for row in connection.execute(text('SELECT id FROM message ORDER BY id'))] == [1, 3, 6]
+        assert connection.execute(text('SELECT SUM(message_count) FROM message_hourly_rollup')).scalar() == 3
+    assert MESSAGE_UNIQUE_INDEX in [index['name'] for index in inspect(engine).get_indexes('message')]
+
+
+def test_migration_dedupes_tracked_symbols(tmp_path) -> None:
+    db_url = f'sqlite:///{tmp_path}/legacy.db'
+    legacy_engine = create_engine(db_url)
+    with legacy_engine.begin() as connection:
+        connection.execute(text('CREATE TABLE stock_tracking (id INTEGER PRIMARY KEY, symbol VARCHAR(32) NOT NULL)'))
+        connection.execute(text('CREATE INDEX ix_stock_tracking_symbol ON stock_tracking (symbol)'))
+        for symbol in ['MSFT', 'AAPL', 'MSFT', 'MSFT']:
+            connection.execute(text(f"INSERT INTO stock_tracking (symbol) VALUES ('{symbol}')"))
+    legacy_engine.dispose()
+
+    DB.get_instance().setup_db(db_url)
+
+    engine = DB.get_instance().engine
+    assert engine is not None
+    with engine.connect() as connection:
+        assert [row[0] for row in connection.execute(text('SELECT id FROM stock_tracking ORDER BY id'))] == [1, 2]
+    assert [index['name'] for index in inspect(engine).get_indexes('stock_tracking')] == [TRACKING_UNIQUE_INDEX]
+
+
+def test_migration_adds_user_discord_id(tmp_path) -> None:
+    db_url = f'sqlite:///{tmp_path}/legacy.db'
+    legacy_engine = create_engine(db_url)
+    with legacy_engine.begin() as connection:
+        connection.execute(text("CREATE TABLE user (id INTEGER PRIMARY KEY, name VARCHAR(256) DEFAULT '' NOT NULL, "
+                                "nickname VARCHAR(256) DEFAULT '' NOT NULL, "
+                                "discriminator VARCHAR(256) DEFAULT '' NOT NULL, UNIQUE (name, discriminator))"))
+        connection.execute(text("INSERT INTO user (name, nickname, discriminator) VALUES ('John', 'Jonny', '1234')"))
+    legacy_engine.dispose()
+
+    DB.get_instance().setup_db(db_url)
+
+    engine = DB.get_instance().engine
+    assert engine is not None
+    with engine.connect() as connection:
+        assert list(connection.execute(text('SELECT name, discord_id FROM user'))) == [('John', None)]
+    assert USER_DISCORD_ID_INDEX in [index['name'] for index in inspect(engine).get_indexes('user')]
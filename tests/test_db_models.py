@@ -1,6 +1,14 @@
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
 from db.db import DB
 from libdisc.dataclasses.discord_objects import DiscordUser
+from libdisc.models.base_mixin import insert_ignore
+from libdisc.models.message import Message
+from libdisc.models.stock import StockAlert, StockHistory
 from libdisc.models.user import User
+from libdisc.user_resolver import UserResolver
 
 
 def test_user_get_or_create() -> None:
@@ -12,3 +20,42 @@ def test_user_get_or_create() -> None:
         assert user_id is not None
         assert user_id == User.get_or_create(db_session=db_session,
                                              discord_user=test_user)
+
+
+def test_user_get_or_create_is_keyed_by_discord_id() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    with DB.get_instance().make_session() as db_session:
+        user_id = User.get_or_create(db_session=db_session,
+                                     discord_user=DiscordUser("John", "Jonny", "1234", 42))
+        # Renamed since, the same user for the resolver
+        assert user_id == UserResolver().resolve_one(db_session, DiscordUser("Johnny", "Jonny", "1234", 42))
+
+
+def test_message_add_message_ignores_duplicates() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    with DB.get_instance().make_session() as db_session:
+        user_id = User.get_or_create(db_session=db_session,
+                                     discord_user=DiscordUser("John", "Jonny", "1234"))
+        for _ in range(3):
+            Message.add_message(db_session=db_session,
+                                user_id=user_id,
+                                channel_id=1,
+                                timestamp=100,
+                                word_count=1,
+                                char_count=5)
+        assert db_session.query(func.count(Message.id)).scalar() == 1
+
+
+def test_insert_ignore_on_mysql() -> None:
+    # Compiles only, the mock engine never connects
+    engine = create_engine('mysql://', strategy='mock', executor=lambda *args, **kwargs: None)
+    statement = insert_ignore(Session(bind=engine), Message.__table__)
+    assert str(statement.compile(bind=engine)).startswith('INSERT IGNORE INTO message ')
+
+
+def test_stock_floats_are_double_on_mysql() -> None:
+    engine = create_engine('mysql://', strategy='mock', executor=lambda *args, **kwargs: None)
+    for model in (StockHistory, StockAlert):
+        ddl = str(CreateTable(model.__table__).compile(bind=engine))
+        assert 'FLOAT(53)' in ddl
+        assert 'FLOAT,' not in ddl and 'FLOAT NOT NULL' not in ddl
@@ -1,3 +1,7 @@
+import asyncio
+from datetime import datetime
+from typing import List
+
 from db.db import DB
 from discord_analytics.analytics_engine import AnalyticsEngine
 from libdisc.database_manager import DatabaseManager
@@ -70,3 +74,69 @@ def test_gif_workflow() -> None:
     result["Read update"] = discord_manager.db_manager.get_last_gif_preference(select_person)
 
     assert (result == output)
+
+
+class _FakeAuthor:
+    def __init__(self, name: str, discriminator: str) -> None:
+        self.id = int(discriminator)
+        self.name = name
+        self.display_name = name
+        self.discriminator = discriminator
+
+
+class _FakeMessage:
+    def __init__(self, author: _FakeAuthor, timestamp: int, content: str) -> None:
+        # Snowflakes grow with time
+        self.id = timestamp + 1
+        self.author = author
+        self.created_at = datetime.utcfromtimestamp(timestamp)
+        self.content = content
+
+
+class _FakeChannel:
+    def __init__(self, channel_id: int, messages: List[_FakeMessage]) -> None:
+        self.id = channel_id
+        self.messages = messages
+
+    async def history(self, limit=None, after=None, oldest_first=None):
+        for message in self.messages:
+            if after is None or message.id > after.id:
+                yield message
+
+
+def _make_discord_manager() -> DiscordManager:
+    return DiscordManager(db_manager=DatabaseManager(),
+                          analytics_engine=AnalyticsEngine(),
+                          media_manager=MediaManager(""),
+                          plot_manager=PlotManager(),
+                          finance_manager=FinanceManager())
+
+
+def test_store_latest_chat_messages_in_batches() -> None:
+    DB.get_instance().setup_db("sqlite://")
+    discord_manager = _make_discord_manager()
+    authors = [_FakeAuthor("John", "1234"), _FakeAuthor("Jane", "4312")]
+    channel = _FakeChannel(3, [_FakeMessage(authors[i % 2], i, "hello") for i in range(25)])
+
+    stored = asyncio.run(discord_manager.store_latest_chat_messages(channel=channel, batch_size=10))
+
+    assert stored == 25
+    assert discord_manager.analytics_engine.get_user_by_char_count(channel.id) == {'John': 65, 'Jane': 60}
+    # Catching up does not scan the channel's stored messages
+    assert not discord_manager.db_manager.message_cache.is_loaded(channel.id)
+
+
+def test_store_latest_chat_messages_resumes_from_watermark() -> None:
+    DB.get_instance().setup_db("sqlite://")
+    discord_manager = _make_discord_manager()
+    author = _FakeAuthor("John", "1234")
+    channel = _FakeChannel(3, [_FakeMessage(author, i, "hi") for i in range(10)])
+
+    assert asyncio.run(discord_manager.store_latest_chat_messages(channel=channel, batch_size=4)) == 10
+    assert discord_manager.db_manager.get_sync_watermark(channel.id) == (10, 9)
+
+    channel.messages += [_FakeMessage(author, i, "hi") for i in range(10, 15)]
+    assert asyncio.run(discord_manager.store_latest_chat_messages(channel=channel, batch_size=4)) == 5
+    assert discord_manager.db_manager.get_sync_watermark(channel.id) == (15, 14)
+    assert asyncio.run(discord_manager.store_latest_chat_messages(channel=channel)) == 0
+    assert discord_manager.analytics_engine.get_user_by_char_count(channel.id) == {'John': 30}
@@ -0,0 +1,138 @@
+from typing import Any, Dict, List
+
+from bodega_finance import finance_cron
+from db import fs_db
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import StockItem
+from libdisc.finance_manager import FinanceManager, QuoteSource
+
+
+class _FakeQuoteSource(QuoteSource):
+    """
+    Quote source knowing every symbol except 'NOPE'.
+    """
+
+    def __init__(self, fail_bulk: bool = False) -> None:
+        self.fail_bulk = fail_bulk
+        self.calls: List[Any] = []
+
+    def fetch(self, symbol: str) -> StockItem:
+        self.calls.append(symbol)
+        price = -1 if symbol == 'NOPE' else 100
+        return StockItem(price=price, price_day_low=price, price_day_high=price, symbol=symbol)
+
+    def fetch_many(self, symbols: List[str]) -> Dict[str, StockItem]:
+        self.calls.append(list(symbols))
+        if self.fail_bulk:
+            raise ConnectionError('bulk download failed')
+        return {symbol: StockItem(price=100, price_day_low=99, price_day_high=101, symbol=symbol)
+                for symbol in symbols if symbol != 'NOPE'}
+
+
+class _FakeBatch:
+    def __init__(self, store: '_FakeFirestore') -> None:
+        self.store = store
+        self.writes: List[Dict[str, Any]] = []
+
+    def set(self, document: '_FakeDocument', data: Dict[str, Any]) -> None:
+        self.writes.append(data)
+
+    def commit(self) -> None:
+        self.store.round_trips += 1
+        self.store.documents[self.store.current].extend(self.writes)
+
+
+class _FakeDocument:
+    pass
+
+
+class _FakeFirestore:
+    """
+    Counts the round trips made to an in-memory Firestore.
+    """
+
+    def __init__(self, tracking: List[str]) -> None:
+        self.round_trips = 0
+        self.current = ''
+        self.documents: Dict[str, List[Dict[str, Any]]] = {'history': [],
+                                                           'tracking': [{'symbol': s} for s in tracking]}
+
+    def collection(self, name: str) -> '_FakeFirestore':
+        self.current = name
+        return self
+
+    def document(self) -> _FakeDocument:
+        return _FakeDocument()
+
+    def add(self, data: Dict[str, Any]) -> None:
+        self.round_trips += 1
+        self.documents[self.current].append(data)
+
+    def stream(self) -> List[Any]:
+        self.round_trips += 1
+        return [type('Snapshot', (), {'to_dict': lambda self, d=d: d})() for d in self.documents[self.current]]
+
+    def batch(self) -> _FakeBatch:
+        return _FakeBatch(self)
+
+    def on_snapshot(self, callback: Any) -> None:
+        # The initial snapshot delivers every document as added
+        changes = [type('Change', (), {'type': type('ChangeType', (), {'name': 'ADDED'}),
+                                       'document': document})()
+                   for document in self.stream()]
+        callback(None, changes, None)
+
+
+def _setup(monkeypatch, symbols: List[str], **kwargs) -> Any:
+    store = _FakeFirestore(symbols)
+    monkeypatch.setattr(fs_db, 'get_fs_db', lambda: store)
+    return store, FinanceManager(quote_source=_FakeQuoteSource(**kwargs)), DatabaseManager()
+
+
+def test_batch_mode_uses_constant_round_trips(monkeypatch) -> None:
+    symbols = [f'S{i}' for i in range(700)] + ['NOPE']
+    store, finance_manager, database_manager = _setup(monkeypatch, symbols)
+
+    written = finance_cron.fetch_and_store(finance_manager, database_manager, timestamp=1.0)
+
+    assert written == 700
+    assert len(store.documents['history']) == 700
+    assert finance_manager.quote_source.calls == [symbols]
+    # One tracking read and two batch commits of at most 500 writes
+    assert store.round_trips == 3
+    finance_manager.shutdown()
+
+
+def test_batch_mode_serves_cached_quotes(monkeypatch) -> None:
+    _, finance_manager, _ = _setup(monkeypatch, [])
+
+    finance_manager.get_stock_item('MSFT')
+    items, errors = finance_manager.get_stock_items_batch(['MSFT', 'AAPL', 'NOPE'])
+
+    assert errors == []
+    assert finance_manager.quote_source.calls == ['MSFT', ['AAPL', 'NOPE']]
+    assert not finance_manager.check_valid_stock(items['NOPE'])
+
+    finance_manager.get_stock_items_batch(['NOPE'])
+    assert len(finance_manager.quote_source.calls) == 2
+    finance_manager.shutdown()
+
+
+def test_batch_mode_falls_back_to_single_fetches(monkeypatch) -> None:
+    store, finance_manager, database_manager = _setup(monkeypatch, ['MSFT', 'AAPL'], fail_bulk=True)
+
+    written = finance_cron.fetch_and_store(finance_manager, database_manager, timestamp=1.0)
+
+    assert written == 2
+    assert sorted(finance_manager.quote_source.calls[1:]) == ['AAPL', 'MSFT']
+    finance_manager.shutdown()
+
+
+def test_single_mode_writes_one_entry_per_symbol(monkeypatch) -> None:
+    store, finance_manager, database_manager = _setup(monkeypatch, ['MSFT', 'AAPL', 'NOPE'])
+
+    written = finance_cron.fetch_and_store(finance_manager, database_manager, timestamp=1.0, batch=False)
+
+    assert written == 2
+    assert store.round_trips == 3
+    finance_manager.shutdown()
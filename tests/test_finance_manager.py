@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import List
+
+from libdisc.dataclasses.discord_objects import StockItem
+from libdisc.finance_manager import FinanceManager
+
+
+class _CountingFinanceManager(FinanceManager):
+    def __init__(self, delay: float = 0.0, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.fetches: List[str] = []
+
+    def _fetch_stock_item(self, symbol: str) -> StockItem:
+        self.fetches.append(symbol)
+        if symbol == 'BOOM':
+            raise ValueError('no data')
+        time.sleep(1 if symbol.startswith('SLOW') else self.delay)
+        price = -1 if symbol == 'NOPE' else 100
+        return StockItem(price=price, price_day_low=price, price_day_high=price, symbol=symbol)
+
+
+def test_quotes_are_cached_until_they_expire() -> None:
+    finance_manager = _CountingFinanceManager(quote_ttl=0.2)
+
+    assert finance_manager.get_stock_item('MSFT').price == 100
+    assert finance_manager.get_stock_item('MSFT').price == 100
+    assert finance_manager.fetches == ['MSFT']
+
+    time.sleep(0.25)
+    finance_manager.get_stock_item('MSFT')
+    assert finance_manager.fetches == ['MSFT', 'MSFT']
+
+
+def test_invalid_symbols_are_cached_negatively() -> None:
+    finance_manager = _CountingFinanceManager(quote_ttl=0, invalid_quote_ttl=60)
+
+    for _ in range(3):
+        assert not finance_manager.check_valid_stock(finance_manager.get_stock_item('NOPE'))
+    assert finance_manager.fetches == ['NOPE']
+
+
+def test_concurrent_requests_share_one_fetch() -> None:
+    finance_manager = _CountingFinanceManager(delay=0.2)
+    results: List[StockItem] = []
+    threads = [threading.Thread(target=lambda: results.append(finance_manager.get_stock_item('GOOG')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert finance_manager.fetches == ['GOOG']
+    assert len(results) == 8 and all(item.price == 100 for item in results)
+
+
+def test_concurrent_fetch_reports_errors_and_keeps_thread_count_flat() -> None:
+    thread_count = threading.active_count()
+    finance_manager = _CountingFinanceManager(quote_ttl=0, worker_threads=4, symbol_timeout=0.3)
+
+    for _ in range(200):
+        stock_dict, errors = finance_manager.get_stock_items(['A', 'B', 'BOOM', 'C'])
+        assert sorted(stock_dict) == ['A', 'B', 'C']
+        assert [str(error) for error in errors] == ["BOOM: ValueError('no data')"]
+
+    assert threading.active_count() <= thread_count + 4
+
+    stock_dict, errors = finance_manager.get_stock_items(['SLOW', 'A'])
+    assert list(stock_dict) == ['A']
+    assert [error.symbol for error in errors] == ['SLOW']
+    finance_manager.shutdown()
+
+
+def test_concurrent_fetch_waits_once_for_all_symbols() -> None:
+    finance_manager = _CountingFinanceManager(worker_threads=4, symbol_timeout=0.2)
+
+    start = time.monotonic()
+    stock_dict, errors = finance_manager.get_stock_items(['SLOW1', 'SLOW2', 'SLOW3', 'A'])
+
+    assert time.monotonic() - start < 0.5
+    assert list(stock_dict) == ['A']
+    assert [error.symbol for error in errors] == ['SLOW1', 'SLOW2', 'SLOW3']
+    finance_manager.shutdown()
+
+
+def test_quote_cache_is_bounded() -> None:
+    finance_manager = _CountingFinanceManager(quote_cache_size=2)
+
+    for symbol in ('MSFT', 'AAPL', 'GOOG'):
+        finance_manager.get_stock_item(symbol)
+    assert len(finance_manager.quotes) == 2
+
+    finance_manager.get_stock_item('MSFT')
+    assert finance_manager.fetches == ['MSFT', 'AAPL', 'GOOG', 'MSFT']
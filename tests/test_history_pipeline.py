@@ -0,0 +1,110 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from libdisc.history_pipeline import run_history_pipeline
+
+
+class _FetchError(Exception):
+    pass
+
+
+async def _history(count: int, delay: float = 0.0, fail_at: int = -1):
+    """
+    Yields the ints 0 to count - 1, sleeping delay per page of 10 the way
+    channel.history waits for every API request.
+    """
+    for i in range(count):
+        if i == fail_at:
+            raise _FetchError()
+        if delay and i % 10 == 0:
+            await asyncio.sleep(delay)
+        yield i
+
+
+def test_pages_consumed_in_order() -> None:
+    pages: List[List[int]] = []
+
+    async def consume(page: List[int]) -> None:
+        pages.append(page)
+
+    fetched = asyncio.run(run_history_pipeline(_history(25), consume, page_size=10, queue_depth=2))
+
+    assert fetched == 25
+    assert pages == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+
+
+def test_fetch_overlaps_writes() -> None:
+    async def consume(page: List[int]) -> None:
+        await asyncio.sleep(0.02)
+
+    async def timed() -> float:
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        await run_history_pipeline(_history(100, delay=0.02), consume, page_size=10, queue_depth=2)
+        return loop.time() - start
+
+    # 10 pages of 0.02s fetch and 0.02s write, 0.4s if run one after the other
+    assert asyncio.run(timed()) < 0.35
+
+
+def test_queue_bounds_prefetch() -> None:
+    fetched_ahead = []
+    consumed = 0
+    produced = 0
+
+    async def history():
+        nonlocal produced
+        for i in range(100):
+            produced += 1
+            yield i
+
+    async def consume(page: List[int]) -> None:
+        nonlocal consumed
+        await asyncio.sleep(0.005)
+        consumed += len(page)
+        fetched_ahead.append(produced - consumed)
+
+    asyncio.run(run_history_pipeline(history(), consume, page_size=10, queue_depth=2))
+
+    # The queued pages, the page being filled and the one waiting to be queued
+    assert max(fetched_ahead) <= 10 * 4
+    assert consumed == 100
+
+
+def test_fetch_error_after_queued_pages_written() -> None:
+    pages: List[List[int]] = []
+
+    async def consume(page: List[int]) -> None:
+        await asyncio.sleep(0.005)
+        pages.append(page)
+
+    with pytest.raises(_FetchError):
+        asyncio.run(run_history_pipeline(_history(100, fail_at=35), consume, page_size=10, queue_depth=4))
+
+    assert pages == [list(range(i, i + 10)) for i in range(0, 30, 10)]
+
+
+def test_write_error_stops_fetch() -> None:
+    produced = 0
+
+    async def history():
+        nonlocal produced
+        for i in range(1000):
+            produced += 1
+            await asyncio.sleep(0)
+            yield i
+
+    async def consume(page: List[int]) -> None:
+        raise RuntimeError('write failed')
+
+    async def run() -> None:
+        with pytest.raises(RuntimeError):
+            await run_history_pipeline(history(), consume, page_size=10, queue_depth=2)
+        stopped_at = produced
+        await asyncio.sleep(0.01)
+        assert produced == stopped_at
+
+    asyncio.run(run())
+    assert produced < 1000
@@ -0,0 +1,37 @@
+from libdisc.lru_cache import LRUCache, format_cache_stats
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache: LRUCache[int] = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.stats() == {'size': 2, 'capacity': 2, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_cache_drops_entries_with_stale_tag() -> None:
+    cache: LRUCache[str] = LRUCache(2)
+    cache.put('stats', 'old', tag=1)
+
+    assert cache.get('stats', tag=1) == 'old'
+    assert cache.get('stats', tag=2) is None
+    assert 'stats' not in cache
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_format_cache_stats() -> None:
+    cache: LRUCache[int] = LRUCache(4)
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+
+    assert format_cache_stats({'user': cache.stats(),
+                               'gif': {'size': 0, 'capacity': 0, 'hits': 0, 'misses': 0, 'evictions': 0}}) == (
+        '```user: size 1/4 hits 2 misses 1 evictions 0 hit rate 66.7%\n'
+        'gif: size 0/unbounded hits 0 misses 0 evictions 0 hit rate -```')
@@ -0,0 +1,58 @@
+import pytest
+
+from libdisc.message_cache import MAX_TIMESTAMP, MessageCache, pack_key
+
+
+def test_message_cache_membership() -> None:
+    cache = MessageCache()
+    cache.load_channel(10, [(1, 1600000000), (2, 1600000005)])
+    cache.load_channel(20, [(1, 1600000000)])
+
+    assert (1, 10, 1600000000) in cache
+    assert (2, 10, 1600000005) in cache
+    assert (1, 20, 1600000000) in cache
+    assert (2, 20, 1600000000) not in cache
+    assert (1, 30, 1600000000) not in cache
+    assert len(cache) == 3
+
+    cache.add((3, 10, 1600000010))
+    cache.add((3, 10, 1600000010))
+    assert (3, 10, 1600000010) in cache
+    assert len(cache) == 4
+
+    cache.clear()
+    assert (1, 10, 1600000000) not in cache
+    assert len(cache) == 0
+
+
+def test_message_cache_merges_pending_keys() -> None:
+    cache = MessageCache()
+    keys = [(user_id, 1, 1600000000 + i) for i in range(1500) for user_id in (1, 2)]
+    cache.update(keys)
+
+    assert len(cache) == len(keys)
+    assert all(key in cache for key in keys)
+    assert (3, 1, 1600000000) not in cache
+    assert not cache.is_loaded(1)
+
+
+def test_message_cache_evicts_least_recently_used_channel() -> None:
+    cache = MessageCache(max_channels=2)
+    cache.load_channel(1, [(1, 100)])
+    cache.load_channel(2, [(1, 100)])
+    cache.add((1, 1, 101))
+    cache.load_channel(3, [(1, 100)])
+
+    assert cache.is_loaded(1)
+    assert not cache.is_loaded(2)
+    assert cache.is_loaded(3)
+    assert (1, 2, 100) not in cache
+    assert (1, 3, 100) in cache
+    assert cache.stats() == {'size': 2, 'capacity': 2, 'keys': 3, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_pack_key_rejects_values_out_of_range() -> None:
+    assert pack_key(2 ** 32 - 1, MAX_TIMESTAMP) == 2 ** 63 - 1
+    for user_id, timestamp in ((2 ** 32, 1), (-1, 1), (1, MAX_TIMESTAMP + 1)):
+        with pytest.raises(ValueError):
+            pack_key(user_id, timestamp)
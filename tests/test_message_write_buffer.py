@@ -0,0 +1,133 @@
+import asyncio
+from typing import List
+
+from db.db import DB
+from discord_analytics.analytics_engine import AnalyticsEngine
+from libdisc.async_database_manager import AsyncDatabaseManager
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import DiscordUser, MessageItem
+from libdisc.message_write_buffer import MessageWriteBuffer
+
+
+def _message(channel_id: int, timestamp: int) -> MessageItem:
+    return MessageItem(discord_user=DiscordUser("John", "Jonny", "1234"),
+                       timestamp=timestamp, channel_id=channel_id, word_count=1, char_count=5)
+
+
+def _make_buffer(max_size: int = 100, flush_seconds: float = 60) -> MessageWriteBuffer:
+    DB.get_instance().setup_db("sqlite://")
+    async_db = AsyncDatabaseManager(db_manager=DatabaseManager(), analytics_engine=AnalyticsEngine())
+    return MessageWriteBuffer(async_db=async_db, max_size=max_size, flush_seconds=flush_seconds)
+
+
+def test_flushes_when_full_and_moves_only_live_watermarks() -> None:
+    buffer = _make_buffer(max_size=4)
+    buffer.mark_live(1)
+
+    async def ingest() -> None:
+        for i in range(10):
+            buffer.add(_message(1 + i % 2, i), message_id=100 + i)
+            await asyncio.sleep(0)
+        # The full buffer flushed without waiting for the timer
+        while buffer.flushes < 2:
+            await asyncio.sleep(0.01)
+        await buffer.flush()
+
+    asyncio.run(ingest())
+
+    assert buffer.stored == 10
+    assert not buffer.items
+    db_manager = DatabaseManager()
+    assert db_manager.get_sync_watermark(1) == (108, 8)
+    # Channel 2 was not caught up by the crawler yet
+    assert db_manager.get_sync_watermark(2) is None
+
+
+def test_run_flushes_on_time_and_on_cancel() -> None:
+    buffer = _make_buffer(flush_seconds=0.01)
+
+    async def ingest() -> None:
+        task = asyncio.ensure_future(buffer.run())
+        buffer.add(_message(1, 1), message_id=1)
+        await asyncio.sleep(0.05)
+        assert buffer.stored == 1
+        buffer.add(_message(1, 2), message_id=2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(ingest())
+
+    assert buffer.stored == 2
+    assert not buffer.items
+
+
+class _FailingAsyncDb:
+    async def add_new_messages(self, messages: List[MessageItem]) -> int:
+        raise ConnectionError('database unavailable')
+
+    async def advance_sync_watermark(self, message_channel_id: int, message_id: int, timestamp: int) -> None:
+        raise ConnectionError('database unavailable')
+
+
+def test_failed_flush_keeps_messages() -> None:
+    buffer = MessageWriteBuffer(async_db=_FailingAsyncDb())
+    buffer.mark_live(1)
+    buffer.add(_message(1, 1), message_id=5)
+
+    assert asyncio.run(buffer.flush()) == 0
+    assert buffer.failed == 1
+    assert len(buffer.items) == 1
+    assert buffer.newest == {1: (5, 1)}
+
+
+class _PoisonedAsyncDb:
+    def __init__(self) -> None:
+        self.stored: List[MessageItem] = []
+
+    async def add_new_messages(self, messages: List[MessageItem]) -> int:
+        if any(message.timestamp == 13 for message in messages):
+            raise ValueError('bad row')
+        self.stored.extend(messages)
+        return len(messages)
+
+    async def advance_sync_watermark(self, message_channel_id: int, message_id: int, timestamp: int) -> None:
+        pass
+
+
+def test_batch_failing_past_retries_drops_its_bad_messages() -> None:
+    async_db = _PoisonedAsyncDb()
+    buffer = MessageWriteBuffer(async_db=async_db, max_retries=2)
+    for i in range(20):
+        buffer.add(_message(1, i), message_id=i)
+
+    async def flush_until_written() -> List[int]:
+        return [await buffer.flush() for _ in range(3)]
+
+    assert asyncio.run(flush_until_written()) == [0, 0, 19]
+    assert buffer.dropped == 1
+    assert not buffer.items
+    assert sorted(message.timestamp for message in async_db.stored) == [i for i in range(20) if i != 13]
+
+
+def test_failing_database_keeps_the_batch_and_bounds_the_buffer() -> None:
+    buffer = MessageWriteBuffer(async_db=_FailingAsyncDb(), max_retries=1, max_buffered=10)
+    buffer.mark_live(1)
+    buffer.mark_live(2)
+    for i in range(5):
+        buffer.add(_message(1, i), message_id=i)
+
+    async def flush_twice() -> None:
+        for _ in range(2):
+            await buffer.flush()
+
+    asyncio.run(flush_twice())
+    # Nothing could be written, so nothing was dropped
+    assert len(buffer.items) == 5
+    assert buffer.dropped == 0
+
+    for i in range(5, 15):
+        buffer.add(_message(2, i), message_id=i)
+    assert [item.timestamp for item in buffer.items] == list(range(5, 15))
+    assert buffer.dropped == 5
+    # The crawler fetches the dropped messages of channel 1 again
+    assert buffer.live_channels == {2}
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Tuple
+
+import numpy as np  # type: ignore
+
+from libdisc.dataclasses.discord_objects import StatItem
+from libdisc.plot_manager import PlotManager
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _stats(offset: int = 0) -> dict:
+    return {'John': StatItem(timestamps=np.array([18000, 18007, 18014, 18021]),
+                             values=np.array([10 + offset, 40, 20, 30])),
+            'Jane': StatItem(timestamps=np.array([18000, 18007]), values=np.array([5, 15]))}
+
+
+def test_trend_images_are_rendered_once() -> None:
+    plot_manager = PlotManager(render_workers=1)
+    try:
+        image = plot_manager.generate_trend_image('User Trends', 'Time', 'Char count', _stats())
+        assert image.startswith(PNG_SIGNATURE)
+
+        # Same data and chart parameters come from the cache
+        assert plot_manager.generate_trend_image('User Trends', 'Time', 'Char count', _stats()) == image
+        assert plot_manager.renders == 1
+
+        async def render_async() -> Tuple[bytes, bytes, bytes]:
+            return await asyncio.gather(
+                plot_manager.generate_trend_image_async('User Trends', 'Time', 'Char count', _stats()),
+                plot_manager.generate_trend_image_async('User Trends', 'Time', 'Char count', _stats(1)),
+                plot_manager.generate_trend_image_async('Stock Trends', 'Time', 'Char count', _stats()))
+
+        cached, changed_data, changed_title = asyncio.run(render_async())
+        assert cached == image
+        assert changed_data.startswith(PNG_SIGNATURE) and changed_data != image
+        assert changed_title.startswith(PNG_SIGNATURE) and changed_title != image
+        assert plot_manager.renders == 3
+
+        assert plot_manager.generate_trend_image('User Trends', 'Time', 'Char count', None) == b''
+    finally:
+        plot_manager.shutdown()
+
+
+def test_image_key_depends_on_data_and_params() -> None:
+    key = PlotManager.image_key('User Trends', 'Time', 'Char count', _stats())
+
+    assert key == PlotManager.image_key('User Trends', 'Time', 'Char count', _stats())
+    assert key != PlotManager.image_key('User Trends', 'Time', 'Char count', _stats(1))
+    assert key != PlotManager.image_key('User Trends', 'Date', 'Char count', _stats())
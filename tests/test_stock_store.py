@@ -0,0 +1,237 @@
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+import numpy as np  # type: ignore
+import pytest
+
+from db import fs_db
+from db.db import DB
+from libdisc.alert_index import AlertIndex
+from libdisc.database_manager import DatabaseManager
+from libdisc.dataclasses.discord_objects import DiscordUser, StatItem, StockItem
+from libdisc.stock_store import FirestoreStockStore, SqlStockStore, make_stock_store
+
+
+def _item(symbol: str, price: float) -> StockItem:
+    return StockItem(price=price, price_day_low=price - 1, price_day_high=price + 1, symbol=symbol)
+
+
+def test_make_stock_store() -> None:
+    assert isinstance(make_stock_store('firestore'), FirestoreStockStore)
+    assert isinstance(make_stock_store('sql'), SqlStockStore)
+
+
+def test_sql_store_tracking_and_history() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    database_manager = DatabaseManager(stock_store=SqlStockStore())
+
+    database_manager.add_stock_track('MSFT')
+    database_manager.add_stock_track('AAPL')
+    assert database_manager.get_all_tracking_symbols() == ['MSFT', 'AAPL']
+
+    database_manager.add_stock_entry(timestamp=86400, item=_item('MSFT', 10))
+    assert database_manager.add_stock_entries(timestamp=2 * 86400, items=[_item('MSFT', 20), _item('AAPL', 5)]) == 2
+    assert database_manager.add_stock_entries(timestamp=3 * 86400, items=[]) == 0
+
+    history = database_manager.get_stock_history(['MSFT', 'AAPL', 'GME'], from_ts=2 * 86400)
+
+    assert history['MSFT'] == StatItem(np.array([2]), np.array([20]))
+    assert history['AAPL'] == StatItem(np.array([2]), np.array([5]))
+    assert len(history['GME']) == 0
+
+
+def test_sql_store_tracking_is_idempotent_and_served_from_memory() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    store = SqlStockStore(poll_seconds=60)
+    other_process = SqlStockStore(poll_seconds=0)
+
+    assert store.add_track('MSFT')
+    assert not store.add_track('MSFT')
+    assert other_process.add_track('AAPL')
+    assert not other_process.add_track('MSFT')
+    # The registry is only reloaded once per poll interval
+    assert store.get_all_tracking_symbols() == ['MSFT']
+    assert store.is_tracked('MSFT') and not store.is_tracked('AAPL')
+    store.tracked_at = 0
+    assert store.get_all_tracking_symbols() == ['MSFT', 'AAPL']
+    assert other_process.get_all_tracking_symbols() == ['MSFT', 'AAPL']
+
+
+def test_sql_store_alerts() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    store = SqlStockStore(poll_seconds=0.05)
+    database_manager = DatabaseManager(stock_store=store)
+    user = DiscordUser("John", "Jonny", "1234")
+    for low, high in ((10, 20), (15, 30), (1, 100)):
+        database_manager.add_stock_alert(discord_user=user, timestamp=0, channel_id=7,
+                                         symbol='MSFT', low=low, high=high, note='')
+
+    matches = database_manager.find_matching_alerts(_item('MSFT', 12))
+    assert [(alert.low, alert.high) for alert in matches] == [(15, 30)]
+    assert database_manager.find_matching_alerts(_item('AAPL', 12)) == []
+
+    quotes = []
+    done = threading.Event()
+
+    def on_quote(stock_item: StockItem) -> None:
+        quotes.append(stock_item)
+        if len(quotes) == 2:
+            done.set()
+
+    database_manager.init_history_watch(on_quote)
+    assert store.alert_index is not None and len(store.alert_index) == 3
+    # Alerts added while watching are indexed as well
+    database_manager.add_stock_alert(discord_user=user, timestamp=0, channel_id=7,
+                                     symbol='MSFT', low=5, high=24, note='')
+    # Every entry of a batch reaches the watcher
+    database_manager.add_stock_entries(timestamp=1, items=[_item('MSFT', 25), _item('AAPL', 1)])
+    assert done.wait(5)
+    store.stop()
+    assert [quote.symbol for quote in quotes] == ['MSFT', 'AAPL']
+
+    triggered = database_manager.find_matching_alerts(quotes[0])
+    assert sorted(alert.low for alert in triggered) == [5, 10]
+
+    # Triggered alerts are deleted from the index and the database at once
+    store.delete_alerts([alert.alert_id for alert in triggered])
+    assert store.alert_index is not None and len(store.alert_index) == 2
+    assert database_manager.find_matching_alerts(quotes[0]) == []
+    assert sorted(alert.low for alert in store.get_all_alerts()) == [1, 15]
+
+
+def test_sql_store_reloads_alerts_of_other_processes() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    store = SqlStockStore(poll_seconds=60)
+    other_process = SqlStockStore()
+    store.watch_alerts()
+
+    other_process.add_alert(user_id='1', timestamp=0, channel_id=7, symbol='MSFT', low=10, high=20, note='')
+    # The index is only reloaded once per poll interval
+    assert store.find_matching_alerts(_item('MSFT', 5)) == []
+    store.alerts_at = 0
+    assert [alert.low for alert in store.find_matching_alerts(_item('MSFT', 5))] == [10]
+
+
+def test_firestore_watch_times_out_without_snapshot(monkeypatch) -> None:
+    class _SilentWatch:
+        unsubscribed = False
+
+        def unsubscribe(self) -> None:
+            self.unsubscribed = True
+
+    watch = _SilentWatch()
+
+    class _SilentCollection:
+        def on_snapshot(self, callback: Any) -> _SilentWatch:
+            return watch
+
+    class _SilentFirestore:
+        def collection(self, name: str) -> _SilentCollection:
+            return _SilentCollection()
+
+    monkeypatch.setattr(fs_db, 'get_fs_db', lambda: _SilentFirestore())
+    store = FirestoreStockStore(load_timeout=0.01)
+
+    with pytest.raises(TimeoutError):
+        store.watch_alerts()
+    assert watch.unsubscribed and store.alert_index is None
+    with pytest.raises(TimeoutError):
+        store.get_all_tracking_symbols()
+
+
+class _HistoryFirestore:
+    """
+    History collection delivering every added document to the listeners
+    whose query it matches, the way Firestore snapshots do.
+    """
+
+    def __init__(self) -> None:
+        self.documents: List[Tuple[str, Dict[str, Any]]] = []
+        # from_ts, callback and whether the listener is active
+        self.listeners: List[List[Any]] = []
+        self.lock = threading.Lock()
+
+    def collection(self, name: str) -> '_HistoryFirestore':
+        return self
+
+    def where(self, field: str, op: str, value: float) -> '_HistoryFirestore':
+        self.from_ts = value
+        return self
+
+    def on_snapshot(self, callback: Any) -> Any:
+        with self.lock:
+            listener = [self.from_ts, callback, True]
+            self.listeners.append(listener)
+            self._deliver(listener, self.documents)
+
+        class _Watch:
+            def unsubscribe(self) -> None:
+                listener[2] = False
+        return _Watch()
+
+    def add(self, doc_id: str, timestamp: float) -> None:
+        with self.lock:
+            document = (doc_id, {'timestamp': timestamp, 'symbol': doc_id,
+                                 'price': 1.0, 'day_low': 1.0, 'day_high': 1.0})
+            self.documents.append(document)
+            for listener in self.listeners:
+                self._deliver(listener, [document])
+
+    @staticmethod
+    def _deliver(listener: List[Any], documents: List[Tuple[str, Dict[str, Any]]]) -> None:
+        from_ts, callback, active = listener
+        changes = [SimpleNamespace(type=SimpleNamespace(name='ADDED'),
+                                   document=SimpleNamespace(id=doc_id, to_dict=lambda data=data: data))
+                   for doc_id, data in documents if data['timestamp'] >= from_ts]
+        if active and changes:
+            callback(None, changes, None)
+
+
+def test_firestore_history_listener_is_reanchored(monkeypatch) -> None:
+    firestore = _HistoryFirestore()
+    monkeypatch.setattr(fs_db, 'get_fs_db', lambda: firestore)
+    store = FirestoreStockStore(reanchor_seconds=0.02)
+    store.alert_index = AlertIndex()
+    symbols: List[str] = []
+    now = time.time()
+
+    store.watch_history(lambda item: symbols.append(item.symbol))
+    firestore.add('A', now + 1)
+    firestore.add('B', now + 2)
+    deadline = time.monotonic() + 5
+    while len(firestore.listeners) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    firestore.add('C', now + 3)
+    store.stop()
+    firestore.add('D', now + 4)
+
+    # Overlapping listeners deliver each document once
+    assert symbols == ['A', 'B', 'C']
+    assert not any(active for _, _, active in firestore.listeners)
+    # Later listeners start at the newest document seen
+    assert firestore.listeners[0][0] == pytest.approx(now, abs=1)
+    anchors = [from_ts for from_ts, _, _ in firestore.listeners[1:]]
+    assert anchors[:2] == [now + 2, now + 2] and anchors == sorted(anchors)
+
+
+def test_sql_store_downsamples_history() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    store = SqlStockStore()
+    day = 86400
+    for hour in range(30 * 24):
+        store.add_entries(timestamp=hour * 3600, items=[_item('MSFT', hour), _item('AAPL', 2 * hour)])
+
+    arrays = store.get_history_arrays(['MSFT', 'AAPL'], from_ts=0, to_ts=30 * day, max_points=30)
+
+    timestamps, prices = arrays['MSFT']
+    # One point per day holding the mean of its 24 hourly samples
+    assert len(timestamps) == 30
+    assert list(timestamps[:2]) == [11.5 * 3600, 35.5 * 3600]
+    assert list(prices[:2]) == [11.5, 35.5]
+    assert list(arrays['AAPL'][1][:2]) == [23, 71]
+
+    history = store.get_stock_history(['MSFT'], from_ts=28 * day, to_ts=30 * day, max_points=1000)
+    assert len(history['MSFT'].timestamps) == 48
+    assert history['MSFT'].timestamps[0] == 28
@@ -0,0 +1,119 @@
+import asyncio
+from typing import Dict, List
+
+import discord  # type: ignore
+
+from libdisc.dataclasses.discord_objects import MessageItem
+from libdisc.message_write_buffer import MessageWriteBuffer
+from libdisc.sync_scheduler import SyncScheduler
+
+
+class _FakeResponse:
+    def __init__(self, status: int) -> None:
+        self.status = status
+        self.reason = 'Too Many Requests' if status == 429 else 'Forbidden'
+
+
+class _FakeChannel:
+    def __init__(self, channel_id: int) -> None:
+        self.id = channel_id
+
+    def __str__(self) -> str:
+        return f'channel-{self.id}'
+
+
+class _FakeDiscordManager:
+    """
+    Stores 10 messages per channel, rate limiting the first attempt of
+    every even channel and refusing channel 0.
+    """
+
+    def __init__(self) -> None:
+        self.attempts: Dict[int, int] = {}
+        self.running = 0
+        self.max_running = 0
+
+    async def store_latest_chat_messages(self, channel: _FakeChannel) -> int:
+        self.attempts[channel.id] = self.attempts.get(channel.id, 0) + 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if channel.id == 0:
+                raise discord.Forbidden(_FakeResponse(403), 'Missing Access')
+            if channel.id % 2 == 0 and self.attempts[channel.id] == 1:
+                raise discord.HTTPException(_FakeResponse(429), 'rate limited')
+            return 10
+        finally:
+            self.running -= 1
+
+
+class _NullAsyncDb:
+    """
+    Writer of a buffer nothing is added to.
+    """
+
+    async def add_new_messages(self, messages: List[MessageItem]) -> int:
+        return 0
+
+    async def advance_sync_watermark(self, message_channel_id: int, message_id: int, timestamp: int) -> None:
+        pass
+
+
+def test_sync_all_limits_concurrency_and_retries_rate_limits() -> None:
+    channels: List[_FakeChannel] = [_FakeChannel(i) for i in range(8)]
+    discord_manager = _FakeDiscordManager()
+    write_buffer = MessageWriteBuffer(async_db=_NullAsyncDb())
+    write_buffer.mark_live(99)
+
+    async def sync() -> Dict[int, int]:
+        scheduler = SyncScheduler(discord_manager=discord_manager, channels=lambda: channels,
+                                  write_buffer=write_buffer, max_concurrency=3, backoff=0.01)
+        result = await scheduler.catch_up()
+        assert scheduler.rate_limited == 3
+        assert scheduler.stored == 70
+        assert scheduler.failed == 0
+        return result
+
+    result = asyncio.run(sync())
+
+    assert result == {i: 0 if i == 0 else 10 for i in range(8)}
+    assert discord_manager.max_running == 3
+    assert discord_manager.attempts == {i: 2 if i % 2 == 0 and i else 1 for i in range(8)}
+    # Live writes take over the watermarks of the caught up channels only
+    assert write_buffer.live_channels == set(range(1, 8))
+
+
+def test_sync_channel_joins_running_sync() -> None:
+    channel = _FakeChannel(1)
+    discord_manager = _FakeDiscordManager()
+
+    async def sync() -> List[int]:
+        scheduler = SyncScheduler(discord_manager=discord_manager, channels=lambda: [channel])
+        return list(await asyncio.gather(scheduler.sync_channel(channel), scheduler.sync_channel(channel)))
+
+    assert asyncio.run(sync()) == [10, 10]
+    assert discord_manager.attempts == {1: 1}
+
+
+class _BrokenDiscordManager(_FakeDiscordManager):
+    """
+    Fails to store channel 3 with an error that is not a Discord one.
+    """
+
+    async def store_latest_chat_messages(self, channel: _FakeChannel) -> int:
+        if channel.id == 3:
+            raise RuntimeError('database unavailable')
+        return await super().store_latest_chat_messages(channel)
+
+
+def test_sync_all_survives_a_failing_channel() -> None:
+    channels = [_FakeChannel(i) for i in range(1, 6)]
+
+    async def sync() -> Dict[int, int]:
+        scheduler = SyncScheduler(discord_manager=_BrokenDiscordManager(), channels=lambda: channels, backoff=0.01)
+        result = await scheduler.sync_all()
+        assert scheduler.failed == 1
+        return result
+
+    assert asyncio.run(sync()) == {1: 10, 2: 10, 3: 0, 4: 10, 5: 10}
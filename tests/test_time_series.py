@@ -0,0 +1,75 @@
+from typing import List
+
+import numpy as np  # type: ignore
+
+from libdisc.dataclasses.discord_objects import StatItem
+from libdisc.time_series import downsample, to_stat_item
+
+
+def _series(timestamps: List[float], values: List[float]) -> StatItem:
+    return StatItem(np.array(timestamps), np.array(values))
+
+
+def test_downsample_averages_buckets() -> None:
+    timestamps = np.arange(100, dtype=np.float64)
+    values = timestamps * 2
+
+    mean_ts, mean_values = downsample(timestamps, values, from_ts=0, to_ts=100, max_points=10)
+
+    assert list(mean_ts) == [4.5 + 10 * i for i in range(10)]
+    assert list(mean_values) == [9 + 20 * i for i in range(10)]
+
+
+def test_downsample_drops_empty_buckets_and_sorts() -> None:
+    timestamps = np.array([90, 95, 5, 0, 1], dtype=np.float64)
+    values = np.array([1, 3, 5, 7, 9], dtype=np.float64)
+
+    mean_ts, mean_values = downsample(timestamps, values, from_ts=0, to_ts=100, max_points=2)
+    assert list(mean_ts) == [2, 92.5]
+    assert list(mean_values) == [7, 2]
+
+    # Short series are only sorted
+    mean_ts, mean_values = downsample(timestamps, values, from_ts=0, to_ts=100, max_points=10)
+    assert list(mean_ts) == [0, 1, 5, 90, 95]
+    assert list(mean_values) == [7, 9, 5, 1, 3]
+
+
+def test_to_stat_item_uses_days() -> None:
+    item = to_stat_item(np.array([0, 86400 * 2]), np.array([1.5, 2.5]))
+
+    assert list(item.timestamps) == [0, 2]
+    assert list(item.values) == [1.5, 2.5]
+
+
+def test_stat_item_from_rows() -> None:
+    item = StatItem.from_rows([(3, 30), (1, 10), (2, 20)])
+
+    assert item == _series([1, 2, 3], [10, 20, 30])
+    assert item.timestamps.dtype == np.float64
+    assert len(StatItem.from_rows([])) == 0
+
+
+def test_stat_item_group_rows() -> None:
+    rows = [('Jane', 14, 3), ('John', 7, 1), ('Jane', 7, 2), ('Bob', 21, 4), ('John', 21, 5)]
+
+    stats = StatItem.group_rows(rows)
+
+    # Keys in the order they first appear in time
+    assert list(stats) == ['John', 'Jane', 'Bob']
+    assert stats['John'] == _series([7, 21], [1, 5])
+    assert stats['Jane'] == _series([7, 14], [2, 3])
+    assert stats['Bob'] == _series([21], [4])
+    assert StatItem.group_rows([]) == {}
+
+
+def test_stat_item_operations() -> None:
+    item = _series([0, 1, 2, 5, 6, 12], [1, 2, 3, 4, 5, 6])
+
+    assert item.resample(3) == _series([0, 3, 6, 12], [6, 4, 5, 6])
+    assert item.resample(3, how='mean') == _series([0, 3, 6, 12], [2, 4, 5, 6])
+    assert item.resample(5, origin=-5) == _series([0, 5, 10], [6, 9, 6])
+    assert item.rolling_mean(2) == _series([1, 2, 5, 6, 12], [1.5, 2.5, 3.5, 4.5, 5.5])
+    assert len(item.rolling_mean(7)) == 0
+    assert item.cumsum() == StatItem(item.timestamps, np.array([1, 3, 6, 10, 15, 21]))
+    assert item.normalize() == StatItem(item.timestamps, np.array([0, 0.2, 0.4, 0.6, 0.8, 1]))
+    assert _series([1, 2], [3, 3]).normalize() == _series([1, 2], [0, 0])
@@ -0,0 +1,90 @@
+from typing import List
+
+from sqlalchemy import event, text
+
+from db.db import DB
+from libdisc.dataclasses.discord_objects import DiscordUser
+from libdisc.models.user import User
+from libdisc.user_resolver import UserResolver
+
+
+def _record_statements() -> List[str]:
+    statements: List[str] = []
+    event.listen(DB.get_instance().engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement.split()[0]))
+    return statements
+
+
+def test_resolve_creates_missing_users_in_bulk() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    resolver = UserResolver()
+    users = [DiscordUser(f'user{i}', f'nick{i}', f'{i:04}', 100 + i) for i in range(50)]
+    statements = _record_statements()
+
+    with DB.get_instance().make_session() as db_session:
+        ids = resolver.resolve(db_session, users + users[:10])
+        assert statements == ['SELECT', 'INSERT', 'SELECT']
+        assert len(set(ids.values())) == 50
+
+        # Cached users cost no query
+        statements.clear()
+        assert resolver.resolve(db_session, users[:10]) == {user.discord_id: ids[user.discord_id]
+                                                            for user in users[:10]}
+        assert statements == []
+
+
+def test_resolve_adopts_users_stored_without_discord_id() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    with DB.get_instance().make_session() as db_session:
+        legacy_id = User.get_or_create(db_session=db_session, discord_user=DiscordUser('John', 'Jonny', '1234'))
+
+        user_id = UserResolver().resolve_one(db_session, DiscordUser('John', 'Jonny', '1234', 42))
+
+        assert user_id == legacy_id
+        assert db_session.execute(text('SELECT discord_id FROM user')).scalar() == 42
+
+
+def test_resolve_never_matches_a_name_held_by_another_discord_id() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    with DB.get_instance().make_session() as db_session:
+        user_id = UserResolver().resolve_one(db_session, DiscordUser('John', 'Jonny', '1234', 42))
+
+        # Users of unknown id still match by name
+        assert UserResolver().resolve_one(db_session, DiscordUser('John', 'Jonny', '1234')) == user_id
+        assert UserResolver().resolve_one(db_session, DiscordUser('John', 'Jonny', '1234', 43)) != user_id
+
+
+def test_resolve_reuses_the_name_of_a_renamed_user() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    with DB.get_instance().make_session() as db_session:
+        bob_id = UserResolver().resolve_one(db_session, DiscordUser('bob', 'bob', '0', 111))
+
+        # bob renamed to alice, then someone else took the name bob
+        ids = UserResolver().resolve(db_session, [DiscordUser('bob', 'bob', '0', 222),
+                                                  DiscordUser('carol', 'carol', '0', 333)])
+
+        assert len({bob_id, ids[222], ids[333]}) == 3
+        names = dict(db_session.execute(text('SELECT discord_id, name FROM user')).fetchall())
+        assert names == {111: 'bob (111)', 222: 'bob', 333: 'carol'}
+        assert UserResolver().resolve_one(db_session, DiscordUser('alice', 'alice', '0', 111)) == bob_id
+
+
+def test_nicknames_are_refreshed_lazily() -> None:
+    DB.get_instance().setup_db('sqlite://')
+    resolver = UserResolver(refresh_seconds=3600)
+
+    def stored_nickname() -> str:
+        with DB.get_instance().make_session() as db_session:
+            return db_session.execute(text('SELECT nickname FROM user')).scalar()
+
+    with DB.get_instance().make_session() as db_session:
+        user_id = resolver.resolve_one(db_session, DiscordUser('John', 'Jonny', '1234', 42))
+        # Renamed in another guild, then renamed back: a single write
+        assert resolver.resolve_one(db_session, DiscordUser('John', 'J', '1234', 42)) == user_id
+        assert stored_nickname() == 'J'
+        resolver.resolve_one(db_session, DiscordUser('John', 'Jonny', '1234', 42))
+        assert stored_nickname() == 'J'
+
+        # A fresh cache picks the stale nickname up from the database
+        UserResolver().resolve_one(db_session, DiscordUser('John', 'Johnny', '1234', 42))
+        assert stored_nickname() == 'Johnny'